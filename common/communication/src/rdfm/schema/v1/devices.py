@@ -81,4 +81,21 @@ class AuthRegisterRequest():
     timestamp: int = field(metadata={
         "required": True,
     })
+    """ When specified, `metadata` only contains the keys that changed since
+        the given revision of the device metadata stored on the server
+    """
+    metadata_revision: Optional[int] = field(metadata={
+        "required": False,
+    }, default=None)
+    """ Keys removed since `metadata_revision`, only used with a delta. The
+        keys required in `metadata` can't be removed.
+    """
+    removed_metadata: Optional[list[str]] = field(metadata={
+        "required": False,
+        "validate": marshmallow.validate.ContainsNoneOf([
+            META_SOFT_VER,
+            META_DEVICE_TYPE,
+            META_MAC_ADDRESS
+        ])
+    }, default=None)
     Schema: ClassVar[Type[marshmallow.Schema]] = marshmallow.Schema
@@ -27,4 +27,15 @@ class UpdateCheckRequest():
             META_MAC_ADDRESS
         ])
     })
-    Schema: ClassVar[Type[marshmallow.Schema]] = marshmallow.Schema
\ No newline at end of file
+    Schema: ClassVar[Type[marshmallow.Schema]] = marshmallow.Schema
+
+
+@marshmallow_dataclass.dataclass
+class UpdateCheckBatchRequest():
+    """ Represents a request to perform update checks on behalf of
+        multiple devices at once
+    """
+    devices: list[dict] = field(metadata={
+        "validate": marshmallow.validate.Length(min=1)
+    })
+    Schema: ClassVar[Type[marshmallow.Schema]] = marshmallow.Schema
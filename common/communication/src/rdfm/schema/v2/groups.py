@@ -78,3 +78,17 @@ class AssignPriorityRequest():
         "required": True
     })
     Schema: ClassVar[Type[marshmallow.Schema]] = marshmallow.Schema
+
+
+@marshmallow_dataclass.dataclass
+class SimulateRolloutRequest():
+    """ Represents a request to simulate the update checks of all devices
+        in a group against a proposed policy and/or package assignment
+    """
+    policy: Optional[str] = field(metadata={
+        "required": False
+    }, default=None)
+    packages: Optional[list[int]] = field(metadata={
+        "required": False
+    }, default=None)
+    Schema: ClassVar[Type[marshmallow.Schema]] = marshmallow.Schema
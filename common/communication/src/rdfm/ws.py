@@ -27,6 +27,7 @@ __required_capabilities_by_method_name: dict[str, list[str]] = {
     'device_hello': [],
     'shell_attach': ['shell'],
     'alert': [],
+    'update_available': ['update_available'],
 }
 
 
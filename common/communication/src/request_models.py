@@ -30,10 +30,16 @@ class DeviceAttachToManager(Request):
     mac_addr: str
     uuid: str
 
+class UpdateAvailable(Request):
+    """sent to devices when an update may have become available to them,
+       the device should perform an update check"""
+    method: Literal['update_available'] = 'update_available'
+
 class Container(BaseModel):
     """container holds a list of models to enable parsing from json"""
     data: Union[
         Alert,
         CapabilityReport,
-        DeviceAttachToManager
+        DeviceAttachToManager,
+        UpdateAvailable
     ]
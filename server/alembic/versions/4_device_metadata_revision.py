@@ -0,0 +1,35 @@
+"""Device metadata hash and revision
+
+Revision ID: 4
+Revises: 3
+Create Date: 2024-08-12 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4'
+down_revision: Union[str, None] = '3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The hash of existing devices is unknown, it is filled in during the
+    # next check-in of each device
+    op.add_column('devices',
+    sa.Column('metadata_hash', sa.Text(), nullable=True)
+    )
+    op.add_column('devices',
+    sa.Column('metadata_revision', sa.Integer(), nullable=False, server_default='0')
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('devices') as batch_op:
+        batch_op.drop_column('metadata_revision')
+        batch_op.drop_column('metadata_hash')
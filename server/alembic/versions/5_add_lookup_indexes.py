@@ -0,0 +1,64 @@
+"""Add indexes for frequent lookups
+
+Revision ID: 5
+Revises: 4
+Create Date: 2024-08-19 11:02:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5'
+down_revision: Union[str, None] = '4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def devtype_expression(dialect: str) -> sa.TextClause:
+    # Must match the expression rendered by `models.package.json_text`
+    if dialect == 'postgresql':
+        return sa.text("(info ->> 'rdfm.hardware.devtype')")
+    return sa.text("json_extract(info, '$.\"rdfm.hardware.devtype\"')")
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    duplicates = conn.execute(sa.text(
+        "select mac_address from devices "
+        "group by mac_address having count(*) > 1"
+    )).scalars().all()
+    if len(duplicates) > 0:
+        raise RuntimeError(
+            "cannot add a unique index on the device MAC address, the "
+            "following MAC addresses are used by multiple devices: "
+            f"{', '.join(duplicates)}"
+        )
+
+    op.create_index('ix_devices_mac_address', 'devices',
+                    ['mac_address'], unique=True)
+    op.create_index('ix_devices_groups_group_id', 'devices_groups',
+                    ['group_id', 'device_id'])
+    op.create_index('ix_groups_pkgs_package_id', 'groups_pkgs',
+                    ['package_id'])
+    op.create_index('ix_logs_device_id_device_timestamp', 'logs',
+                    ['device_id', 'device_timestamp'])
+    op.create_index('ix_logs_name_device_timestamp', 'logs',
+                    ['name', 'device_timestamp'])
+    op.create_index('ix_logs_device_timestamp', 'logs',
+                    ['device_timestamp'])
+    op.create_index('ix_packages_devtype_created', 'packages',
+                    [devtype_expression(conn.dialect.name), 'created'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_packages_devtype_created', table_name='packages')
+    op.drop_index('ix_logs_device_timestamp', table_name='logs')
+    op.drop_index('ix_logs_name_device_timestamp', table_name='logs')
+    op.drop_index('ix_logs_device_id_device_timestamp', table_name='logs')
+    op.drop_index('ix_groups_pkgs_package_id', table_name='groups_pkgs')
+    op.drop_index('ix_devices_groups_group_id', table_name='devices_groups')
+    op.drop_index('ix_devices_mac_address', table_name='devices')
@@ -6,6 +6,7 @@ import api.v1.groups
 import api.v1.update
 import api.v1.auth
 import api.v1.logs
+import api.v1.metrics
 import api.v1.ws.device
 
 
@@ -17,5 +18,6 @@ def create_routes() -> Blueprint:
     api_routes.register_blueprint(api.v1.update.update_blueprint)
     api_routes.register_blueprint(api.v1.auth.auth_blueprint)
     api_routes.register_blueprint(api.v1.logs.logs_blueprint)
+    api_routes.register_blueprint(api.v1.metrics.metrics_blueprint)
     api_routes.register_blueprint(api.v1.ws.device.device_ws_blueprint)
     return api_routes
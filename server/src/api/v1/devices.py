@@ -12,17 +12,32 @@ from rdfm.schema.v1.devices import Device
 devices_blueprint: Blueprint = Blueprint("rdfm-server-devices", __name__)
 
 
-def model_to_schema(device: models.device.Device) -> Device:
-    """Convert a database model to the schema model"""
+def model_to_schema(device: models.device.Device,
+                    active_groups: Optional[dict[int, int]] = None
+                    ) -> Device:
+    """Convert a database model to the schema model
+
+    Args:
+        device: device model
+        active_groups: active groups of the devices being converted, see
+                       `DevicesDB.fetch_active_groups`. When converting
+                       many devices, this should be fetched once for all of
+                       them. If not provided, the group is fetched for the
+                       given device.
+    """
+    if active_groups is None:
+        active_groups = server.instance._devices_db.fetch_active_groups(
+            [device.id]
+        )
     return Device(
         id=device.id,
-        last_access=device.last_access,
+        last_access=server.instance.last_access.last_access(device),
         name=device.name,
         mac_address=device.mac_address,
         capabilities=json.loads(device.capabilities),
         metadata=json.loads(device.device_metadata),
         public_key=device.public_key,
-        group=server.instance._devices_db.fetch_active_group(device.id)
+        group=active_groups.get(device.id),
     )
 
 
@@ -79,8 +94,10 @@ def fetch_all():
         devices: List[
             models.device.Device
         ] = server.instance._devices_db.fetch_all()
+        active_groups = server.instance._devices_db.fetch_active_groups()
         return Device.Schema().dumps(
-            [model_to_schema(device) for device in devices], many=True
+            [model_to_schema(device, active_groups) for device in devices],
+            many=True,
         ), 200
     except Exception as e:
         traceback.print_exc()
@@ -17,6 +17,7 @@ from rdfm.schema.v1.groups import (
     AssignPolicyRequest,
 )
 from api.v1.middleware import deserialize_schema
+import update.notify
 import update.policy
 
 
@@ -25,20 +26,32 @@ groups_blueprint: Blueprint = Blueprint("rdfm-server-groups", __name__)
 GROUP_DEFAULT_PRIORITY = 25
 
 
-def model_to_schema(group: models.group.Group) -> Group:
+def model_to_schema(group: models.group.Group,
+                    devices: Optional[dict[int, List[int]]] = None,
+                    packages: Optional[dict[int, List[int]]] = None
+                    ) -> Group:
     """Convert a database group model to a schema model.
 
-    As we have to fetch the device list, this can't be done using just a simple
-    mapping between the fields.
+    As we have to fetch the device and package lists, this can't be done
+    using just a simple mapping between the fields. When converting many
+    groups, the assignments should be fetched once for all of them (see
+    `GroupsDB.fetch_device_assignments` and
+    `GroupsDB.fetch_package_assignments`) and passed in `devices` and
+    `packages`. If not provided, they are fetched for the given group.
     """
+    if devices is None:
+        devices = server.instance._groups_db.fetch_device_assignments(
+            [group.id]
+        )
+    if packages is None:
+        packages = server.instance._groups_db.fetch_package_assignments(
+            [group.id]
+        )
     return Group(
         id=group.id,
         created=group.created,
-        packages=server.instance._groups_db.fetch_assigned_packages(group.id),
-        devices=[
-            device.id
-            for device in server.instance._groups_db.fetch_assigned(group.id)
-        ],
+        packages=packages.get(group.id, []),
+        devices=devices.get(group.id, []),
         metadata=group.info,
         policy=group.policy,
     )
@@ -91,8 +104,11 @@ def fetch_all():
         groups: List[
             models.group.Group
         ] = server.instance._groups_db.fetch_all()
+        devices = server.instance._groups_db.fetch_device_assignments()
+        packages = server.instance._groups_db.fetch_package_assignments()
         return Group.Schema().dumps(
-            [model_to_schema(group) for group in groups], many=True
+            [model_to_schema(group, devices, packages) for group in groups],
+            many=True,
         )
     except Exception as e:
         traceback.print_exc()
@@ -401,6 +417,13 @@ def assign_package(identifier: int, assignment: AssignPackageRequest):
         )
         if err is not None:
             return api_error(err, 409)
+        # The change was already stored, a failed notification must not
+        # fail the request
+        try:
+            update.notify.notify_group(identifier)
+        except Exception as e:
+            traceback.print_exc()
+            print("Exception during update notification:", repr(e))
         return {}, 200
     except Exception as e:
         traceback.print_exc()
@@ -462,6 +485,13 @@ def update_policy(identifier: int, policy_request: AssignPolicyRequest):
             return api_error(f"invalid policy: {e}", 400)
 
         server.instance._groups_db.update_policy(identifier, policy)
+        # The change was already stored, a failed notification must not
+        # fail the request
+        try:
+            update.notify.notify_group(identifier)
+        except Exception as e:
+            traceback.print_exc()
+            print("Exception during update notification:", repr(e))
         return {}, 200
     except Exception as e:
         traceback.print_exc()
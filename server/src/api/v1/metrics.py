@@ -0,0 +1,97 @@
+import traceback
+from flask import Blueprint
+import server
+from api.v1.common import api_error
+from api.v1.middleware import management_read_only_api
+from auth.device import public_keys
+from auth.introspection import TokenIntrospector
+
+
+metrics_blueprint: Blueprint = Blueprint("rdfm-server-metrics", __name__)
+
+
+@metrics_blueprint.route("/api/v1/metrics")
+@management_read_only_api
+def fetch_metrics():
+    """Fetch the statistics of the server caches
+
+    The statistics are counted since the server was started. When the server
+    runs multiple worker processes, the statistics of the worker handling
+    the request are returned.
+
+    :status 200: no error
+    :status 401: user did not provide authorization data,
+                 or the authorization has expired
+
+    :>json dict device_keys: cache of parsed device public keys. Besides
+                             the common fields, contains `parse_time`, the
+                             total time spent parsing keys, and `time_saved`,
+                             an estimate of the parsing time saved by the
+                             cache (both in seconds).
+    :>json dict update_decisions: cache of update check results
+    :>json optional[dict] token_introspection: cache of management token
+                                               introspection results, null
+                                               if tokens are not introspected
+
+    Each cache is described by the following fields:
+
+    :>json integer size: count of cached entries
+    :>json integer capacity: maximum count of cached entries
+    :>json integer hits: count of lookups served from the cache
+    :>json integer misses: count of lookups not served from the cache
+    :>json integer evictions: count of entries evicted to make room for
+                              new ones
+    :>json float hit_rate: fraction of lookups served from the cache
+
+
+    **Example Request**
+
+    .. sourcecode:: http
+
+        GET /api/v1/metrics HTTP/1.1
+        Accept: application/json, text/javascript
+
+
+    **Example Response**
+
+    .. sourcecode:: http
+
+        HTTP/1.1 200 OK
+        Content-Type: application/json
+
+        {
+          "device_keys": {
+            "capacity": 4096,
+            "evictions": 0,
+            "hit_rate": 0.9,
+            "hits": 9,
+            "misses": 1,
+            "parse_time": 0.0012,
+            "size": 1,
+            "time_saved": 0.0108
+          },
+          "token_introspection": null,
+          "update_decisions": {
+            "capacity": 65536,
+            "evictions": 0,
+            "hit_rate": 0.5,
+            "hits": 1,
+            "misses": 1,
+            "size": 1
+          }
+        }
+    """
+    try:
+        validator = server.instance.token_validator
+        introspection = None
+        if isinstance(validator, TokenIntrospector):
+            introspection = validator.stats()
+        return {
+            "device_keys": public_keys.stats(),
+            "update_decisions": server.instance.update_decisions.stats(),
+            "token_introspection": introspection,
+        }, 200
+    except Exception as e:
+        traceback.print_exc()
+        print("Exception during metrics fetch:", repr(e))
+        return api_error("metrics fetching failed", 500)
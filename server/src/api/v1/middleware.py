@@ -6,10 +6,7 @@ from flask import request, current_app, Response
 from api.v1.common import api_error
 from auth.device import decode_and_verify_token
 import configuration
-import requests
 from typing import Callable, Optional
-from authlib.integrations.requests_client import OAuth2Session
-from authlib.oauth2.rfc6749.util import scope_to_list
 import server
 from simple_websocket import Server, ConnectionClosed
 from rdfm.ws import WebSocketException
@@ -95,77 +92,6 @@ def __add_scope_docs(function, text: str):
         function.__doc__ += "\n"
 
 
-def __introspect_and_validate_token(
-    conf: configuration.ServerConfig, token: str
-) -> Optional[list[str]]:
-    """Introspect and validate the given token against a configured
-        authorization server.
-
-    This calls the Token Introspection endpoint to validate the given token.
-
-    Args:
-        conf: server configuration
-        token: token string provided in the API request
-
-    Returns:
-        None, if the request to the authorization server fails
-        None, if the token is not valid (field `active` is False)
-        None, if the authorization server does not provide the scopes
-              in the introspection response, even when the token is valid
-              (theoretically an optional feature of the Token Introspection
-              extension)
-        list[str], if the token is valid. A list of token scopes is returned.
-    """
-    try:
-        # Introspect the token
-        client = OAuth2Session(
-            conf.token_introspection_client_id,
-            conf.token_introspection_client_secret,
-        )
-        resp: requests.models.Response = client.introspect_token(
-            conf.token_introspection_url, token=token
-        )
-        if resp.status_code != 200:
-            print(
-                "Error during token introspection: authorization server "
-                "responded with a non-success status.",
-                flush=True,
-            )
-            return None
-
-        introspected_token = resp.json()
-
-        active = introspected_token["active"]
-        if not active:
-            return None
-
-        # According to the spec, the authorization server is allowed
-        # to only return an `"active": True` response for valid tokens.
-        if "scope" not in introspected_token:
-            print(
-                "Error during token introspection: authorization server "
-                "response did not contain a `scope` field for valid token. ",
-                flush=True,
-            )
-            return None
-
-        scopes = scope_to_list(introspected_token["scope"])
-
-        # Keycloak specific, extracts roles from the user's
-        # access token and adds them to the list of scopes
-        if (
-            "realm_access" in introspected_token and
-            "roles" in introspected_token["realm_access"]
-        ):
-            scopes += scope_to_list(
-                introspected_token["realm_access"]["roles"],
-            )
-        return scopes
-    except Exception as e:
-        print("Exception during token introspection:", e)
-        return None
-
-
 def deserialize_schema_from_params(schema_dataclass: type,
                                    key: str = "parameters"):
     """
@@ -316,9 +242,10 @@ def device_api(f):
         if token is None:
             return api_error("invalid token was provided", 401)
 
-        # Update the last accessed timestamp for this device
+        # Update the last accessed timestamp for this device, the timestamp
+        # is buffered and written to the database in the background
         try:
-            server.instance._devices_db.update_timestamp(
+            server.instance.last_access.record(
                 token.device_id, datetime.datetime.utcnow()
             )
         except Exception as e:
@@ -388,8 +315,8 @@ def __management_api(
                 )
             token: str = auth["token"]
 
-            scopes: Optional[list[str]] = __introspect_and_validate_token(
-                conf, token
+            scopes: Optional[list[str]] = (
+                server.instance.token_validator.validate(token)
             )
             if scopes is None:
                 return api_error("unauthorized", 401)
@@ -1,19 +1,23 @@
 from typing import Optional, List
 from flask import request, Blueprint, current_app
+from werkzeug.datastructures import ETags
+from werkzeug.http import quote_etag
 import storage
 import traceback
 import models.package
 import server
 from api.v1.common import api_error
-import models.device
-import models.group
 import configuration
-from rdfm.schema.v1.updates import UpdateCheckRequest
-from rdfm.schema.v1.updates import META_MAC_ADDRESS
+from rdfm.schema.v1.updates import (
+    UpdateCheckRequest,
+    UpdateCheckBatchRequest,
+)
+from rdfm.schema.v1.updates import META_MAC_ADDRESS, META_DEVICE_TYPE
 from marshmallow import ValidationError
 from models.package import Package
+from database.updates import UpdateCheckData
+from update.cache import DecisionCache
 from update.resolver import PackageResolver
-import update.policy
 from api.v1.middleware import device_api
 from auth.device import DeviceToken
 
@@ -22,6 +26,221 @@ update_blueprint: Blueprint = Blueprint("rdfm-server-updates", __name__)
 """ Expiration time for generated package URLs, in seconds """
 LINK_EXPIRY_TIME = 3600
 
+""" Maximum count of devices in a single batched update check """
+MAX_BATCH_SIZE = 1000
+
+
+class _CheckResult:
+    """Outcome of the update check of a single device"""
+
+    """ Status code of the update check, as returned by `check_for_update` """
+    status: int
+    """ Package that should be installed next, if an update is available """
+    package: Optional[Package]
+    """ All packages on the planned upgrade path, when requested """
+    path: Optional[List[Package]]
+    """ Entity tag of the update decision, if the resolution was reached """
+    etag: Optional[str]
+    """ Error message, for failed update checks """
+    error: Optional[str]
+    """ Seconds after which the device should retry, when the download of
+        an available update was not admitted
+    """
+    retry_after: Optional[int]
+
+    def __init__(
+        self,
+        status: int,
+        package: Optional[Package] = None,
+        etag: Optional[str] = None,
+        error: Optional[str] = None,
+        path: Optional[List[Package]] = None,
+        retry_after: Optional[int] = None,
+    ) -> None:
+        self.status = status
+        self.package = package
+        self.path = path
+        self.retry_after = retry_after
+        self.etag = etag
+        self.error = error
+
+
+def _decide(
+    device_meta: dict[str, str],
+    data: Optional[UpdateCheckData],
+    not_modified: Optional[ETags] = None,
+    plan: bool = False,
+) -> _CheckResult:
+    """Picks the package that should be installed next by a device
+
+    Args:
+        device_meta: validated metadata reported by the device
+        data: update check data loaded for the device
+        not_modified: optional, entity tags sent by the device in the
+                      `If-None-Match` header
+        plan: if True, the whole upgrade path to the target version is
+              planned as well
+    """
+    if data is None:
+        return _CheckResult(
+            500, error="provided MAC address does not match any device"
+        )
+
+    # If the device is not assigned to any group, there's no updates
+    # to hand out to it. If more than one group is assigned, the loader
+    # selects the group with the lowest priority value.
+    group = data.group
+    if group is None:
+        return _CheckResult(204)
+
+    # The policy string is compiled only once after each policy change
+    try:
+        policy = server.instance.group_policies.get(group.id, group.policy)
+    except RuntimeError:
+        # Should never happen as modifying the policy to an invalid value
+        # should be prevented
+        return _CheckResult(500, error="invalid group policy")
+
+    packages: List[Package] = data.packages
+    # Device is in a group, but no packages were assigned
+    if len(packages) == 0:
+        return _CheckResult(204)
+
+    # The package-to-package part of the upgrade graph only depends on
+    # the assigned packages, fetch it from the cache instead of rebuilding
+    # it for each update check.
+    graph = server.instance.package_graphs.get(group.id, packages)
+
+    # Devices running identical software in the same group always get the
+    # same decision, memoize it instead of resolving it on every poll.
+    target_version = policy.evaluate(device_meta, graph.versions)
+    key = DecisionCache.make_key(
+        group.id, packages, graph, target_version, device_meta
+    )
+    # Responses with a planned path have a different representation
+    etag = DecisionCache.etag(key + ("plan",) if plan else key)
+    if not_modified is not None and not_modified.contains(etag):
+        return _CheckResult(304, etag=etag)
+
+    decisions: DecisionCache = server.instance.update_decisions
+    found, index = decisions.get(key)
+    if not found:
+        resolver = PackageResolver(
+            device_meta, graph.packages, policy, graph
+        )
+        index = resolver.resolve_target(target_version)
+        decisions.put(key, index)
+
+    if index is None:
+        return _CheckResult(204, etag=etag)
+
+    # Limit the count of concurrent downloads. The response of a device that
+    # was not admitted carries no tag, as it does not represent the decision.
+    retry_after = server.instance.admission.acquire(
+        device_meta[META_MAC_ADDRESS], packages[index].id,
+        packages[index].driver
+    )
+    if retry_after is not None:
+        return _CheckResult(204, retry_after=retry_after)
+
+    path = None
+    if plan:
+        # The path is fully determined by the first package, as the rest of
+        # the path is taken from the shared package graph
+        path = [
+            packages[idx] for idx in graph.path_from(
+                index, (device_meta[META_DEVICE_TYPE], target_version)
+            )
+        ]
+    return _CheckResult(200, package=packages[index], etag=etag, path=path)
+
+
+def _package_link(package: Package, conf: configuration.ServerConfig
+                  ) -> Optional[str]:
+    """Generates a download link for the package
+
+    Returns:
+        The generated link, or None if the package storage driver is invalid
+    """
+    driver = storage.driver_by_name(package.driver, conf)
+    if driver is None:
+        return None
+    return driver.generate_url(package.info, LINK_EXPIRY_TIME)
+
+
+def _package_response(package: Package, link: str) -> dict:
+    """Creates the description of a single package in update check responses
+    """
+    return {
+        "id": package.id,
+        "created": package.created,
+        "sha256": package.sha256,
+        "uri": link,
+    }
+
+
+def _update_response(
+    result: _CheckResult,
+    conf: configuration.ServerConfig,
+    links: dict[int, Optional[str]],
+) -> Optional[dict]:
+    """Creates the response body of an update check for an available update
+
+    Args:
+        result: successful update check result
+        conf: server configuration
+        links: links generated for packages so far, by package identifier.
+               This is updated with the newly generated links.
+
+    Returns:
+        None, if generating a package link failed due to an invalid driver
+        dict, the response body otherwise
+    """
+    def describe(package: Package) -> Optional[dict]:
+        if package.id not in links:
+            links[package.id] = _package_link(package, conf)
+        if links[package.id] is None:
+            return None
+        return _package_response(package, links[package.id])
+
+    body = describe(result.package)
+    if body is None:
+        return None
+    if result.path is not None:
+        body["path"] = [describe(package) for package in result.path]
+        if None in body["path"]:
+            return None
+    return body
+
+
+def _allowed_devices(device_token: DeviceToken,
+                     data: dict[str, UpdateCheckData]) -> set[str]:
+    """Finds the devices the caller may check for updates on behalf of
+
+    Besides itself, a device may check for updates on behalf of the devices
+    that share a group with it. This uses a single query.
+
+    Args:
+        device_token: token of the device making the request
+        data: update check data of the requested devices, which must also
+              contain the calling device
+
+    Returns:
+        MAC addresses of the allowed devices among the given ones
+    """
+    allowed = {device_token.device_id}
+    caller = data.get(device_token.device_id)
+    if caller is None:
+        return allowed
+    assignments = server.instance._devices_db.fetch_group_assignments([
+        check.device.id for check in data.values()
+    ])
+    groups = set(assignments.get(caller.device.id, []))
+    for mac_address, check in data.items():
+        if not groups.isdisjoint(assignments.get(check.device.id, [])):
+            allowed.add(mac_address)
+    return allowed
+
 
 @update_blueprint.route("/api/v1/update/check", methods=["POST"])
 @device_api
@@ -35,8 +254,34 @@ def check_for_update(device_token: DeviceToken):
     update package is picked from the available ones. If more than one group is
     assigned, the group with the lowest priority value takes precedence.
 
+    Responses to update checks that reached the package resolution stage
+    carry an `ETag` header. The tag identifies the update decision made for
+    the device, and changes only when the group's packages, the target version
+    selected by the group policy or the relevant device metadata change.
+    Devices can send the tag from their previous check in the `If-None-Match`
+    header, in which case the server responds with `304 Not Modified` when
+    the decision did not change. If the previously received download link has
+    expired in the meantime, the check must be repeated without the header.
+
+    When the `plan` query parameter is set, the response additionally contains
+    the whole planned upgrade path to the target version, with download links
+    for every package on the path. This allows devices that are several
+    versions behind to fetch all packages at once. Only the first package of
+    the path is verified against the device metadata; the remaining packages
+    are planned using the metadata of the preceding packages, so the device
+    must still verify each package before installing it.
+
+    When download admission control is configured on the server, the count
+    of devices concurrently downloading packages is limited. A device that
+    would exceed the limit receives `204 No Content` with a `Retry-After`
+    header, indicating after how many seconds the update check should be
+    retried.
+
     :status 200: an update is available
-    :status 204: no updates are available
+    :status 204: no updates are available, or the download was not admitted
+                 (indicated by the `Retry-After` header)
+    :status 304: the update decision is identical to the one identified by
+                 the `If-None-Match` header
     :status 400: device metadata is missing device type, software version,
                  and/or MAC address
     :status 401: device did not provide authorization data,
@@ -46,11 +291,22 @@ def check_for_update(device_token: DeviceToken):
     :<jsonarr string rdfm.hardware.devtype: required: device type
     :<jsonarr string rdfm.hardware.macaddr: required: MAC address (used as ID)
     :<jsonarr string `...`: other device metadata
+    :<header If-None-Match: optional, `ETag` of a previous update check response
+    :>header ETag: identifier of the update decision
+    :>header Retry-After: seconds after which the update check should be
+                          retried, when the download was not admitted
+    :query plan: optional, set to `true` to receive the whole upgrade path
 
     :>json integer id: package identifier
     :>json string created: UTC creation date (RFC822)
     :>json string sha256: sha256 of the uploaded package
     :>json string uri: generated URI for downloading the package
+    :>json array[object] path: only when `plan` is set: all packages that
+                               should be installed to reach the target
+                               version, in installation order, starting with
+                               the package described above. Each package is
+                               described using the `id`, `created`, `sha256`
+                               and `uri` fields.
 
 
     **Example Request**
@@ -73,12 +329,14 @@ def check_for_update(device_token: DeviceToken):
     .. sourcecode:: http
 
         HTTP/1.1 204 No Content
+        ETag: "0b8e3a7d2c1f4e5a9b6c7d8e9f0a1b2c"
 
 
     .. sourcecode:: http
 
         HTTP/1.1 200 OK
         Content-Type: application/json
+        ETag: "5d41402abc4b2a76b9719d911017c592"
 
         {
           "created": "Mon, 14 Aug 2023 13:03:27 GMT",
@@ -86,6 +344,34 @@ def check_for_update(device_token: DeviceToken):
           "sha256": "4e415854e6d0cf9855b2290c02638e8651537989b8862ff9c9cb91b8d956ea06",
           "uri": "http://127.0.0.1:5000/local_storage/12a83ff3-2de2-4a95-8f3f-c7a884e426e5"
         }
+
+
+    .. sourcecode:: http
+
+        HTTP/1.1 200 OK
+        Content-Type: application/json
+        ETag: "7e2b5f0c3a9d41e8b6c2d7f1a0e9b3c4"
+
+        {
+          "created": "Mon, 14 Aug 2023 13:03:27 GMT",
+          "id": 1,
+          "sha256": "4e415854e6d0cf9855b2290c02638e8651537989b8862ff9c9cb91b8d956ea06",
+          "uri": "http://127.0.0.1:5000/local_storage/12a83ff3-2de2-4a95-8f3f-c7a884e426e5",
+          "path": [
+            {
+              "created": "Mon, 14 Aug 2023 13:03:27 GMT",
+              "id": 1,
+              "sha256": "4e415854e6d0cf9855b2290c02638e8651537989b8862ff9c9cb91b8d956ea06",
+              "uri": "http://127.0.0.1:5000/local_storage/12a83ff3-2de2-4a95-8f3f-c7a884e426e5"
+            },
+            {
+              "created": "Mon, 14 Aug 2023 13:05:12 GMT",
+              "id": 2,
+              "sha256": "a3f1c0e5b1d0b7e9e1f5c2d4a6b8c0e2f4a6b8c0d2e4f6a8b0c2d4e6f8a0b2c4",
+              "uri": "http://127.0.0.1:5000/local_storage/8d0b7c1e-3f4a-4b5c-9d6e-7f8a9b0c1d2e"
+            }
+          ]
+        }
     """     # noqa: E501
     try:
         try:
@@ -103,74 +389,214 @@ def check_for_update(device_token: DeviceToken):
         print("Device metadata:", device_meta)
         hwmac = device_meta[META_MAC_ADDRESS]
 
-        device: Optional[
-            models.device.Device
-        ] = server.instance._devices_db.get_device_data(hwmac)
-        if device is None:
+        # Load the device, its active group and the assigned packages at once
+        data: Optional[
+            UpdateCheckData
+        ] = server.instance._updates_db.fetch_check_data(hwmac)
+        if data is None:
             return api_error(
                 "provided MAC address does not match any device", 500
             )
 
-        # Select the active group
-        group_id = server.instance._devices_db.fetch_active_group(device.id)
-
-        # If the device is not assigned to any group, there's no updates
-        # to hand out to it
-        if group_id is None:
-            return {}, 204
-
-        group: Optional[
-                models.group.Group
-        ] = server.instance._groups_db.fetch_one(group_id)
-        if group is None:
-            # Because of DB constraints, this should never happen
-            return api_error("device-assigned group does not exist", 500)
-
-        policy = update.policy.create(group.policy)
-        if policy is None:
-            # Should never happen as modifying the policy to an invalid value
-            # should be prevented
-            return api_error("invalid group policy", 500)
-
-        packages: List[
-            Package
-        ] = server.instance._groups_db.fetch_assigned_data(group.id)
-        # Device is in a group, but no packages were assigned
-        if len(packages) == 0:
-            return {}, 204
-
-        # Collect just the package metadata for the package resolver.
-        # Make sure the order of the metadata matches the order of packages
-        # in the list above.
-        # Note: watch out, package.metadata is an SQLAlchemy field, our meta is
-        # stored in `package.info`
-        package_meta = [pkg.info for pkg in packages]
-        resolver = PackageResolver(device_meta, package_meta, policy)
-        index = resolver.resolve()
-        if index is None:
+        plan = request.args.get("plan", "false").lower() in ["true", "1"]
+        result = _decide(device_meta, data, request.if_none_match, plan)
+        headers = {}
+        if result.etag is not None:
+            headers["ETag"] = quote_etag(result.etag)
+        if result.error is not None:
+            return api_error(result.error, result.status)
+        if result.status == 304:
+            return "", 304, headers
+        if result.retry_after is not None:
+            # An update is available, but the download was not admitted yet
+            return {}, 204, {"Retry-After": str(result.retry_after)}
+        if result.package is None:
             # No updates are available
-            return {}, 204
+            return {}, 204, headers
 
         # A candidate package was found
-        package = packages[index]
-        print("Found matching next package:", package.info)
+        print("Found matching next package:", result.package.info)
 
-        print("Found new matching package:", package)
         conf: configuration.ServerConfig = current_app.config["RDFM_CONFIG"]
-        driver = storage.driver_by_name(package.driver, conf)
-        if driver is None:
+        body = _update_response(result, conf, {})
+        if body is None:
             return api_error("invalid storage driver", 500)
+        print("Link:", body["uri"])
 
-        link = driver.generate_url(package.info, LINK_EXPIRY_TIME)
-        print("Link:", link)
-
-        return {
-            "id": package.id,
-            "created": package.created,
-            "sha256": package.sha256,
-            "uri": link,
-        }, 200
+        return body, 200, headers
     except Exception as e:
         traceback.print_exc()
         print("Exception during update check:", repr(e))
         return api_error("update check failed", 500)
+
+
+@update_blueprint.route("/api/v1/update/check/batch", methods=["POST"])
+@device_api
+def check_for_update_batch(device_token: DeviceToken):
+    """Check for available updates on behalf of multiple devices
+
+    This is a batched variant of the regular update check, intended for
+    gateways polling the server on behalf of the devices attached to them.
+    The metadata of each device must contain the same pairs as in a regular
+    update check. The devices are resolved together, so that devices sharing
+    a group also share the group, package and upgrade graph loads.
+
+    The response contains one result for each device, in the order the
+    devices were given in the request. Each result contains the status code,
+    body and `ETag` value that a regular update check of the device would
+    return. Failing update checks of single devices do not fail the entire
+    request.
+
+    Besides itself, the calling device may only check for updates on behalf
+    of the devices that are assigned to at least one of its groups. Results
+    of other devices, including devices that do not exist, have the status
+    code 403. The `plan` query parameter is supported as well, and has the same
+    effect on the response bodies as in a regular update check.
+
+    :status 200: the update checks were performed
+    :status 400: the request is malformed or too many devices were given
+    :status 401: device did not provide authorization data,
+                 or the authorization has expired
+
+    :<json array[object] devices: metadata of each device, as sent in a
+                                  regular update check
+
+    :>jsonarr integer status: status code of the device's update check
+    :>jsonarr object body: response body of the device's update check; null
+                           when no updates are available
+    :>jsonarr string etag: optional, `ETag` of the device's update decision
+    :>jsonarr integer retry_after: optional, `Retry-After` value of the
+                                   device's update check
+
+
+    **Example Request**
+
+    .. sourcecode:: http
+
+        POST /api/v1/update/check/batch HTTP/1.1
+        Accept: application/json, text/javascript
+        Content-Type: application/json
+
+        {
+            "devices": [
+                {
+                    "rdfm.software.version": "v0.0.1",
+                    "rdfm.hardware.macaddr": "00:11:22:33:44:55",
+                    "rdfm.hardware.devtype": "example"
+                },
+                {
+                    "rdfm.software.version": "v0.0.2",
+                    "rdfm.hardware.macaddr": "00:11:22:33:44:56",
+                    "rdfm.hardware.devtype": "example"
+                }
+            ]
+        }
+
+
+    **Example Response**
+
+    .. sourcecode:: http
+
+        HTTP/1.1 200 OK
+        Content-Type: application/json
+
+        [
+            {
+                "status": 200,
+                "etag": "5d41402abc4b2a76b9719d911017c592",
+                "body": {
+                    "created": "Mon, 14 Aug 2023 13:03:27 GMT",
+                    "id": 1,
+                    "sha256": "4e415854e6d0cf9855b2290c02638e8651537989b8862ff9c9cb91b8d956ea06",
+                    "uri": "http://127.0.0.1:5000/local_storage/12a83ff3-2de2-4a95-8f3f-c7a884e426e5"
+                }
+            },
+            {
+                "status": 204,
+                "etag": "0b8e3a7d2c1f4e5a9b6c7d8e9f0a1b2c",
+                "body": null
+            }
+        ]
+    """     # noqa: E501
+    try:
+        try:
+            batch: (
+                UpdateCheckBatchRequest
+            ) = UpdateCheckBatchRequest.Schema().load(request.json)
+        except ValidationError as e:
+            return api_error(f"schema validation failed: {e.messages}", 400)
+        if len(batch.devices) > MAX_BATCH_SIZE:
+            return api_error(
+                f"too many devices, at most {MAX_BATCH_SIZE} can be checked "
+                "in a single request", 400
+            )
+
+        # Validate each device separately, so that a single malformed entry
+        # does not fail the update checks of all other devices
+        checks: List[Optional[dict[str, str]]] = []
+        for metadata in batch.devices:
+            try:
+                checks.append(UpdateCheckRequest.Schema().load(
+                    {"metadata": metadata}
+                ).metadata)
+            except ValidationError:
+                checks.append(None)
+
+        # Load all devices, groups and packages at once, including the
+        # calling device to find the devices it may act on behalf of
+        data = server.instance._updates_db.fetch_check_data_bulk([
+            device_meta[META_MAC_ADDRESS]
+            for device_meta in checks if device_meta is not None
+        ] + [device_token.device_id])
+        allowed = _allowed_devices(device_token, data)
+
+        plan = request.args.get("plan", "false").lower() in ["true", "1"]
+        conf: configuration.ServerConfig = current_app.config["RDFM_CONFIG"]
+        # Devices in the same group often get the same package, generate
+        # its link only once
+        links: dict[int, Optional[str]] = {}
+        results = []
+        for device_meta in checks:
+            if device_meta is None:
+                results.append({
+                    "status": 400,
+                    "body": {
+                        "error": "schema validation failed: device metadata "
+                                 "must contain the software version, device "
+                                 "type and MAC address",
+                    },
+                })
+                continue
+            if device_meta[META_MAC_ADDRESS] not in allowed:
+                results.append({
+                    "status": 403,
+                    "body": {
+                        "error": "the device is not allowed to check for "
+                                 "updates on behalf of the given device",
+                    },
+                })
+                continue
+
+            result = _decide(
+                device_meta, data.get(device_meta[META_MAC_ADDRESS]),
+                plan=plan,
+            )
+            entry = {"status": result.status, "body": None}
+            if result.etag is not None:
+                entry["etag"] = result.etag
+            if result.retry_after is not None:
+                entry["retry_after"] = result.retry_after
+            if result.error is not None:
+                entry["body"] = {"error": result.error}
+            elif result.package is not None:
+                entry["body"] = _update_response(result, conf, links)
+                if entry["body"] is None:
+                    entry["status"] = 500
+                    entry["body"] = {"error": "invalid storage driver"}
+            results.append(entry)
+
+        return results, 200
+    except Exception as e:
+        traceback.print_exc()
+        print("Exception during batched update check:", repr(e))
+        return api_error("batched update check failed", 500)
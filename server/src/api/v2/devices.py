@@ -12,17 +12,31 @@ from rdfm.schema.v2.devices import Device
 devices_blueprint: Blueprint = Blueprint("rdfm-server-devices", __name__)
 
 
-def model_to_schema(device: models.device.Device) -> Device:
-    """Convert a database model to the schema model"""
+def model_to_schema(device: models.device.Device,
+                    groups: Optional[dict[int, List[int]]] = None
+                    ) -> Device:
+    """Convert a database model to the schema model
+
+    Args:
+        device: device model
+        groups: group assignments of the devices being converted, see
+                `DevicesDB.fetch_group_assignments`. When converting many
+                devices, this should be fetched once for all of them. If not
+                provided, the groups are fetched for the given device.
+    """
+    if groups is None:
+        groups = server.instance._devices_db.fetch_group_assignments(
+            [device.id]
+        )
     return Device(
         id=device.id,
-        last_access=device.last_access,
+        last_access=server.instance.last_access.last_access(device),
         name=device.name,
         mac_address=device.mac_address,
         capabilities=json.loads(device.capabilities),
         metadata=json.loads(device.device_metadata),
         public_key=device.public_key,
-        groups=server.instance._devices_db.fetch_groups(device.id)
+        groups=groups.get(device.id, []),
     )
 
 
@@ -79,8 +93,10 @@ def fetch_all():
         devices: List[
             models.device.Device
         ] = server.instance._devices_db.fetch_all()
+        groups = server.instance._devices_db.fetch_group_assignments()
         return Device.Schema().dumps(
-            [model_to_schema(device) for device in devices], many=True
+            [model_to_schema(device, groups) for device in devices],
+            many=True,
         ), 200
     except Exception as e:
         traceback.print_exc()
@@ -1,4 +1,5 @@
 import datetime
+import json
 import traceback
 from typing import List, Optional
 from api.v1.middleware import (
@@ -16,9 +17,13 @@ from rdfm.schema.v2.groups import (
     AssignPackageRequest,
     AssignPolicyRequest,
     AssignPriorityRequest,
+    SimulateRolloutRequest,
 )
 from api.v1.middleware import deserialize_schema
+import update.notify
 import update.policy
+import update.simulation
+from update.resolver import PackageGraph
 
 
 groups_blueprint: Blueprint = Blueprint("rdfm-server-groups", __name__)
@@ -26,20 +31,32 @@ groups_blueprint: Blueprint = Blueprint("rdfm-server-groups", __name__)
 GROUP_DEFAULT_PRIORITY = 25
 
 
-def model_to_schema(group: models.group.Group) -> Group:
+def model_to_schema(group: models.group.Group,
+                    devices: Optional[dict[int, List[int]]] = None,
+                    packages: Optional[dict[int, List[int]]] = None
+                    ) -> Group:
     """Convert a database group model to a schema model.
 
-    As we have to fetch the device list, this can't be done using just a simple
-    mapping between the fields.
+    As we have to fetch the device and package lists, this can't be done
+    using just a simple mapping between the fields. When converting many
+    groups, the assignments should be fetched once for all of them (see
+    `GroupsDB.fetch_device_assignments` and
+    `GroupsDB.fetch_package_assignments`) and passed in `devices` and
+    `packages`. If not provided, they are fetched for the given group.
     """
+    if devices is None:
+        devices = server.instance._groups_db.fetch_device_assignments(
+            [group.id]
+        )
+    if packages is None:
+        packages = server.instance._groups_db.fetch_package_assignments(
+            [group.id]
+        )
     return Group(
         id=group.id,
         created=group.created,
-        packages=server.instance._groups_db.fetch_assigned_packages(group.id),
-        devices=[
-            device.id
-            for device in server.instance._groups_db.fetch_assigned(group.id)
-        ],
+        packages=packages.get(group.id, []),
+        devices=devices.get(group.id, []),
         metadata=group.info,
         policy=group.policy,
         priority=group.priority,
@@ -95,8 +112,11 @@ def fetch_all():
         groups: List[
             models.group.Group
         ] = server.instance._groups_db.fetch_all()
+        devices = server.instance._groups_db.fetch_device_assignments()
+        packages = server.instance._groups_db.fetch_package_assignments()
         return Group.Schema().dumps(
-            [model_to_schema(group) for group in groups], many=True
+            [model_to_schema(group, devices, packages) for group in groups],
+            many=True,
         )
     except Exception as e:
         traceback.print_exc()
@@ -420,6 +440,13 @@ def assign_package(identifier: int, assignment: AssignPackageRequest):
         )
         if err is not None:
             return api_error(err, 409)
+        # The change was already stored, a failed notification must not
+        # fail the request
+        try:
+            update.notify.notify_group(identifier)
+        except Exception as e:
+            traceback.print_exc()
+            print("Exception during update notification:", repr(e))
         return {}, 200
     except Exception as e:
         traceback.print_exc()
@@ -481,6 +508,13 @@ def update_policy(identifier: int, policy_request: AssignPolicyRequest):
             return api_error(f"invalid policy: {e}", 400)
 
         server.instance._groups_db.update_policy(identifier, policy)
+        # The change was already stored, a failed notification must not
+        # fail the request
+        try:
+            update.notify.notify_group(identifier)
+        except Exception as e:
+            traceback.print_exc()
+            print("Exception during update notification:", repr(e))
         return {}, 200
     except Exception as e:
         traceback.print_exc()
@@ -546,3 +580,162 @@ def change_priority(identifier: int, priority_request: AssignPriorityRequest):
         traceback.print_exc()
         print("Exception during group priority assignment:", repr(e))
         return api_error("group priority assignment failed", 500)
+
+
+@groups_blueprint.route(
+    "/api/v2/groups/<int:identifier>/simulate", methods=["POST"]
+)
+@management_read_only_api
+@deserialize_schema(
+    schema_dataclass=SimulateRolloutRequest, key="simulation"
+)
+def simulate_rollout(identifier: int, simulation: SimulateRolloutRequest):
+    """Simulate the update checks of all devices in the group
+
+    This performs a dry run of the update checks of all devices for which
+    this group is the active group, using the last metadata the devices
+    provided to the server. A different policy and/or package assignment can
+    be proposed, in which case the simulation uses them instead of the
+    current ones; the group itself is not modified. This allows previewing
+    the effects of a policy change before applying it.
+
+    Devices with identical metadata relevant to the update resolution are
+    resolved only once, so the simulation is fast even for large groups.
+
+    :param identifier: group identifier
+    :status 200: no error
+    :status 400: invalid request schema, or an invalid policy was proposed
+    :status 401: user did not provide authorization data,
+                 or the authorization has expired
+    :status 403: user was authorized, but did not have permission
+                 to read groups
+    :status 404: the specified group or any of the proposed packages
+                 does not exist
+
+    :<json string policy: optional, proposed group policy string
+    :<json array[integer] packages: optional, identifiers of the proposed
+                                    packages
+
+    :>json string policy: policy used in the simulation
+    :>json array[integer] packages: identifiers of the packages used in the
+                                    simulation
+    :>json integer devices: count of simulated devices
+    :>json integer classes: count of distinct device equivalence classes
+                            that were resolved
+    :>json integer no_update: count of devices that would not receive an
+                              update
+    :>json integer unknown: count of devices whose last known metadata does
+                            not contain the device type or software version
+    :>json integer bytes: total bytes that would be transferred to the
+                          devices until they reach their target version,
+                          including every package on their upgrade paths
+                          (packages of unknown size are not counted)
+    :>json array[object] distribution: devices receiving each package as
+                                       their next update, described by the
+                                       `package`, `devices` and `bytes`
+                                       fields. `bytes` covers the whole
+                                       upgrade paths of these devices.
+
+
+    **Example Request**
+
+    .. sourcecode:: http
+
+        POST /api/v2/groups/1/simulate HTTP/1.1
+        Content-Type: application/json
+        Accept: application/json, text/javascript
+
+        {
+            "policy": "exact_match,v2"
+        }
+
+
+    **Example Response**
+
+    .. sourcecode:: http
+
+        HTTP/1.1 200 OK
+        Content-Type: application/json
+
+        {
+            "policy": "exact_match,v2",
+            "packages": [1, 2, 3],
+            "devices": 1500,
+            "classes": 3,
+            "no_update": 500,
+            "unknown": 0,
+            "bytes": 4194304000,
+            "distribution": [
+                {
+                    "package": 2,
+                    "devices": 1000,
+                    "bytes": 4194304000
+                }
+            ]
+        }
+    """
+    try:
+        group: Optional[
+            models.group.Group
+        ] = server.instance._groups_db.fetch_one(identifier)
+        if group is None:
+            return api_error("group does not exist", 404)
+
+        policy_str = simulation.policy
+        try:
+            if policy_str is None:
+                policy_str = group.policy
+                policy = server.instance.group_policies.get(
+                    identifier, policy_str
+                )
+            else:
+                policy = update.policy.create(policy_str)
+        except RuntimeError as e:
+            return api_error(f"invalid policy: {e}", 400)
+
+        if simulation.packages is None:
+            packages = server.instance._groups_db.fetch_assigned_data(
+                identifier
+            )
+            graph = server.instance.package_graphs.get(identifier, packages)
+        else:
+            packages = server.instance._updates_db.fetch_packages(
+                simulation.packages
+            )
+            if len(packages) != len(set(simulation.packages)):
+                return api_error("package does not exist", 404)
+            # Don't replace the cached graph of the group's actual packages
+            graph = PackageGraph(
+                [package.info for package in packages],
+                server.instance.package_graphs.cost,
+            )
+
+        devices = server.instance._updates_db.fetch_active_members(identifier)
+        result = update.simulation.simulate(
+            identifier,
+            [json.loads(device.device_metadata) for device in devices],
+            packages,
+            policy,
+            graph,
+        )
+        return {
+            "policy": policy_str,
+            "packages": [package.id for package in packages],
+            "devices": result.devices,
+            "classes": result.classes,
+            "no_update": result.no_update,
+            "unknown": result.unknown,
+            "bytes": result.bytes,
+            "distribution": [
+                {
+                    "package": entry.package.id,
+                    "devices": entry.devices,
+                    "bytes": entry.bytes,
+                }
+                for entry in result.distribution
+            ],
+        }, 200
+    except Exception as e:
+        traceback.print_exc()
+        print("Exception during rollout simulation:", repr(e))
+        return api_error("rollout simulation failed", 500)
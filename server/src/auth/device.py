@@ -1,11 +1,15 @@
 import base64
+import hashlib
+import threading
 import time
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Union
 import jwt
 import os
 from Crypto.Hash import SHA256
-from Crypto.PublicKey import RSA
+from Crypto.PublicKey import ECC, RSA
+from Crypto.Signature import DSS, eddsa
 from Crypto.Signature.pkcs1_15 import PKCS115_SigScheme
+from lru_cache import LRUCache
 from models.device import Device
 from rdfm.schema.v1.updates import META_MAC_ADDRESS
 import server
@@ -16,14 +20,167 @@ from auth.token import DeviceToken
 DEVICE_JWT_EXPIRY = 300
 """ Algorithm in call to jwt.{encode,decode} to use. """
 DEVICE_JWT_ALGO = "HS256"
+""" Time (in seconds) after the expiration of a device token during which
+    the token can still be exchanged for a new one
+"""
+DEVICE_JWT_REFRESH_GRACE = 60
+""" Minimum time (in seconds) between two token refreshes of a device """
+DEVICE_JWT_REFRESH_INTERVAL = 30
+""" Maximum time (in seconds) for which tokens can be refreshed without
+    authenticating again with the device's key. Re-authenticating also
+    updates the device metadata stored on the server.
+"""
+DEVICE_JWT_MAX_REFRESH_LIFETIME = 24 * 60 * 60
+""" Maximum count of devices tracked for refresh rate limiting """
+REFRESH_LIMITER_SIZE = 65536
+""" Maximum count of parsed device public keys kept in memory """
+PUBLIC_KEY_CACHE_SIZE = 4096
+""" Elliptic curves accepted for device keys, as named by pycryptodome """
+CURVE_P256 = "NIST P-256"
+CURVE_ED25519 = "Ed25519"
+ALLOWED_KEY_CURVES = [CURVE_P256, CURVE_ED25519]
+
+""" Public key of a device """
+PublicKey = Union[RSA.RsaKey, ECC.EccKey]
+
+
+def import_public_key(public_key: str) -> PublicKey:
+    """Parses a PEM-encoded device public key
+
+    The key algorithm is detected from the key itself. RSA, ECDSA P-256
+    and Ed25519 keys are supported.
+
+    Throws:
+        ValueError: the key is not a valid PEM key of a supported algorithm
+    """
+    try:
+        return RSA.import_key(public_key)
+    except ValueError:
+        pass
+    key = ECC.import_key(public_key)
+    if key.curve not in ALLOWED_KEY_CURVES:
+        raise ValueError(f"unsupported key curve: {key.curve}")
+    if key.has_private():
+        raise ValueError("a public key is required")
+    return key
+
+
+class PublicKeyCache:
+    """Bounded cache of parsed device public keys
+
+    Devices re-authenticate every `DEVICE_JWT_EXPIRY` seconds using the same
+    key, so the PEM of each key is parsed only once and the key object is
+    reused afterwards. Keys are looked up by the SHA256 digest of the PEM,
+    so the cache does not keep the (potentially large) PEM strings around
+    as keys. Invalid keys are not cached.
+    """
+
+    """ Total time spent parsing keys, in seconds """
+    parse_time: float
+    """ Count of parsed keys """
+    parsed: int
+
+    def __init__(self, capacity: int = PUBLIC_KEY_CACHE_SIZE) -> None:
+        self._keys = LRUCache(capacity)
+        self._lock = threading.Lock()
+        self.parse_time = 0.0
+        self.parsed = 0
+
+    def import_key(self, public_key: str) -> PublicKey:
+        """Get the key object of a PEM-encoded public key
+
+        Throws:
+            ValueError: the key is not a valid PEM key of a supported
+                        algorithm (see `import_public_key`)
+        """
+        digest = hashlib.sha256(public_key.encode()).digest()
+        key = self._keys.get(digest)
+        if key is not None:
+            return key
+
+        start = time.perf_counter()
+        key = import_public_key(public_key)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.parse_time += elapsed
+            self.parsed += 1
+        self._keys.put(digest, key)
+        return key
+
+    def stats(self) -> dict[str, float]:
+        """Returns the cache size, lookup counters, the hit rate and an
+           estimate of the time saved by the cache (in seconds), based on
+           the average time of parsing a key
+        """
+        stats = self._keys.stats()
+        with self._lock:
+            average = self.parse_time / self.parsed if self.parsed else 0.0
+            stats["parse_time"] = self.parse_time
+        stats["time_saved"] = stats["hits"] * average
+        return stats
+
+
+""" Parsed public keys of the devices """
+public_keys = PublicKeyCache()
+
+
+class TokenDenylist:
+    """Server-side denylist of revoked device tokens
+
+    Revoking the tokens of a device rejects all tokens of the device that
+    were created before the revocation. Token creation times have a
+    precision of one second, so tokens created in the same second as the
+    revocation are still accepted. This applies to both
+    regular requests and token refreshes, so a revoked device has to
+    authenticate again using its key (which also verifies that the device
+    is still authorized). Entries are dropped once no revoked token could
+    be used anymore.
+    """
+
+    def __init__(self) -> None:
+        self._revoked: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def revoke(self, device_id: str, now: Optional[int] = None):
+        """Revoke all tokens of the device created before now"""
+        if now is None:
+            now = int(time.time())
+        with self._lock:
+            self._revoked[device_id] = now
+            # Tokens created before the cutoff expired a long time ago
+            cutoff = now - DEVICE_JWT_EXPIRY - DEVICE_JWT_REFRESH_GRACE
+            for expired in [
+                device for device, revoked_at in self._revoked.items()
+                if revoked_at < cutoff
+            ]:
+                self._revoked.pop(expired)
+
+    def is_revoked(self, token: DeviceToken) -> bool:
+        """Is the given token revoked?"""
+        with self._lock:
+            revoked_at = self._revoked.get(token.device_id)
+        return revoked_at is not None and token.created_at < revoked_at
+
+
+""" Revoked device tokens """
+revoked_tokens = TokenDenylist()
+
+""" Time of the last token refresh, by the device identifier """
+_last_refresh = LRUCache(REFRESH_LIMITER_SIZE)
 
 
 def verify_signature(body: bytes, public_key: str, signature: str) -> bool:
     """Verify the device signature of an incoming request
 
+    The signature scheme is picked based on the algorithm of the key:
+        - RSA: PKCS #1 v1.5 signature with SHA-256 digest
+        - ECDSA P-256: signature of the SHA-256 digest, either DER-encoded
+          or as the raw 64-byte concatenation of `r` and `s`
+        - Ed25519: pure Ed25519 signature (RFC 8032) of the body
+
     Args:
         body: bytes that were signed with the given signature.
-        public_key: RSA public key (PEM-encoded) corresponding to the private
+        public_key: public key (PEM-encoded) corresponding to the private
                     key used during signing.
         signature: base64-encoded signature of the body
 
@@ -31,23 +188,27 @@ def verify_signature(body: bytes, public_key: str, signature: str) -> bool:
         True, if the signature was verified successfully
         False, if:
             - the signature is not valid base64
-            - the public key is not a valid PEM RSA key
+            - the public key is not a valid PEM key of a supported algorithm
             - the signature is invalid
     """
     try:
         signature_bytes = base64.b64decode(signature)
-        key = RSA.import_key(public_key)
+        key = public_keys.import_key(public_key)
     except Exception as e:
         print("Exception during signature verification:", e)
         return False
 
-    # Hash the message body
-    h = SHA256.new(body)
-    # Now verify the signature
-    s = PKCS115_SigScheme(key)
     # `verify` raises a ValueError on failure
     try:
-        s.verify(h, signature_bytes)
+        if isinstance(key, RSA.RsaKey):
+            PKCS115_SigScheme(key).verify(SHA256.new(body), signature_bytes)
+        elif key.curve == CURVE_ED25519:
+            eddsa.new(key, "rfc8032").verify(body, signature_bytes)
+        else:
+            encoding = "binary" if len(signature_bytes) == 64 else "der"
+            DSS.new(key, "fips-186-3", encoding=encoding).verify(
+                SHA256.new(body), signature_bytes
+            )
     except ValueError:
         print("Exception during signature verification: invalid signature")
         return False
@@ -67,7 +228,7 @@ def verify_authorization(device_id: str, public_key: str) -> bool:
 
     Args:
         device_id: device identifier (i.e, MAC address).
-        public_key: RSA public key (PEM-encoded) corresponding to the private
+        public_key: public key (PEM-encoded) corresponding to the private
                     key used during signing.
         metadata: metadata reported by the device during the authentication.
 
@@ -114,7 +275,7 @@ def try_acquire_token(
 
     Args:
         device_id: device identifier (i.e, MAC address).
-        public_key: RSA public key (PEM-encoded) corresponding to the private
+        public_key: public key (PEM-encoded) corresponding to the private
                     key used during signing.
         metadata: metadata reported by the device during the authentication.
 
@@ -132,23 +293,91 @@ def try_acquire_token(
         return None
 
     # Device is authorized, we can generate a token now
+    return _issue_token(device_id, int(time.time()))
+
+
+def _issue_token(device_id: str, authenticated_at: int
+                 ) -> Tuple[str, DeviceToken]:
+    """Creates a signed token for the device
+
+    Args:
+        device_id: device identifier (i.e, MAC address).
+        authenticated_at: time of the last authentication of the device
+                          using its key
+    """
     token_data = DeviceToken()
     token_data.device_id = device_id
     token_data.created_at = int(time.time())
     token_data.expires = DEVICE_JWT_EXPIRY
+    token_data.authenticated_at = authenticated_at
 
     secret = os.environ["JWT_SECRET"]
     token = jwt.encode(token_data.to_dict(), secret, algorithm=DEVICE_JWT_ALGO)
     return token, token_data
 
 
-def decode_and_verify_token(token: str) -> Optional[DeviceToken]:
+def try_refresh_token(
+    token: str, now: Optional[int] = None
+) -> Tuple[Optional[Tuple[str, DeviceToken]], Optional[int]]:
+    """Tries exchanging a device token for a new one
+
+    The token must be valid, or have expired at most
+    `DEVICE_JWT_REFRESH_GRACE` seconds ago. Unlike `try_acquire_token`, this
+    requires no signature verification and no database access, the token
+    signature itself proves the device was previously authenticated.
+    A device can refresh its token at most once every
+    `DEVICE_JWT_REFRESH_INTERVAL` seconds, and only for up to
+    `DEVICE_JWT_MAX_REFRESH_LIFETIME` seconds after authenticating using its
+    key.
+
+    Args:
+        token: JWT token string
+        now: optional, current time (defaults to `time.time()`)
+
+    Returns:
+        Tuple (result, retry_after). On success, result contains a tuple
+        of the new JWT token and the data stored inside the token. When
+        the refresh is rate limited, result is None and retry_after
+        contains the time (in seconds) after which the refresh can be
+        retried. If the token cannot be refreshed, both are None.
+    """
+    if now is None:
+        now = int(time.time())
+    device_token = decode_and_verify_token(
+        token, DEVICE_JWT_REFRESH_GRACE, now
+    )
+    if device_token is None:
+        return None, None
+
+    # Tokens issued before refreshing was introduced were created right
+    # after authenticating
+    authenticated_at = getattr(
+        device_token, "authenticated_at", device_token.created_at
+    )
+    if now >= authenticated_at + DEVICE_JWT_MAX_REFRESH_LIFETIME:
+        return None, None
+
+    last = _last_refresh.get(device_token.device_id)
+    if last is not None and now < last + DEVICE_JWT_REFRESH_INTERVAL:
+        return None, last + DEVICE_JWT_REFRESH_INTERVAL - now
+    _last_refresh.put(device_token.device_id, now)
+
+    return _issue_token(device_token.device_id, authenticated_at), None
+
+
+def decode_and_verify_token(
+    token: str, leeway: int = 0, now: Optional[int] = None
+) -> Optional[DeviceToken]:
     """Decode and verify the validity of a given token
 
     This can be used to check if a given JWT token string is valid.
+    Tokens revoked by the server (see `TokenDenylist`) are invalid.
 
     Args:
         token: JWT token string
+        leeway: optional, time (in seconds) after the expiration during
+                which the token is still considered valid
+        now: optional, current time (defaults to `time.time()`)
 
     Returns:
         None, if the token is invalid in any way (expiration, token format,
@@ -161,8 +390,12 @@ def decode_and_verify_token(token: str) -> Optional[DeviceToken]:
         device_token = DeviceToken.from_dict(token_data)
 
         # Check token expiration
-        current_time = int(time.time())
-        if current_time >= device_token.created_at + device_token.expires:
+        current_time = int(time.time()) if now is None else now
+        expiry = device_token.created_at + device_token.expires + leeway
+        if current_time >= expiry:
+            return None
+
+        if revoked_tokens.is_revoked(device_token):
             return None
 
         return device_token
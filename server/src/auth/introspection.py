@@ -0,0 +1,176 @@
+import contextlib
+import hashlib
+import queue
+import time
+from typing import Iterator, Optional, Tuple
+import requests
+from authlib.integrations.requests_client import OAuth2Session
+from authlib.oauth2.rfc6749.util import scope_to_list
+from lru_cache import LRUCache
+
+
+""" Maximum count of introspection results kept in the cache """
+INTROSPECTION_CACHE_SIZE = 1024
+
+""" Maximum count of idle HTTP sessions kept for introspection requests """
+INTROSPECTION_POOL_SIZE = 8
+
+
+def scopes_from_claims(claims: dict) -> list[str]:
+    """Get the scopes granted to a token from its claims (or from the
+       introspection response), the `scope` field must be present
+    """
+    scopes = scope_to_list(claims["scope"])
+
+    # Keycloak specific, extracts roles from the user's
+    # access token and adds them to the list of scopes
+    if (
+        "realm_access" in claims and
+        "roles" in claims["realm_access"]
+    ):
+        scopes += scope_to_list(
+            claims["realm_access"]["roles"],
+        )
+    return scopes
+
+
+class TokenIntrospector:
+    """Validates management API tokens against an RFC 7662-compatible
+       OAuth2 Token Introspection endpoint
+
+    Results for active tokens are cached, keyed by the SHA256 digest of the
+    token, until the token expires (the `exp` field of the introspection
+    response) but no longer than `max_ttl` seconds. This bounds the time it
+    takes for a token revoked at the authorization server to be rejected.
+    Inactive tokens are never cached.
+
+    Introspection requests are made using long-lived HTTP sessions, so
+    connections to the authorization server are reused between requests.
+    As `requests` sessions are not guaranteed to be thread-safe, a session
+    is only used by one request at a time: it is taken from a pool of idle
+    sessions and returned after the request. The pool is shared by all
+    threads (and greenlets, when running under gevent), so sessions are
+    reused regardless of the worker model. A new session is created when
+    the pool is empty, and at most `pool_size` idle sessions are kept.
+    """
+
+    url: str
+    client_id: str
+    client_secret: str
+    """ Maximum time (in seconds) a result is cached for, 0 disables the
+        cache
+    """
+    max_ttl: int
+
+    def __init__(self, url: str, client_id: str, client_secret: str,
+                 max_ttl: int,
+                 capacity: int = INTROSPECTION_CACHE_SIZE,
+                 pool_size: int = INTROSPECTION_POOL_SIZE) -> None:
+        self.url = url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.max_ttl = max_ttl
+        # Cached results as (expiry timestamp, scopes)
+        self._cache = LRUCache(capacity)
+        self._sessions: queue.LifoQueue[OAuth2Session] = queue.LifoQueue(
+            pool_size
+        )
+
+    def _new_session(self) -> OAuth2Session:
+        return OAuth2Session(self.client_id, self.client_secret)
+
+    @contextlib.contextmanager
+    def _session(self) -> Iterator[OAuth2Session]:
+        """Borrow an idle session from the pool, or create a new one"""
+        try:
+            session = self._sessions.get_nowait()
+        except queue.Empty:
+            session = self._new_session()
+        try:
+            yield session
+        finally:
+            try:
+                self._sessions.put_nowait(session)
+            except queue.Full:
+                session.close()
+
+    def introspect(self, token: str) -> Tuple[Optional[list[str]], float]:
+        """Introspect the given token, bypassing the cache
+
+        Returns:
+            A pair of the token scopes (or None if the token is not valid,
+            see `validate`) and the expiry timestamp of the token given by
+            the authorization server (infinity if it is not known).
+        """
+        with self._session() as session:
+            resp: requests.models.Response = session.introspect_token(
+                self.url, token=token
+            )
+        if resp.status_code != 200:
+            print(
+                "Error during token introspection: authorization server "
+                "responded with a non-success status.",
+                flush=True,
+            )
+            return None, 0
+
+        introspected_token = resp.json()
+
+        active = introspected_token["active"]
+        if not active:
+            return None, 0
+
+        # According to the spec, the authorization server is allowed
+        # to only return an `"active": True` response for valid tokens.
+        if "scope" not in introspected_token:
+            print(
+                "Error during token introspection: authorization server "
+                "response did not contain a `scope` field for valid token. ",
+                flush=True,
+            )
+            return None, 0
+
+        scopes = scopes_from_claims(introspected_token)
+        return scopes, float(introspected_token.get("exp", "inf"))
+
+    def validate(self, token: str) -> Optional[list[str]]:
+        """Validate the given token, using the cached result if available
+
+        Args:
+            token: token string provided in the API request
+
+        Returns:
+            None, if the request to the authorization server fails
+            None, if the token is not valid (field `active` is False)
+            None, if the authorization server does not provide the scopes
+                  in the introspection response, even when the token is
+                  valid (theoretically an optional feature of the Token
+                  Introspection extension)
+            list[str], if the token is valid. A list of token scopes is
+            returned.
+        """
+        now = time.time()
+        key = hashlib.sha256(token.encode()).digest()
+        if self.max_ttl > 0:
+            cached = self._cache.get(key)
+            if cached is not None:
+                expires, scopes = cached
+                if now < expires:
+                    return list(scopes)
+                self._cache.pop(key)
+
+        try:
+            scopes, token_expires = self.introspect(token)
+        except Exception as e:
+            print("Exception during token introspection:", e)
+            return None
+
+        if scopes is not None and self.max_ttl > 0:
+            expires = min(now + self.max_ttl, token_expires)
+            if expires > now:
+                self._cache.put(key, (expires, tuple(scopes)))
+        return scopes
+
+    def stats(self) -> dict[str, float]:
+        """Returns the cache size, lookup counters and the hit rate"""
+        return self._cache.stats()
@@ -0,0 +1,156 @@
+import threading
+import time
+from typing import Optional
+import jwt
+import requests
+from auth.introspection import scopes_from_claims
+
+
+""" Signature algorithms accepted for management tokens. Symmetric
+    algorithms are never accepted, as the keys are public.
+"""
+JWKS_ALLOWED_ALGORITHMS = [
+    "RS256", "RS384", "RS512",
+    "PS256", "PS384", "PS512",
+    "ES256", "ES384", "ES512",
+    "EdDSA",
+]
+
+""" Minimum time (in seconds) between fetching the JWKS document again
+    because of a token signed with an unknown key
+"""
+JWKS_MIN_REFRESH_INTERVAL = 30
+
+""" Timeout of fetching the JWKS document, in seconds """
+JWKS_FETCH_TIMEOUT = 10
+
+
+class JWKSValidator:
+    """Validates management API tokens locally, as signed JWT access tokens
+
+    This is an alternative to introspecting every token (see
+    `auth.introspection.TokenIntrospector`) for authorization servers which
+    issue JWT access tokens, such as Keycloak. The signing keys are read
+    from the JSON Web Key Set published by the authorization server, which
+    is fetched on first use and cached. The key set is fetched again when a
+    token signed with an unknown key (`kid`) is received, which happens
+    after the authorization server rotates its keys. Such refreshes are
+    limited to one every `min_refresh_interval` seconds, so tokens with
+    made-up key identifiers can't be used to flood the authorization
+    server with requests.
+
+    As tokens are not introspected, a token revoked at the authorization
+    server is accepted until it expires.
+    """
+
+    url: str
+    """ Expected token issuer (`iss` claim), None to skip the check """
+    issuer: Optional[str]
+    """ Expected token audience (`aud` claim), None to skip the check """
+    audience: Optional[str]
+    min_refresh_interval: float
+
+    def __init__(self, url: str, issuer: Optional[str] = None,
+                 audience: Optional[str] = None,
+                 min_refresh_interval: float = JWKS_MIN_REFRESH_INTERVAL
+                 ) -> None:
+        self.url = url
+        self.issuer = issuer
+        self.audience = audience
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: dict[Optional[str], jwt.PyJWK] = {}
+        self._fetched_at: Optional[float] = None
+        # Serializes fetching the key set, which also makes sharing the
+        # session between threads safe
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+
+    def _fetch(self):
+        resp = self._session.get(self.url, timeout=JWKS_FETCH_TIMEOUT)
+        resp.raise_for_status()
+        key_set = jwt.PyJWKSet.from_dict(resp.json())
+        self._keys = {key.key_id: key for key in key_set.keys}
+        print("Fetched JWKS containing", len(self._keys), "key(s)",
+              flush=True)
+
+    def signing_key(self, kid: Optional[str]) -> Optional[jwt.PyJWK]:
+        """Get the key with the given identifier, fetching the key set
+           again if the key is not known
+
+        Tokens without a key identifier can only be verified if the key
+        set contains a single key.
+        """
+        key = self._lookup(kid)
+        if key is not None:
+            return key
+
+        with self._lock:
+            # Another thread may have fetched the key set in the meantime
+            key = self._lookup(kid)
+            if key is not None:
+                return key
+            now = time.monotonic()
+            if (self._fetched_at is not None and
+                    now - self._fetched_at < self.min_refresh_interval):
+                return None
+            self._fetched_at = now
+            try:
+                self._fetch()
+            except Exception as e:
+                print("Exception while fetching the JWKS:", e, flush=True)
+                return None
+            return self._lookup(kid)
+
+    def _lookup(self, kid: Optional[str]) -> Optional[jwt.PyJWK]:
+        keys = self._keys
+        if kid is None and len(keys) == 1:
+            return next(iter(keys.values()))
+        return keys.get(kid)
+
+    def validate(self, token: str) -> Optional[list[str]]:
+        """Validate the given token
+
+        Args:
+            token: token string provided in the API request
+
+        Returns:
+            None, if the token is malformed, expired, or its signature
+                  could not be verified using the key set
+            None, if the token does not contain the `scope` claim
+            list[str], if the token is valid. A list of token scopes is
+            returned.
+        """
+        try:
+            header = jwt.get_unverified_header(token)
+            key = self.signing_key(header.get("kid"))
+            if key is None:
+                print("Rejecting token signed with an unknown key",
+                      flush=True)
+                return None
+            if key.algorithm_name not in JWKS_ALLOWED_ALGORITHMS:
+                print("Rejecting token signed with an unsupported key "
+                      f"algorithm: {key.algorithm_name}", flush=True)
+                return None
+            claims = jwt.decode(
+                token,
+                key.key,
+                algorithms=[key.algorithm_name],
+                issuer=self.issuer,
+                audience=self.audience,
+                options={
+                    "require": ["exp"],
+                    "verify_aud": self.audience is not None,
+                },
+            )
+        except jwt.PyJWTError as e:
+            print("Rejecting invalid token:", e, flush=True)
+            return None
+
+        if "scope" not in claims:
+            print(
+                "Error during token validation: token does not contain "
+                "a `scope` claim.",
+                flush=True,
+            )
+            return None
+        return scopes_from_claims(claims)
@@ -7,6 +7,10 @@ class DeviceToken:
     device_id: str
     created_at: int
     expires: int
+    """ Time the device last authenticated using its key, refreshed
+        tokens keep the value of the original token
+    """
+    authenticated_at: int
 
     def __init__(self, **kwargs) -> None:
         for key in kwargs:
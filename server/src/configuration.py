@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Any, Optional
 import os
 
 
@@ -17,10 +17,50 @@ ENV_S3_BUCKET = "RDFM_S3_BUCKET"
     These values should match the ones found in`storage.driver_by_name`.
 """
 ALLOWED_STORAGE_DRIVERS = ["local", "s3"]
+""" Cost function used when picking update paths """
+ENV_UPDATE_COST = "RDFM_UPDATE_COST"
+""" List of valid cost functions for update paths.
+    These values should match the ones found in `update.costs.create`.
+"""
+ALLOWED_UPDATE_COSTS = ["bytes", "hops", "install_time"]
+""" Download admission control """
+ENV_ADMISSION_MAX_PER_PACKAGE = "RDFM_ADMISSION_MAX_PER_PACKAGE"
+ENV_ADMISSION_MAX_PER_DRIVER = "RDFM_ADMISSION_MAX_PER_DRIVER"
+ENV_ADMISSION_MAX_GLOBAL = "RDFM_ADMISSION_MAX_GLOBAL"
+ENV_ADMISSION_LEASE_TIME = "RDFM_ADMISSION_LEASE_TIME"
+""" Interval of writing device last access timestamps to the database """
+ENV_LAST_ACCESS_FLUSH_INTERVAL = "RDFM_LAST_ACCESS_FLUSH_INTERVAL"
+
+""" Database engine profile, and overrides of individual settings """
+ENV_DB_PROFILE = "RDFM_DB_PROFILE"
+ENV_DB_POOL_SIZE = "RDFM_DB_POOL_SIZE"
+ENV_DB_MAX_OVERFLOW = "RDFM_DB_MAX_OVERFLOW"
+ENV_DB_POOL_TIMEOUT = "RDFM_DB_POOL_TIMEOUT"
+ENV_DB_POOL_RECYCLE = "RDFM_DB_POOL_RECYCLE"
+ENV_DB_POOL_PRE_PING = "RDFM_DB_POOL_PRE_PING"
+ENV_DB_ECHO = "RDFM_DB_ECHO"
+ENV_SQLITE_JOURNAL_MODE = "RDFM_SQLITE_JOURNAL_MODE"
+ENV_SQLITE_SYNCHRONOUS = "RDFM_SQLITE_SYNCHRONOUS"
+ENV_SQLITE_BUSY_TIMEOUT = "RDFM_SQLITE_BUSY_TIMEOUT"
+ENV_SQLITE_MMAP_SIZE = "RDFM_SQLITE_MMAP_SIZE"
+""" List of valid database engine profiles.
+    These values should match the ones found in `database.db.PROFILES`.
+"""
+ALLOWED_DB_PROFILES = ["default", "debug", "high_concurrency"]
+ALLOWED_SQLITE_JOURNAL_MODES = [
+    "DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"
+]
+ALLOWED_SQLITE_SYNCHRONOUS = ["OFF", "NORMAL", "FULL", "EXTRA"]
 
 ENV_OAUTH_URL = "RDFM_OAUTH_URL"
 ENV_OAUTH_CLIENT_ID = "RDFM_OAUTH_CLIENT_ID"
 ENV_OAUTH_CLIENT_SECRET = "RDFM_OAUTH_CLIENT_SEC"
+""" Maximum time for which token introspection results are cached """
+ENV_OAUTH_CACHE_TTL = "RDFM_OAUTH_CACHE_TTL"
+""" Offline validation of management tokens using a JSON Web Key Set """
+ENV_OAUTH_JWKS_URL = "RDFM_OAUTH_JWKS_URL"
+ENV_OAUTH_ISSUER = "RDFM_OAUTH_ISSUER"
+ENV_OAUTH_AUDIENCE = "RDFM_OAUTH_AUDIENCE"
 
 ENV_HOSTNAME = "RDFM_HOSTNAME"
 ENV_API_PORT = "RDFM_API_PORT"
@@ -58,6 +98,14 @@ class ServerConfig:
     """ Database connection string """
     db_conn: str
 
+    """ Database engine profile, one of `ALLOWED_DB_PROFILES` """
+    db_profile: str = "default"
+
+    """ Engine settings overriding the values of the profile, see
+        `database.db.EngineProfile` for the available settings
+    """
+    db_overrides: dict[str, Any] = {}
+
     """ Path to the file transfer cache directory """
     cache_dir: str
 
@@ -144,6 +192,53 @@ class ServerConfig:
     """
     token_introspection_client_secret: str
 
+    """ Maximum time (in seconds) for which the result of introspecting
+        a valid token is cached. A value of 0 disables the cache, and every
+        request to the management API is introspected.
+    """
+    token_introspection_cache_ttl: int = 30
+
+    """ URL to the JSON Web Key Set of the authorization server. When
+        set, management tokens are validated locally as signed JWTs
+        instead of being introspected.
+    """
+    token_jwks_url: Optional[str] = None
+
+    """ Expected issuer (`iss` claim) of management tokens validated
+        using the JWKS, None to accept any issuer
+    """
+    token_issuer: Optional[str] = None
+
+    """ Expected audience (`aud` claim) of management tokens validated
+        using the JWKS, None to accept any audience
+    """
+    token_audience: Optional[str] = None
+
+    """ Cost function used for picking the update path of devices, one of
+        `ALLOWED_UPDATE_COSTS`. By default, the path transferring the least
+        bytes is picked.
+    """
+    update_cost: str = "bytes"
+
+    """ Maximum count of concurrent package downloads granted to devices,
+        for a single package, for all packages of a single storage driver and
+        in total. A value of 0 disables the specific limit.
+    """
+    admission_max_per_package: int = 0
+    admission_max_per_driver: int = 0
+    admission_max_global: int = 0
+
+    """ Time (in seconds) for which a granted package download counts against
+        the download limits
+    """
+    admission_lease_time: int = 600
+
+    """ Interval (in seconds) in which the buffered last access timestamps
+        of devices are written to the database. A value of 0 disables the
+        buffering, and the timestamp is written on every device request.
+    """
+    last_access_flush_interval: int = 5
+
     """ (DEBUG FLAG) Instruct the server to create mock data in the
         database when starting. DO NOT USE, for testing purposes only!
     """
@@ -187,6 +282,68 @@ def try_get_env(key: str, help_text: str) -> Optional[str]:
     return os.environ[key]
 
 
+def parse_db_settings(config: ServerConfig) -> bool:
+    """Parses the database engine settings from the environment
+
+    Returns:
+        True,  if all of the settings have valid values
+        False, otherwise
+    """
+    config.db_profile = os.environ.get(ENV_DB_PROFILE, "default")
+    if config.db_profile not in ALLOWED_DB_PROFILES:
+        print(
+            "Invalid database profile: got",
+            config.db_profile,
+            " expected one of:",
+            ALLOWED_DB_PROFILES,
+        )
+        return False
+
+    config.db_overrides = {}
+    for key, name in [
+        (ENV_DB_POOL_SIZE, "pool_size"),
+        (ENV_DB_MAX_OVERFLOW, "max_overflow"),
+        (ENV_DB_POOL_TIMEOUT, "pool_timeout"),
+        (ENV_DB_POOL_RECYCLE, "pool_recycle"),
+        (ENV_SQLITE_BUSY_TIMEOUT, "sqlite_busy_timeout"),
+        (ENV_SQLITE_MMAP_SIZE, "sqlite_mmap_size"),
+    ]:
+        if key not in os.environ:
+            continue
+        value = os.environ[key]
+        try:
+            config.db_overrides[name] = int(value)
+        except ValueError:
+            print(f"Invalid value specified for {key}: {value}")
+            return False
+        if config.db_overrides[name] < 0:
+            print(f"Invalid value specified for {key}: {value}")
+            return False
+
+    for key, name in [
+        (ENV_DB_POOL_PRE_PING, "pool_pre_ping"),
+        (ENV_DB_ECHO, "echo"),
+    ]:
+        if key in os.environ:
+            config.db_overrides[name] = os.environ[key].lower() == "true"
+
+    for key, name, allowed in [
+        (ENV_SQLITE_JOURNAL_MODE, "sqlite_journal_mode",
+         ALLOWED_SQLITE_JOURNAL_MODES),
+        (ENV_SQLITE_SYNCHRONOUS, "sqlite_synchronous",
+         ALLOWED_SQLITE_SYNCHRONOUS),
+    ]:
+        if key not in os.environ:
+            continue
+        value = os.environ[key].upper()
+        if value not in allowed:
+            print(f"Invalid value specified for {key}: {value}, "
+                  f"expected one of: {allowed}")
+            return False
+        config.db_overrides[name] = value
+    return True
+
+
 def parse_from_environment(config: ServerConfig) -> bool:
     """Parses server configuration from the environment
 
@@ -231,6 +388,37 @@ def parse_from_environment(config: ServerConfig) -> bool:
         )
         return False
 
+    config.update_cost = os.environ.get(ENV_UPDATE_COST, "bytes")
+    if config.update_cost not in ALLOWED_UPDATE_COSTS:
+        print(
+            "Invalid update cost function: got",
+            config.update_cost,
+            " expected one of:",
+            ALLOWED_UPDATE_COSTS,
+        )
+        return False
+
+    for key, name, default in [
+        (ENV_ADMISSION_MAX_PER_PACKAGE, "admission_max_per_package", 0),
+        (ENV_ADMISSION_MAX_PER_DRIVER, "admission_max_per_driver", 0),
+        (ENV_ADMISSION_MAX_GLOBAL, "admission_max_global", 0),
+        (ENV_ADMISSION_LEASE_TIME, "admission_lease_time", 600),
+        (ENV_LAST_ACCESS_FLUSH_INTERVAL, "last_access_flush_interval", 5),
+        (ENV_OAUTH_CACHE_TTL, "token_introspection_cache_ttl", 30),
+    ]:
+        value = os.environ.get(key, str(default))
+        try:
+            setattr(config, name, int(value))
+        except ValueError:
+            print(f"Invalid value specified for {key}: {value}")
+            return False
+        if getattr(config, name) < 0:
+            print(f"Invalid value specified for {key}: {value}")
+            return False
+
+    if not parse_db_settings(config):
+        return False
+
     if config.storage_driver == "s3":
         config.s3_url = os.environ.get(ENV_S3_URL, None)
         config.s3_use_v4_signature = (
@@ -265,9 +453,15 @@ def parse_from_environment(config: ServerConfig) -> bool:
         else:
             config.frontend_app_url = os.environ[ENV_FRONTEND_APP_URL]
 
+    # Tokens are validated using the JWKS of the authorization server
+    # when configured, introspection is not used in this case.
+    config.token_jwks_url = os.environ.get(ENV_OAUTH_JWKS_URL, None)
+    config.token_issuer = os.environ.get(ENV_OAUTH_ISSUER, None)
+    config.token_audience = os.environ.get(ENV_OAUTH_AUDIENCE, None)
+
     # Token Introspection variables are only required when running
     # with authentication enabled.
-    if not config.disable_api_auth:
+    if not config.disable_api_auth and config.token_jwks_url is None:
         oauth_url = try_get_env(
             ENV_OAUTH_URL, "RFC 7662 Token Introspection endpoint"
         )
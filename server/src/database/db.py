@@ -1,5 +1,7 @@
+from typing import Any, Optional
 from sqlalchemy import create_engine, event, inspect
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
 from sqlalchemy_utils.functions import database_exists
 from models.base import Base
 from alembic import config, script, command
@@ -17,27 +19,143 @@ def check_current_head(alembic_cfg, connectable):
         return set(context.get_current_heads()) == set(directory.get_heads())
 
 
-def create(connstring: str) -> Engine:
+class EngineProfile:
+    """Settings of the database engine
+
+    Pool settings only apply to databases using a connection pool of
+    bounded size (e.g PostgreSQL, or file-based SQLite databases), the
+    SQLite settings only apply to SQLite databases. A value of None leaves
+    the respective SQLAlchemy or SQLite default in place.
+    """
+
+    """ Count of connections kept open in the pool """
+    pool_size: Optional[int] = None
+    """ Count of connections that can be opened above `pool_size` """
+    max_overflow: Optional[int] = None
+    """ Time (in seconds) to wait for a connection from the pool """
+    pool_timeout: Optional[int] = None
+    """ Time (in seconds) after which connections are replaced """
+    pool_recycle: Optional[int] = None
+    """ Should connections be tested for liveness before using them? """
+    pool_pre_ping: bool = False
+    """ Should all SQL statements be logged to stdout? """
+    echo: bool = False
+
+    """ SQLite journal mode, e.g `WAL` """
+    sqlite_journal_mode: Optional[str] = None
+    """ SQLite `synchronous` setting, e.g `NORMAL` """
+    sqlite_synchronous: Optional[str] = None
+    """ Time (in milliseconds) to wait for a locked SQLite database """
+    sqlite_busy_timeout: Optional[int] = None
+    """ Maximum size (in bytes) of the SQLite database file that is
+        memory-mapped
+    """
+    sqlite_mmap_size: Optional[int] = None
+
+    def __init__(self, **kwargs) -> None:
+        for key in kwargs:
+            if not hasattr(EngineProfile, key):
+                raise AttributeError(f"unknown engine setting: {key}")
+            setattr(self, key, kwargs[key])
+
+    def with_overrides(self, **kwargs) -> "EngineProfile":
+        """Returns a copy of the profile with the given settings replaced,
+           settings given as None are left unchanged
+        """
+        settings = vars(self).copy()
+        settings.update({
+            key: value for key, value in kwargs.items() if value is not None
+        })
+        return EngineProfile(**settings)
+
+
+""" Predefined engine profiles, the names should match
+    `configuration.ALLOWED_DB_PROFILES`
+"""
+PROFILES: dict[str, EngineProfile] = {
+    # SQLAlchemy and SQLite defaults
+    "default": EngineProfile(),
+    # Default settings, additionally logging every SQL statement
+    "debug": EngineProfile(echo=True),
+    # Deployments handling many devices concurrently: a larger pool with
+    # a short wait for connections, and SQLite in WAL mode, which allows
+    # reads to proceed concurrently to a write
+    "high_concurrency": EngineProfile(
+        pool_size=20,
+        max_overflow=30,
+        pool_timeout=10,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+        sqlite_journal_mode="WAL",
+        sqlite_synchronous="NORMAL",
+        sqlite_busy_timeout=5000,
+        sqlite_mmap_size=256 * 1024 * 1024,
+    ),
+}
+
+
+def engine_options(connstring: str,
+                   profile: EngineProfile) -> dict[str, Any]:
+    """Get the `create_engine` arguments for the given profile"""
+    options: dict[str, Any] = {
+        "echo": profile.echo,
+        "pool_pre_ping": profile.pool_pre_ping,
+    }
+    url = make_url(connstring)
+    # In-memory SQLite databases use a pool of a single connection per
+    # thread, which does not accept sizing arguments
+    if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        for key in ["pool_size", "max_overflow",
+                    "pool_timeout", "pool_recycle"]:
+            if getattr(profile, key) is not None:
+                options[key] = getattr(profile, key)
+    return options
+
+
+def sqlite_pragmas(profile: EngineProfile) -> list[str]:
+    """Get the pragmas to execute on every new SQLite connection"""
+    # SQLite: Automatically enable foreign keys when connecting
+    # to the DB. We use foreign keys for maintaining integrity
+    # for packages/groups
+    pragmas = ["pragma foreign_keys=ON"]
+    if profile.sqlite_journal_mode is not None:
+        pragmas.append(f"pragma journal_mode={profile.sqlite_journal_mode}")
+    if profile.sqlite_synchronous is not None:
+        pragmas.append(f"pragma synchronous={profile.sqlite_synchronous}")
+    if profile.sqlite_busy_timeout is not None:
+        pragmas.append(
+            f"pragma busy_timeout={int(profile.sqlite_busy_timeout)}"
+        )
+    if profile.sqlite_mmap_size is not None:
+        pragmas.append(f"pragma mmap_size={int(profile.sqlite_mmap_size)}")
+    return pragmas
+
+
+def create(connstring: str,
+           profile: EngineProfile = PROFILES["default"]) -> Engine:
     """Creates a connection to the database used to store server data
 
     Args:
         connstring: SQLAlchemy database connection string. For reference,
                     see: https://docs.sqlalchemy.org/en/20/core/engines.html
+        profile: engine settings to use
     Returns:
         SQLAlchemy Engine object that can be used to query the database
         or None, if database creation/connection failed
     """
     try:
-        db: Engine = create_engine(connstring, echo=True)
+        db: Engine = create_engine(
+            connstring, **engine_options(connstring, profile)
+        )
 
         if db.url.drivername == "sqlite":
-            # SQLite: Automatically enable foreign keys when connecting
-            # to the DB. We use foreign keys for maintaining integrity
-            # for packages/groups
-            def _fk_pragma_on_connect(dbapi_con, con_record):
-                dbapi_con.execute("pragma foreign_keys=ON")
+            pragmas = sqlite_pragmas(profile)
+
+            def _pragmas_on_connect(dbapi_con, con_record):
+                for pragma in pragmas:
+                    dbapi_con.execute(pragma)
 
-            event.listen(db, "connect", _fk_pragma_on_connect)
+            event.listen(db, "connect", _pragmas_on_connect)
 
         if os.path.isfile('alembic.ini'):
             # If the database exists, is not empty,
@@ -1,13 +1,23 @@
+import hashlib
 import json
 import datetime
 from typing import Optional, List
 import models.device
-from sqlalchemy import select, update
+import models.group
+from sqlalchemy import bindparam, select, update
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 import server
 
 
+def hash_metadata(metadata: dict[str, str]) -> str:
+    """Returns the hash of the canonical encoding of the device metadata,
+       which does not depend on the order of the keys
+    """
+    encoded = json.dumps(metadata, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
 class DevicesDB:
     engine: Engine
 
@@ -34,6 +44,31 @@ class DevicesDB:
             session.execute(stmt)
             session.commit()
 
+    def update_timestamps(self, timestamps: dict[str, datetime.datetime]):
+        """Update the last healthcheck time of many devices at once
+
+        All timestamps are written in a single transaction. Rows are updated
+        in a consistent order (by the MAC address), so concurrent bulk
+        updates cannot deadlock on the row locks.
+
+        Args:
+            timestamps: last healthcheck time, by the device MAC address
+        """
+        if len(timestamps) == 0:
+            return
+        table = models.device.Device.__table__
+        with Session(self.engine) as session:
+            stmt = (
+                update(table)
+                .values(last_access=bindparam("new_last_access"))
+                .where(table.c.mac_address == bindparam("device_mac"))
+            )
+            session.connection().execute(stmt, [
+                {"device_mac": mac, "new_last_access": timestamp}
+                for mac, timestamp in sorted(timestamps.items())
+            ])
+            session.commit()
+
     def fetch_all(self) -> List[models.device.Device]:
         """Fetch a list of all devices found in the database"""
         with Session(self.engine) as session:
@@ -60,20 +95,85 @@ class DevicesDB:
                 )
             ).all()
 
+    def fetch_group_assignments(
+        self, identifiers: Optional[List[int]] = None
+    ) -> dict[int, List[int]]:
+        """Fetch IDs of groups the given devices are assigned to, using
+           a single query
+
+        Args:
+            identifiers: device identifiers, None to fetch the groups of
+                         all devices
+
+        Returns:
+            Group identifiers by the device identifier, devices which are
+            not assigned to any group are omitted
+        """
+        stmt = select(
+            models.device.DeviceGroupAssignment.device_id,
+            models.device.DeviceGroupAssignment.group_id,
+        ).order_by(
+            models.device.DeviceGroupAssignment.device_id,
+            models.device.DeviceGroupAssignment.group_id,
+        )
+        if identifiers is not None:
+            stmt = stmt.where(
+                models.device.DeviceGroupAssignment.device_id.in_(identifiers)
+            )
+        assignments: dict[int, List[int]] = {}
+        with Session(self.engine) as session:
+            for device, group in session.execute(stmt):
+                assignments.setdefault(device, []).append(group)
+        return assignments
+
+    def fetch_active_groups(
+        self, identifiers: Optional[List[int]] = None
+    ) -> dict[int, int]:
+        """Fetch IDs of the groups that are active for the given devices,
+           using a single query
+
+        The active group of a device is the assigned group with the lowest
+        priority value, ties are broken by the group identifier.
+
+        Args:
+            identifiers: device identifiers, None to fetch the active groups
+                         of all devices
+
+        Returns:
+            Active group identifier by the device identifier, devices which
+            are not assigned to any group are omitted
+        """
+        stmt = (
+            select(
+                models.device.DeviceGroupAssignment.device_id,
+                models.device.DeviceGroupAssignment.group_id,
+            )
+            .join(
+                models.group.Group,
+                models.group.Group.id ==
+                models.device.DeviceGroupAssignment.group_id,
+            )
+            .order_by(
+                models.device.DeviceGroupAssignment.device_id,
+                models.group.Group.priority,
+                models.device.DeviceGroupAssignment.group_id,
+            )
+        )
+        if identifiers is not None:
+            stmt = stmt.where(
+                models.device.DeviceGroupAssignment.device_id.in_(identifiers)
+            )
+        active: dict[int, int] = {}
+        with Session(self.engine) as session:
+            for device, group in session.execute(stmt):
+                active.setdefault(device, group)
+        return active
+
     def fetch_active_group(self, identifier: int) -> Optional[int]:
         """ Fetch ID of the group that is active for the device with a given
         identifier
         """
-        groups = self.fetch_groups(identifier)
-        if not groups:
-            return None
-
-        prios = []
-        for group_id in groups:
-            g = server.instance._groups_db.fetch_one(group_id)
-            prios.append(g.priority)
-
-        return groups[prios.index(min(prios))]
+        return self.fetch_active_groups([identifier]).get(identifier)
 
     def insert(self, device: models.device.Device):
         """Add a device to the database
@@ -98,13 +198,101 @@ class DevicesDB:
             session.execute(stmt)
             session.commit()
 
-    def update_metadata(self, mac_address: str, metadata: dict[str, str]):
-        """Update the metadata of the given device."""
+    def update_metadata(self, mac_address: str,
+                        metadata: dict[str, str]) -> Optional[int]:
+        """Update the metadata of the given device
+
+        The metadata is only written when it differs from the stored one,
+        unchanged metadata causes no writes.
+
+        Returns:
+            The revision of the stored metadata, or None if the device
+            does not exist
+        """
+        digest = hash_metadata(metadata)
         with Session(self.engine) as session:
+            current = session.execute(
+                select(
+                    models.device.Device.metadata_hash,
+                    models.device.Device.metadata_revision,
+                ).where(models.device.Device.mac_address == mac_address)
+            ).first()
+            if current is None:
+                return None
+            stored_hash, revision = current
+            if stored_hash == digest:
+                return revision
+
             stmt = (
                 update(models.device.Device)
-                .values(device_metadata=json.dumps(metadata))
+                .values(
+                    device_metadata=json.dumps(metadata),
+                    metadata_hash=digest,
+                    metadata_revision=models.device.Device.metadata_revision
+                    + 1,
+                )
                 .where(models.device.Device.mac_address == mac_address)
+                .returning(models.device.Device.metadata_revision)
             )
-            session.execute(stmt)
+            revision = session.scalar(stmt)
+            session.commit()
+            return revision
+
+    def apply_metadata_delta(
+        self,
+        mac_address: str,
+        changed: dict[str, str],
+        removed: List[str],
+        base_revision: int,
+    ) -> Optional[int]:
+        """Update the metadata of the given device using a delta
+
+        The delta is applied on top of the stored metadata, only if the
+        stored metadata is at the revision the delta was made against.
+        Unchanged metadata causes no writes.
+
+        Args:
+            mac_address: MAC address of the device
+            changed: keys that were added or modified, with their values
+            removed: keys that were removed
+            base_revision: revision of the metadata the delta applies to
+
+        Returns:
+            The revision of the stored metadata, or None if the device does
+            not exist or the stored metadata is at a different revision
+        """
+        with Session(self.engine) as session:
+            current = session.execute(
+                select(
+                    models.device.Device.device_metadata,
+                    models.device.Device.metadata_hash,
+                    models.device.Device.metadata_revision,
+                ).where(models.device.Device.mac_address == mac_address)
+            ).first()
+            if current is None or current[2] != base_revision:
+                return None
+
+            metadata = json.loads(current[0]) | changed
+            for key in removed:
+                metadata.pop(key, None)
+            digest = hash_metadata(metadata)
+            if current[1] == digest:
+                return base_revision
+
+            # Only write if no other request modified the metadata since
+            stmt = (
+                update(models.device.Device)
+                .values(
+                    device_metadata=json.dumps(metadata),
+                    metadata_hash=digest,
+                    metadata_revision=base_revision + 1,
+                )
+                .where(models.device.Device.mac_address == mac_address)
+                .where(
+                    models.device.Device.metadata_revision == base_revision
+                )
+            )
+            if session.execute(stmt).rowcount == 0:
+                return None
             session.commit()
+            return base_revision + 1
@@ -66,6 +66,37 @@ class GroupsDB:
                 .join(models.device.Device)
             ).all()
 
+    def fetch_device_assignments(
+        self, groups: Optional[List[int]] = None
+    ) -> dict[int, List[int]]:
+        """Fetches identifiers of devices assigned to the given groups,
+           using a single query
+
+        Args:
+            groups: group identifiers, None to fetch the devices of all
+                    groups
+
+        Returns:
+            Device identifiers by the group identifier, groups without any
+            devices are omitted
+        """
+        stmt = select(
+            models.device.DeviceGroupAssignment.group_id,
+            models.device.DeviceGroupAssignment.device_id,
+        ).order_by(
+            models.device.DeviceGroupAssignment.group_id,
+            models.device.DeviceGroupAssignment.device_id,
+        )
+        if groups is not None:
+            stmt = stmt.where(
+                models.device.DeviceGroupAssignment.group_id.in_(groups)
+            )
+        assignments: dict[int, List[int]] = {}
+        with Session(self.engine) as session:
+            for group, device in session.execute(stmt):
+                assignments.setdefault(group, []).append(device)
+        return assignments
+
     def delete(self, identifier: int) -> bool:
         """Deletes a group
 
@@ -85,6 +116,9 @@ class GroupsDB:
                 )
                 session.execute(stmt)
                 session.commit()
+                server.instance.package_graphs.invalidate(identifier)
+                server.instance.group_policies.invalidate(identifier)
+                server.instance.update_decisions.invalidate(identifier)
                 return True
         except IntegrityError:
             # Constraint failed, the group is still used by some devices
@@ -206,6 +240,8 @@ class GroupsDB:
                     [make_assignment(group, pkg) for pkg in packages]
                 )
                 session.commit()
+                server.instance.package_graphs.invalidate(group)
+                server.instance.update_decisions.invalidate(group)
                 return None
         except IntegrityError:
             return "conflict while assigning package, the package may " \
@@ -224,6 +260,37 @@ class GroupsDB:
                 )
             ).all()
 
+    def fetch_package_assignments(
+        self, groups: Optional[List[int]] = None
+    ) -> dict[int, List[int]]:
+        """Fetches identifiers of packages assigned to the given groups,
+           using a single query
+
+        Args:
+            groups: group identifiers, None to fetch the packages of all
+                    groups
+
+        Returns:
+            Package identifiers by the group identifier, groups without any
+            packages are omitted
+        """
+        stmt = select(
+            models.group.GroupPackageAssignment.group_id,
+            models.group.GroupPackageAssignment.package_id,
+        ).order_by(
+            models.group.GroupPackageAssignment.group_id,
+            models.group.GroupPackageAssignment.package_id,
+        )
+        if groups is not None:
+            stmt = stmt.where(
+                models.group.GroupPackageAssignment.group_id.in_(groups)
+            )
+        assignments: dict[int, List[int]] = {}
+        with Session(self.engine) as session:
+            for group, package in session.execute(stmt):
+                assignments.setdefault(group, []).append(package)
+        return assignments
+
     def fetch_assigned_data(self, group: int) -> List[models.package.Package]:
         """Fetches a list of packages assigned to this group.
 
@@ -236,6 +303,7 @@ class GroupsDB:
                 .select_from(models.group.GroupPackageAssignment)
                 .where(models.group.GroupPackageAssignment.group_id == group)
                 .join(models.package.Package)
+                .order_by(models.package.Package.id)
             ).all()
 
     def update_priority(self, group: int, priority: int) -> Optional[str]:
@@ -296,3 +364,4 @@ class GroupsDB:
             )
             session.execute(stmt)
             session.commit()
+            server.instance.group_policies.invalidate(group)
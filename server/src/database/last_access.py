@@ -0,0 +1,174 @@
+import datetime
+import threading
+from typing import Callable, Iterable, Optional
+from database.devices import DevicesDB
+from device_mgmt.helpers import WS_PING_INTERVAL
+import models.device
+
+
+class LastAccessBuffer:
+    """Write-behind buffer of device last access timestamps
+
+    Device requests only record the access time in memory. A background
+    flusher periodically writes all timestamps recorded since the previous
+    flush using a single bulk UPDATE, which removes a write transaction
+    from every device request. Multiple accesses of a device between two
+    flushes are coalesced, only the latest timestamp is written.
+
+    Until a timestamp is flushed, readers of the device data should prefer
+    the pending timestamp (see `get`) over the one stored in the database.
+    """
+
+    """ Flush interval in seconds, 0 if the buffering is disabled """
+    interval: int
+    """ Minimum time in seconds between stamping the access time of a
+        connected device
+    """
+    connected_interval: float
+
+    def __init__(
+        self,
+        devices_db: DevicesDB,
+        interval: int,
+        connected: Optional[Callable[[], Iterable[str]]] = None,
+        connected_interval: float = WS_PING_INTERVAL,
+    ) -> None:
+        """Create an empty buffer
+
+        Args:
+            devices_db: database the timestamps are written to
+            interval: flush interval in seconds. When 0, timestamps are
+                      written immediately instead.
+            connected: optional, returns the MAC addresses of devices that
+                       are currently connected to the management WebSocket.
+                       The WebSocket connection is closed when a device
+                       stops responding to pings, so these devices are
+                       treated as accessed whenever their last recorded
+                       access is older than `connected_interval`.
+            connected_interval: resolution of the access time of connected
+                                devices, in seconds. Defaults to the
+                                WebSocket ping interval.
+        """
+        self.interval = interval
+        self.connected_interval = connected_interval
+        self._devices_db = devices_db
+        self._connected = connected
+        self._pending: dict[str, datetime.datetime] = {}
+        # Last written access time of the connected devices
+        self._written: dict[str, datetime.datetime] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, mac_address: str,
+               timestamp: Optional[datetime.datetime] = None):
+        """Record an access of the given device
+
+        Args:
+            mac_address: MAC address of the device
+            timestamp: optional, time of the access (defaults to now, UTC)
+        """
+        if timestamp is None:
+            timestamp = datetime.datetime.utcnow()
+        if self.interval == 0:
+            self._devices_db.update_timestamp(mac_address, timestamp)
+            return
+        with self._lock:
+            previous = self._pending.get(mac_address)
+            if previous is None or previous < timestamp:
+                self._pending[mac_address] = timestamp
+
+    def get(self, mac_address: str) -> Optional[datetime.datetime]:
+        """Returns the pending (not yet flushed) access time of a device,
+           or None if no access was recorded since the last flush
+        """
+        with self._lock:
+            return self._pending.get(mac_address)
+
+    def last_access(self, device: models.device.Device
+                    ) -> Optional[datetime.datetime]:
+        """Returns the last access time of the device, including accesses
+           that were not yet written to the database
+        """
+        pending = self.get(device.mac_address)
+        if pending is None:
+            return device.last_access
+        if device.last_access is not None and device.last_access > pending:
+            return device.last_access
+        return pending
+
+    def flush(self):
+        """Write all pending timestamps to the database
+
+        If the write fails, the timestamps are kept and retried on the
+        next flush.
+        """
+        with self._flush_lock:
+            connected = set()
+            if self._connected is not None:
+                connected = set(self._connected())
+            now = datetime.datetime.utcnow()
+            stale = now - datetime.timedelta(seconds=self.connected_interval)
+
+            with self._lock:
+                # Connected devices are only stamped once their recorded
+                # access gets older than the interval, so that their rows
+                # are not rewritten on every flush
+                self._written = {
+                    mac_address: timestamp
+                    for mac_address, timestamp in self._written.items()
+                    if mac_address in connected
+                }
+                for mac_address in connected:
+                    last = self._pending.get(
+                        mac_address, self._written.get(mac_address)
+                    )
+                    if last is None or last <= stale:
+                        self._pending[mac_address] = now
+                pending = self._pending
+                self._pending = {}
+            if len(pending) == 0:
+                return
+
+            try:
+                self._devices_db.update_timestamps(pending)
+                with self._lock:
+                    for mac_address in connected.intersection(pending):
+                        self._written[mac_address] = pending[mac_address]
+            except Exception:
+                # Merge back, keeping any newer timestamps recorded
+                # during the write
+                with self._lock:
+                    for mac_address, timestamp in pending.items():
+                        current = self._pending.get(mac_address)
+                        if current is None or current < timestamp:
+                            self._pending[mac_address] = timestamp
+                raise
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print("Failed to write device last access timestamps:", e,
+                      flush=True)
+
+    def start(self):
+        """Start the background flusher, does nothing if the buffering is
+           disabled
+        """
+        if self.interval == 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="last-access-flusher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background flusher and write the pending timestamps"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
@@ -4,7 +4,7 @@ from sqlalchemy import select, delete, desc
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from rdfm.schema.v1.updates import META_DEVICE_TYPE
+import server
 
 
 class PackagesDB:
@@ -76,12 +76,7 @@ class PackagesDB:
             with Session(self.engine) as session:
                 stmt = (
                     select(models.package.Package)
-                    .where(
-                        models.package.Package.info[
-                            META_DEVICE_TYPE
-                        ].as_string()
-                        == devtype
-                    )
+                    .where(models.package.device_type() == devtype)
                     .order_by(desc(models.package.Package.created))
                 )
                 packages = session.scalars(stmt)
@@ -106,6 +101,7 @@ class PackagesDB:
                 )
                 session.execute(stmt)
                 session.commit()
+                server.instance.package_graphs.invalidate_package(identifier)
                 return True
         except IntegrityError:
             # Constraint failed, the package is assigned to an existing group
@@ -0,0 +1,246 @@
+from typing import Optional, List
+import models.device
+import models.group
+import models.package
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+
+class UpdateCheckData:
+    """Represents all data required for performing an update check"""
+
+    """ The device requesting the update check """
+    device: models.device.Device
+    """ Active group of the device (None, if not assigned to any group) """
+    group: Optional[models.group.Group]
+    """ Packages assigned to the active group, ordered by identifier """
+    packages: List[models.package.Package]
+
+    def __init__(self, **kwargs) -> None:
+        for key in kwargs:
+            setattr(self, key, kwargs[key])
+
+
+class UpdatesDB:
+    """Wrapper class for loading the data used by update checks
+
+    Update checks are by far the most frequent requests made to the server,
+    so the data is loaded using as few queries as possible instead of going
+    through the generic per-entity wrappers.
+    """
+
+    engine: Engine
+
+    def __init__(self, db: Engine):
+        self.engine = db
+
+    def fetch_check_data(self, mac_address: str
+                         ) -> Optional[UpdateCheckData]:
+        """Fetches the device, its active group and the packages assigned
+           to the group
+
+        This uses exactly two queries in a single session: one joined query
+        for the device and its lowest-priority group (including the group
+        policy), and one for the assigned packages. Ties between groups of
+        the same priority are broken by the group identifier, as in
+        `DevicesDB.fetch_active_groups`.
+
+        Args:
+            mac_address: MAC address of the device
+
+        Returns:
+            None, if the device does not exist
+            UpdateCheckData, otherwise. If the device is not assigned to any
+            group, `group` is None and `packages` is empty.
+        """
+        with Session(self.engine) as session:
+            stmt = (
+                select(models.device.Device, models.group.Group)
+                .outerjoin(
+                    models.device.DeviceGroupAssignment,
+                    models.device.DeviceGroupAssignment.device_id ==
+                    models.device.Device.id,
+                )
+                .outerjoin(
+                    models.group.Group,
+                    models.group.Group.id ==
+                    models.device.DeviceGroupAssignment.group_id,
+                )
+                .where(models.device.Device.mac_address == mac_address)
+                .order_by(models.group.Group.priority, models.group.Group.id)
+                .limit(1)
+            )
+            row = session.execute(stmt).first()
+            if row is None:
+                return None
+            device, group = row
+
+            packages: List[models.package.Package] = []
+            if group is not None:
+                packages = list(session.scalars(
+                    select(models.package.Package)
+                    .join(
+                        models.group.GroupPackageAssignment,
+                        models.group.GroupPackageAssignment.package_id ==
+                        models.package.Package.id,
+                    )
+                    .where(
+                        models.group.GroupPackageAssignment.group_id ==
+                        group.id
+                    )
+                    .order_by(models.package.Package.id)
+                ))
+
+            return UpdateCheckData(
+                device=device, group=group, packages=packages
+            )
+
+    def fetch_check_data_bulk(self, mac_addresses: List[str]
+                              ) -> dict[str, UpdateCheckData]:
+        """Fetches the update check data of multiple devices at once
+
+        This uses exactly two queries regardless of the count of devices: one
+        for the devices and all of their groups, and one for the packages of
+        all active groups. Devices sharing an active group share the same
+        group object and package list.
+
+        Args:
+            mac_addresses: MAC addresses of the devices
+
+        Returns:
+            Dictionary of update check data keyed by MAC address. Devices
+            that do not exist are not present in the result.
+        """
+        result: dict[str, UpdateCheckData] = {}
+        if len(mac_addresses) == 0:
+            return result
+
+        with Session(self.engine) as session:
+            stmt = (
+                select(models.device.Device, models.group.Group)
+                .outerjoin(
+                    models.device.DeviceGroupAssignment,
+                    models.device.DeviceGroupAssignment.device_id ==
+                    models.device.Device.id,
+                )
+                .outerjoin(
+                    models.group.Group,
+                    models.group.Group.id ==
+                    models.device.DeviceGroupAssignment.group_id,
+                )
+                .where(
+                    models.device.Device.mac_address.in_(set(mac_addresses))
+                )
+                .order_by(
+                    models.device.Device.id,
+                    models.group.Group.priority,
+                    models.group.Group.id,
+                )
+            )
+            for device, group in session.execute(stmt):
+                # Rows of each device are ordered by the group priority and
+                # identifier, the first one contains the active group
+                if device.mac_address in result:
+                    continue
+                result[device.mac_address] = UpdateCheckData(
+                    device=device, group=group, packages=[]
+                )
+
+            groups = {
+                data.group.id: data.group
+                for data in result.values() if data.group is not None
+            }
+            packages: dict[int, List[models.package.Package]] = {
+                group: [] for group in groups
+            }
+            if len(groups) > 0:
+                rows = session.execute(
+                    select(
+                        models.group.GroupPackageAssignment.group_id,
+                        models.package.Package,
+                    )
+                    .join(
+                        models.package.Package,
+                        models.group.GroupPackageAssignment.package_id ==
+                        models.package.Package.id,
+                    )
+                    .where(
+                        models.group.GroupPackageAssignment.group_id.in_(
+                            groups.keys()
+                        )
+                    )
+                    .order_by(models.package.Package.id)
+                )
+                for group, package in rows:
+                    packages[group].append(package)
+
+            for data in result.values():
+                if data.group is not None:
+                    data.group = groups[data.group.id]
+                    data.packages = packages[data.group.id]
+            return result
+
+    def fetch_active_members(
+        self, group: int, mac_addresses: Optional[List[str]] = None
+    ) -> List[models.device.Device]:
+        """Fetches all devices for which the specified group is the active
+           group, i.e the group that is used during their update checks
+
+        Args:
+            group: group identifier
+            mac_addresses: optional, only consider the devices with the
+                           given MAC addresses
+        """
+        with Session(self.engine) as session:
+            members = (
+                select(models.device.DeviceGroupAssignment.device_id)
+                .where(models.device.DeviceGroupAssignment.group_id == group)
+            )
+            stmt = (
+                select(models.device.Device, models.group.Group.id)
+                .join(
+                    models.device.DeviceGroupAssignment,
+                    models.device.DeviceGroupAssignment.device_id ==
+                    models.device.Device.id,
+                )
+                .join(
+                    models.group.Group,
+                    models.group.Group.id ==
+                    models.device.DeviceGroupAssignment.group_id,
+                )
+                .where(models.device.Device.id.in_(members))
+            )
+            if mac_addresses is not None:
+                stmt = stmt.where(
+                    models.device.Device.mac_address.in_(mac_addresses)
+                )
+            stmt = stmt.order_by(
+                models.device.Device.id,
+                models.group.Group.priority,
+                models.group.Group.id,
+            )
+            result: List[models.device.Device] = []
+            seen: set[int] = set()
+            for device, active in session.execute(stmt):
+                # Rows of each device are ordered by the group priority and
+                # identifier, the first one contains the active group
+                if device.id in seen:
+                    continue
+                seen.add(device.id)
+                if active == group:
+                    result.append(device)
+            return result
+
+    def fetch_packages(self, identifiers: List[int]
+                       ) -> List[models.package.Package]:
+        """Fetches the specified packages, ordered by identifier
+
+        Packages that do not exist are not present in the result.
+        """
+        with Session(self.engine) as session:
+            return list(session.scalars(
+                select(models.package.Package)
+                .where(models.package.Package.id.in_(set(identifiers)))
+                .order_by(models.package.Package.id)
+            ))
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from device_mgmt.models.remote_device import RemoteDevice
 from device_mgmt.models.reverse_shell import ReverseShell
 from uuid import UUID
@@ -21,6 +21,14 @@ class RemoteDevices:
         """Get a device connection by MAC address"""
         return self._remote_devices.get(mac_address, None)
 
+    def connected(self) -> List[str]:
+        """Get the MAC addresses of all devices with an open connection"""
+        return [
+            mac_address
+            for mac_address, device in list(self._remote_devices.items())
+            if device.ws.connected
+        ]
+
 
 def _format_shell_key(mac_address: str, uuid: UUID) -> str:
     return f"{mac_address}_{uuid}"
@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """Thread-safe, bounded key/value cache with least-recently-used eviction
+
+    Cache lookups are counted, which allows monitoring how effective the
+    cache is (see `stats`).
+    """
+
+    capacity: int
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(self, capacity: int) -> None:
+        """Create an empty cache
+
+        Args:
+            capacity: maximum count of entries kept in the cache
+        """
+        if capacity <= 0:
+            raise ValueError("cache capacity must be greater than zero")
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """Get the value stored under the given key
+
+        Returns:
+            The cached value, or `default` if the key is not in the cache.
+            Pass a sentinel object as the default when `None` is a valid
+            cached value.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value in the cache, evicting the least recently used
+           entry if the cache is full
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable):
+        """Remove the given key from the cache, if present"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def remove_if(self, predicate: Callable[[Hashable], bool]):
+        """Remove all entries whose key matches the given predicate"""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self._entries.pop(key)
+
+    def clear(self):
+        """Remove all entries from the cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, float]:
+        """Returns the cache size, lookup counters and the hit rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -1,6 +1,6 @@
 from typing import Optional
-from sqlalchemy import ForeignKey
-from sqlalchemy import Text, DateTime
+from sqlalchemy import ForeignKey, Index
+from sqlalchemy import Text, DateTime, Integer
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
 import datetime
@@ -17,14 +17,28 @@ class Device(Base):
         DateTime, nullable=True
     )
     name: Mapped[str] = mapped_column(Text)
-    mac_address: Mapped[str] = mapped_column(Text)
+    mac_address: Mapped[str] = mapped_column(Text, unique=True, index=True)
     capabilities: Mapped[str] = mapped_column(Text)
     device_metadata: Mapped[str] = mapped_column(Text)
     public_key: Mapped[Optional[str]] = mapped_column(Text)
+    """ SHA256 digest of the canonical encoding of the device metadata,
+        None if unknown
+    """
+    metadata_hash: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    """ Incremented on every change of the device metadata """
+    metadata_revision: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
 
 
 class DeviceGroupAssignment(Base):
     __tablename__ = "devices_groups"
+    # The primary key only covers lookups by device, the index also
+    # contains the device so listing the members of a group does not
+    # read the table
+    __table_args__ = (
+        Index("ix_devices_groups_group_id", "group_id", "device_id"),
+    )
     device_id: Mapped[int] = mapped_column(
             ForeignKey(Device.id, ondelete="RESTRICT"),
             primary_key=True
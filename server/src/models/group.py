@@ -25,7 +25,10 @@ class GroupPackageAssignment(Base):
     group_id: Mapped[int] = mapped_column(
         ForeignKey(Group.id, ondelete="RESTRICT"), primary_key=True
     )
+    # Lookups by group use the primary key, lookups by package (e.g
+    # when checking the foreign key on package deletion) use the index
     package_id: Mapped[int] = mapped_column(
         ForeignKey(models.package.Package.id, ondelete="RESTRICT"),
         primary_key=True,
+        index=True,
     )
@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy import Text, DateTime
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
@@ -10,6 +10,14 @@ from models.device import Device
 
 class Log(Base):
     __tablename__ = "logs"
+    # Logs are filtered by the device and/or name, and always ordered by
+    # the device timestamp
+    __table_args__ = (
+        Index("ix_logs_device_id_device_timestamp",
+              "device_id", "device_timestamp"),
+        Index("ix_logs_name_device_timestamp", "name", "device_timestamp"),
+        Index("ix_logs_device_timestamp", "device_timestamp"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     created: Mapped[datetime.datetime] = mapped_column(DateTime)
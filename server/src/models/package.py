@@ -1,9 +1,48 @@
 from typing import Any
-from sqlalchemy import Text, DateTime, JSON
+from sqlalchemy import Text, DateTime, JSON, Index, String
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.sql.visitors import InternalTraversal
 import datetime
 import models.base
+from rdfm.schema.v1.updates import META_DEVICE_TYPE
+
+
+class json_text(FunctionElement):
+    """Text value of a key of a JSON column
+
+    Unlike indexing the column (`Package.info[key].as_string()`), the key
+    is rendered as a literal instead of a bound parameter. This allows
+    creating an expression index that queries using the same expression
+    can make use of.
+    """
+    type = Text()
+    inherit_cache = True
+    # The key is part of the statement cache key, as it's rendered as a
+    # literal; otherwise statements differing only in the key would share
+    # the compiled SQL
+    _traverse_internals = [
+        ("clauses", InternalTraversal.dp_clauseelement),
+        ("key", InternalTraversal.dp_string),
+    ]
+
+    def __init__(self, column, key: str) -> None:
+        self.key = key
+        super().__init__(column)
+
+
+@compiles(json_text, "sqlite")
+def _json_text_sqlite(element, compiler, **kw):
+    path = compiler.render_literal_value(f'$."{element.key}"', String())
+    return f"json_extract({compiler.process(element.clauses, **kw)}, {path})"
+
+
+@compiles(json_text, "postgresql")
+def _json_text_postgresql(element, compiler, **kw):
+    key = compiler.render_literal_value(element.key, String())
+    return f"({compiler.process(element.clauses, **kw)} ->> {key})"
 
 
 class Package(models.base.Base):
@@ -14,3 +53,14 @@ class Package(models.base.Base):
     driver: Mapped[str] = mapped_column(Text)
     sha256: Mapped[str] = mapped_column(Text)
     info: Mapped[dict[str, Any]] = mapped_column(JSON)
+
+    # Packages compatible with a device type, most recent first
+    __table_args__ = (
+        Index("ix_packages_devtype_created",
+              json_text(info, META_DEVICE_TYPE), created),
+    )
+
+
+def device_type():
+    """Device type of the package, as an expression matching the index"""
+    return json_text(Package.info, META_DEVICE_TYPE)
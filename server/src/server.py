@@ -1,26 +1,78 @@
-from typing import Optional
+import atexit
+from typing import Optional, Union
 from database.devices import DevicesDB
 from database.packages import PackagesDB
 from database.groups import GroupsDB
 from database.registrations import RegistrationsDB
 from database.logs import LogsDB
+from database.updates import UpdatesDB
+from database.last_access import LastAccessBuffer
 import database.db
 import configuration
 from device_mgmt.containers import RemoteDevices, ShellSessions
+from update.cache import PackageGraphCache, PolicyCache, DecisionCache
+import update.costs
+from update.admission import AdmissionController
+from auth.introspection import TokenIntrospector
+from auth.jwks import JWKSValidator
 import datetime
 from models.device import Device
 
 
 class Server:
     def __init__(self, config: configuration.ServerConfig):
-        self.db = database.db.create(config.db_conn)
+        self.db = database.db.create(
+            config.db_conn,
+            database.db.PROFILES[config.db_profile].with_overrides(
+                **config.db_overrides
+            ),
+        )
         self._devices_db: DevicesDB = DevicesDB(self.db)
         self._packages_db: PackagesDB = PackagesDB(self.db)
         self._groups_db: GroupsDB = GroupsDB(self.db)
         self._registrations_db: RegistrationsDB = RegistrationsDB(self.db)
         self._logs_db: LogsDB = LogsDB(self.db)
+        self._updates_db: UpdatesDB = UpdatesDB(self.db)
         self.remote_devices = RemoteDevices()
         self.shell_sessions = ShellSessions()
+        self.last_access = LastAccessBuffer(
+            self._devices_db,
+            config.last_access_flush_interval,
+            self.remote_devices.connected,
+        )
+        self.last_access.start()
+        atexit.register(self.last_access.stop)
+        self.package_graphs = PackageGraphCache(
+            update.costs.create(config.update_cost)
+        )
+        self.group_policies = PolicyCache()
+        self.update_decisions = DecisionCache()
+        self.admission = AdmissionController(
+            config.admission_max_per_package,
+            config.admission_max_per_driver,
+            config.admission_max_global,
+            config.admission_lease_time,
+        )
+        # Validates management API tokens, either by introspecting them or
+        # locally using the key set of the authorization server
+        self.token_validator: Optional[
+            Union[TokenIntrospector, JWKSValidator]
+        ]
+        if config.disable_api_auth:
+            self.token_validator = None
+        elif config.token_jwks_url is not None:
+            self.token_validator = JWKSValidator(
+                config.token_jwks_url,
+                config.token_issuer,
+                config.token_audience,
+            )
+        else:
+            self.token_validator = TokenIntrospector(
+                config.token_introspection_url,
+                config.token_introspection_client_id,
+                config.token_introspection_client_secret,
+                config.token_introspection_cache_ttl,
+            )
 
     def create_mock_data(self):
         """Creates mock data
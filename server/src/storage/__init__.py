@@ -1,18 +1,18 @@
-from typing import Optional
+import threading
+from typing import Any, Optional, Tuple
 import storage.local
 import storage.s3
 import configuration
 
 
-def driver_by_name(
+""" Driver instances, keyed by the driver name """
+_drivers: dict[str, Tuple[configuration.ServerConfig, Any]] = {}
+_drivers_lock = threading.Lock()
+
+
+def _create_driver(
     name: str, config: configuration.ServerConfig
 ) -> Optional[storage.local.LocalStorage]:
-    """Gets a storage driver given by the name
-
-    Storage drivers abstract away the file handling part of artifact storage.
-    All storage drivers are expected to store their metadata inside a
-    dictionary.
-    """
     match name:
         case "local":
             return storage.local.LocalStorage(config)
@@ -20,3 +20,28 @@ def driver_by_name(
             return storage.s3.S3Storage(config)
         case _:
             return None
+
+
+def driver_by_name(
+    name: str, config: configuration.ServerConfig
+) -> Optional[storage.local.LocalStorage]:
+    """Gets a storage driver given by the name
+
+    Storage drivers abstract away the file handling part of artifact storage.
+    All storage drivers are expected to store their metadata inside a
+    dictionary.
+
+    Drivers are long-lived: the instance created on first use is returned
+    for all subsequent calls with the same configuration, so that clients
+    (and their connection pools) and other driver state are not recreated
+    on every request.
+    """
+    with _drivers_lock:
+        entry = _drivers.get(name)
+        if entry is not None and entry[0] is config:
+            return entry[1]
+
+        driver = _create_driver(name, config)
+        if driver is not None:
+            _drivers[name] = (config, driver)
+        return driver
@@ -1,22 +1,36 @@
 import uuid
 import os
+import time
 import configuration
 import boto3
 import boto3.session
 from botocore.exceptions import ClientError
 from botocore.config import Config
+from lru_cache import LRUCache
 
 
 META_S3_UUID = "rdfm.storage.s3.uuid"
 META_S3_SIZE = "rdfm.storage.s3.size"
 META_S3_DIRECTORY = "rdfm.storage.s3.directory"
 
+""" Maximum count of connections kept open by the S3 client """
+S3_MAX_POOL_CONNECTIONS = 32
+
+""" Presigned URLs are handed out until this many seconds before they expire
+    (or until half of their lifetime has passed, for short-lived URLs)
+"""
+PRESIGNED_URL_SAFETY_MARGIN = 300
+
+""" Maximum count of cached presigned URLs """
+PRESIGNED_URL_CACHE_SIZE = 4096
+
 
 class S3Storage:
     """Storage driver for storing packages on S3"""
 
     client: boto3.session.Session.client
     bucket: str
+    urls: LRUCache
 
     def __init__(self, config: configuration.ServerConfig) -> None:
         """Initialize the S3 storage driver
@@ -39,11 +53,15 @@ class S3Storage:
         client_config = Config(
             signature_version="s3v4" if config.s3_use_v4_signature else None,
             region_name=config.s3_region_name,
+            max_pool_connections=S3_MAX_POOL_CONNECTIONS,
         )
 
         kwargs["config"] = client_config
 
         self.client = boto3.client("s3", **kwargs)
+        # Presigned URLs by (object path, expiry). Each entry contains the
+        # URL and the time after which it can no longer be handed out.
+        self.urls = LRUCache(PRESIGNED_URL_CACHE_SIZE)
 
     @staticmethod
     def get_object_path(bucket_directory: str | None, object_id: str) -> str:
@@ -94,7 +112,12 @@ class S3Storage:
             return False
 
     def generate_url(self, metadata: dict[str, str], expiry: int) -> str:
-        """Generate a signed URL to the package specified by `metadata`"""
+        """Generate a signed URL to the package specified by `metadata`
+
+        Signed URLs are cached and reused for subsequent calls, as long as
+        they remain valid for at least `PRESIGNED_URL_SAFETY_MARGIN` seconds
+        (or half of `expiry`, whichever is smaller).
+        """
         try:
             # This shouldn't happen
             object_id = metadata.get(META_S3_UUID, None)
@@ -104,17 +127,24 @@ class S3Storage:
                     META_S3_UUID,
                 )
             bucket_directory = metadata.get(META_S3_DIRECTORY, None)
+            path = S3Storage.get_object_path(bucket_directory, object_id)
+
+            now = time.time()
+            cached = self.urls.get((path, expiry))
+            if cached is not None and now < cached[1]:
+                return cached[0]
 
-            return self.client.generate_presigned_url(
+            url = self.client.generate_presigned_url(
                 "get_object",
                 Params={
                     "Bucket": self.bucket,
-                    "Key": S3Storage.get_object_path(
-                        bucket_directory, object_id
-                    ),
+                    "Key": path,
                 },
                 ExpiresIn=expiry,
             )
+            margin = min(PRESIGNED_URL_SAFETY_MARGIN, expiry // 2)
+            self.urls.put((path, expiry), (url, now + expiry - margin))
+            return url
         except ClientError as e:
             print("Failed to generate presigned S3 link:", e, flush=True)
             raise
@@ -132,10 +162,12 @@ class S3Storage:
                 )
                 return
             bucket_directory = metadata.get(META_S3_DIRECTORY, None)
+            path = S3Storage.get_object_path(bucket_directory, object_id)
 
+            self.urls.remove_if(lambda key: key[0] == path)
             self.client.delete_object(
                 Bucket=self.bucket,
-                Key=S3Storage.get_object_path(bucket_directory, object_id),
+                Key=path,
             )
         except ClientError as e:
             print("Failed deleting package object from S3:", e, flush=True)
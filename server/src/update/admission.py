@@ -0,0 +1,150 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class AdmissionController:
+    """Limits the count of concurrently issued package download grants
+
+    Every update check that hands out a package link takes a lease on the
+    download, which expires after a fixed time. The count of active leases
+    is capped per package, per storage driver and globally. Devices that
+    would exceed any of the caps are asked to retry later instead, which
+    spreads the downloads of a newly released package over time.
+
+    A device that polls again while holding a lease on the same package
+    keeps (and renews) its lease, so repeated update checks never count
+    twice against the caps.
+    """
+
+    """ Maximum active leases for a single package, 0 for no limit """
+    max_per_package: int
+    """ Maximum active leases for packages of a single storage driver,
+        0 for no limit
+    """
+    max_per_driver: int
+    """ Maximum active leases in total, 0 for no limit """
+    max_global: int
+    """ Time after which a lease expires, in seconds """
+    lease_time: int
+
+    def __init__(
+        self,
+        max_per_package: int = 0,
+        max_per_driver: int = 0,
+        max_global: int = 0,
+        lease_time: int = 600,
+    ) -> None:
+        self.max_per_package = max_per_package
+        self.max_per_driver = max_per_driver
+        self.max_global = max_global
+        self.lease_time = lease_time
+        # Active leases by (device, package), ordered by their expiry time.
+        # Each value contains the expiry time and the storage driver.
+        self._leases: OrderedDict[
+            Tuple[str, int], Tuple[float, str]
+        ] = OrderedDict()
+        # Keys of the leases counted toward each package and driver cap,
+        # ordered by their expiry time as well
+        self._per_package: dict[
+            int, OrderedDict[Tuple[str, int], None]
+        ] = {}
+        self._per_driver: dict[
+            str, OrderedDict[Tuple[str, int], None]
+        ] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Is any of the caps configured?"""
+        return (
+            self.max_per_package > 0 or
+            self.max_per_driver > 0 or
+            self.max_global > 0
+        )
+
+    def _expire(self, now: float):
+        while len(self._leases) > 0:
+            (device, package), (expires, _) = next(
+                iter(self._leases.items())
+            )
+            if expires > now:
+                break
+            self._release(device, package)
+
+    def _release(self, device: str, package: int):
+        key = (device, package)
+        _, driver = self._leases.pop(key)
+        for counted, group in [(self._per_package, package),
+                               (self._per_driver, driver)]:
+            del counted[group][key]
+            if len(counted[group]) == 0:
+                del counted[group]
+
+    def _earliest_expiry(self, leases) -> float:
+        """Expiry time of the first lease of the given ordered keys"""
+        expires, _ = self._leases[next(iter(leases))]
+        return expires
+
+    def acquire(self, device: str, package: int, driver: str,
+                now: Optional[float] = None) -> Optional[int]:
+        """Attempts to take a download lease for a package
+
+        Args:
+            device: MAC address of the device downloading the package
+            package: package identifier
+            driver: storage driver of the package
+            now: optional, current time (defaults to `time.time()`)
+
+        Returns:
+            None, if the download was admitted
+            int, otherwise: time in seconds after which the device should
+            retry the update check
+        """
+        if not self.enabled:
+            return None
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            self._expire(now)
+            key = (device, package)
+            if key in self._leases:
+                # Renew the lease of the device, the driver of a package
+                # does not change
+                _, driver = self._leases[key]
+                self._leases[key] = (now + self.lease_time, driver)
+                self._leases.move_to_end(key)
+                self._per_package[package].move_to_end(key)
+                self._per_driver[driver].move_to_end(key)
+                return None
+
+            # Expiry times of the oldest leases counted toward each of the
+            # exceeded caps, the download can only be admitted once all of
+            # them have expired
+            package_leases = self._per_package.get(package, {})
+            driver_leases = self._per_driver.get(driver, {})
+            blocking = []
+            if (self.max_per_package > 0 and
+                    len(package_leases) >= self.max_per_package):
+                blocking.append(self._earliest_expiry(package_leases))
+            if (self.max_per_driver > 0 and
+                    len(driver_leases) >= self.max_per_driver):
+                blocking.append(self._earliest_expiry(driver_leases))
+            if self.max_global > 0 and len(self._leases) >= self.max_global:
+                blocking.append(self._earliest_expiry(self._leases))
+            if len(blocking) > 0:
+                return max(1, math.ceil(max(blocking) - now))
+
+            self._leases[key] = (now + self.lease_time, driver)
+            self._per_package.setdefault(package, OrderedDict())[key] = None
+            self._per_driver.setdefault(driver, OrderedDict())[key] = None
+            return None
+
+    def active(self) -> int:
+        """Returns the count of active leases"""
+        with self._lock:
+            self._expire(time.time())
+            return len(self._leases)
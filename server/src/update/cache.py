@@ -0,0 +1,206 @@
+import hashlib
+import threading
+from typing import Any, List, Optional, Tuple
+import models.package
+from lru_cache import LRUCache
+from rdfm.schema.v1.updates import META_DEVICE_TYPE, META_SOFT_VER
+from update.costs import CostFunction, cost_bytes
+from update.policies.base import BasePolicy
+import update.policy
+from update.resolver import PackageGraph
+
+""" Maximum count of memoized update decisions """
+DECISION_CACHE_SIZE = 65536
+
+
+class PackageGraphCache:
+    """Server-side cache of package upgrade graphs
+
+    Building the upgrade graph of a group is O(n^2) in the count of packages
+    assigned to the group, so the graph is built once for every group and
+    reused in all update checks of devices in that group.
+    Each cached graph is tagged with the identifiers of the packages it was
+    built from, so a graph is never used for a different package assignment
+    even if an invalidation was missed.
+    """
+
+    _graphs: dict[int, Tuple[Tuple[int, ...], PackageGraph]]
+    _lock: threading.Lock
+    cost: CostFunction
+
+    def __init__(self, cost: CostFunction = cost_bytes) -> None:
+        """Create an empty cache
+
+        Args:
+            cost: cost function used for the edges of the built graphs
+        """
+        self._graphs = {}
+        self._lock = threading.Lock()
+        self.cost = cost
+
+    def get(self, group: int, packages: List[models.package.Package]
+            ) -> PackageGraph:
+        """Get the upgrade graph of a group, building it when necessary
+
+        Args:
+            group: group identifier
+            packages: packages currently assigned to the group. Edges of the
+                      returned graph refer to the packages by their index in
+                      this list.
+        """
+        key = tuple(package.id for package in packages)
+        with self._lock:
+            entry = self._graphs.get(group)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        # Build outside of the lock, as this may take a while. Concurrent
+        # update checks may end up building the same graph, which is harmless.
+        graph = PackageGraph(
+            [package.info for package in packages], self.cost
+        )
+        with self._lock:
+            self._graphs[group] = (key, graph)
+        return graph
+
+    def invalidate(self, group: int):
+        """Drop the cached graph of the specified group"""
+        with self._lock:
+            self._graphs.pop(group, None)
+
+    def invalidate_package(self, package: int):
+        """Drop all cached graphs that were built using the specified package
+        """
+        with self._lock:
+            for group in [
+                group for group, (key, _) in self._graphs.items()
+                if package in key
+            ]:
+                self._graphs.pop(group)
+
+
+class PolicyCache:
+    """Server-side cache of compiled group policies
+
+    Compiling a policy string parses its arguments, which only has to happen
+    once for every policy assigned to a group. Compiled policies are
+    immutable, so a single policy object is shared by all update checks of
+    devices in the group.
+    Each cached policy is tagged with the policy string it was compiled
+    from, so a policy is never used for a different policy string even if an
+    invalidation was missed.
+    """
+
+    _policies: dict[int, Tuple[str, BasePolicy]]
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self._policies = {}
+        self._lock = threading.Lock()
+
+    def get(self, group: int, policy_str: str) -> BasePolicy:
+        """Get the compiled policy of a group, compiling it when necessary
+
+        Args:
+            group: group identifier
+            policy_str: policy string currently assigned to the group
+
+        Throws:
+            RuntimeError: the policy string is invalid
+        """
+        with self._lock:
+            entry = self._policies.get(group)
+        if entry is not None and entry[0] == policy_str:
+            return entry[1]
+
+        policy = update.policy.create(policy_str)
+        with self._lock:
+            self._policies[group] = (policy_str, policy)
+        return policy
+
+    def invalidate(self, group: int):
+        """Drop the cached policy of the specified group"""
+        with self._lock:
+            self._policies.pop(group, None)
+
+
+class DecisionCache:
+    """Memoized results of update checks
+
+    The result of an update check is fully determined by the package
+    assignment of the group, the target version evaluated from the group
+    policy and the subset of device metadata that is inspected during
+    resolution (device type, software version and the keys referenced in
+    `requires:` clauses of the assigned packages). Fleets of devices that
+    run identical software and poll the server repeatedly map to the same
+    key, so the resolver only has to run once per distinct key.
+    """
+
+    _decisions: LRUCache
+
+    """ Marker for keys that are not present in the cache """
+    _MISSING = object()
+
+    def __init__(self, capacity: int = DECISION_CACHE_SIZE) -> None:
+        self._decisions = LRUCache(capacity)
+
+    @staticmethod
+    def make_key(
+        group: int,
+        packages: List[models.package.Package],
+        graph: PackageGraph,
+        target: Optional[str],
+        device_meta: dict[str, Any],
+    ) -> Tuple:
+        """Creates the memoization key of an update check
+
+        Args:
+            group: identifier of the active group of the device
+            packages: packages assigned to the group, `graph` must be the
+                      upgrade graph of exactly these packages
+            graph: upgrade graph of the assigned packages
+            target: target version evaluated from the group policy
+            device_meta: metadata reported by the device
+        """
+        keys = graph.index.required_keys | {META_DEVICE_TYPE, META_SOFT_VER}
+        projected = tuple(sorted(
+            (key, repr(device_meta[key]))
+            for key in keys if key in device_meta
+        ))
+        return (
+            group,
+            tuple(package.id for package in packages),
+            target,
+            projected,
+        )
+
+    @staticmethod
+    def etag(key: Tuple) -> str:
+        """Returns the entity tag of the update check response for the
+           given key
+        """
+        return hashlib.sha256(repr(key).encode()).hexdigest()[:32]
+
+    def get(self, key: Tuple) -> Tuple[bool, Optional[int]]:
+        """Looks up a memoized decision
+
+        Returns:
+            Tuple (found, decision), where decision is the index of the next
+            package to install, or None if no update is available
+        """
+        decision = self._decisions.get(key, DecisionCache._MISSING)
+        if decision is DecisionCache._MISSING:
+            return (False, None)
+        return (True, decision)
+
+    def put(self, key: Tuple, decision: Optional[int]):
+        """Memoizes a decision"""
+        self._decisions.put(key, decision)
+
+    def invalidate(self, group: int):
+        """Drop all decisions memoized for the specified group"""
+        self._decisions.remove_if(lambda key: key[0] == group)
+
+    def stats(self) -> dict[str, float]:
+        """Returns the size, hit/miss counters and hit rate of the cache"""
+        return self._decisions.stats()
@@ -0,0 +1,83 @@
+from typing import Callable, Optional
+
+
+""" Cost function type, returns the cost of installing the package described
+    by the given metadata. Costs must be positive integers, the package
+    graph raises lower costs to 1.
+"""
+CostFunction = Callable[[dict[str, str]], int]
+
+""" Metadata keys containing the size of the stored package, in bytes,
+    for each storage driver
+"""
+PACKAGE_SIZE_KEYS = ["rdfm.storage.local.length", "rdfm.storage.s3.size"]
+
+""" Size assumed for packages without size metadata, in bytes. This is
+    intentionally large, so that packages of a known size are preferred.
+"""
+UNKNOWN_PACKAGE_SIZE = 2**31
+
+""" Assumed download throughput of a device, in bytes per second """
+ESTIMATED_DOWNLOAD_RATE = 1024 * 1024
+
+""" Assumed time taken by installing a package and rebooting the device,
+    excluding the download, in milliseconds
+"""
+ESTIMATED_INSTALL_OVERHEAD = 60 * 1000
+
+
+def package_size(metadata: dict[str, str]) -> Optional[int]:
+    """Returns the size of the stored package in bytes, or None if the
+       package metadata does not contain the size
+    """
+    for key in PACKAGE_SIZE_KEYS:
+        if key not in metadata:
+            continue
+        try:
+            return int(metadata[key])
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def cost_hops(metadata: dict[str, str]) -> int:
+    """Every package has the same cost, the paths with the fewest
+       packages are preferred
+    """
+    return 1
+
+
+def cost_bytes(metadata: dict[str, str]) -> int:
+    """The cost is the size of the package, the paths transferring the
+       fewest bytes are preferred
+    """
+    size = package_size(metadata)
+    if size is None:
+        size = UNKNOWN_PACKAGE_SIZE
+    return max(size, 1)
+
+
+def cost_install_time(metadata: dict[str, str]) -> int:
+    """The cost is the estimated time of downloading and installing the
+       package (in milliseconds), the fastest paths are preferred
+    """
+    size = package_size(metadata)
+    if size is None:
+        size = UNKNOWN_PACKAGE_SIZE
+    return ESTIMATED_INSTALL_OVERHEAD + size * 1000 // ESTIMATED_DOWNLOAD_RATE
+
+
+def create(name: str) -> CostFunction:
+    """Gets the cost function given by the name
+
+    The valid names should match `configuration.ALLOWED_UPDATE_COSTS`.
+    """
+    match name:
+        case "bytes":
+            return cost_bytes
+        case "hops":
+            return cost_hops
+        case "install_time":
+            return cost_install_time
+        case _:
+            raise RuntimeError(f"invalid update cost function: '{name}'")
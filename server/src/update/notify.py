@@ -0,0 +1,95 @@
+import json
+from typing import List, Tuple
+import server
+from device_mgmt.models.remote_device import RemoteDevice
+from rdfm.schema.v1.updates import META_DEVICE_TYPE, META_SOFT_VER
+from rdfm.ws import WebSocketException, can_handle_request
+from request_models import UpdateAvailable
+from update.cache import DecisionCache
+from update.resolver import PackageResolver
+
+
+def notify_group(group: int) -> int:
+    """Notifies connected devices of the group about available updates
+
+    This should be called after the packages or the policy of a group were
+    modified. Each device for which the group is the active group, that is
+    connected to the management WebSocket and advertises the
+    `update_available` capability, receives an `update_available` request
+    if an update is now available to it. Devices whose stored metadata is
+    not sufficient to resolve an update are always notified, the update
+    check they perform decides whether they receive a package.
+
+    Notifications are only a hint for the device to check for updates
+    sooner, delivery failures are ignored.
+
+    Args:
+        group: group identifier
+
+    Returns:
+        Count of notified devices
+    """
+    # Start from the connected devices, which are usually far fewer than
+    # the members of the group, and only load the rows of those
+    remotes: dict[str, RemoteDevice] = {}
+    for mac_address in server.instance.remote_devices.connected():
+        remote = server.instance.remote_devices.get(mac_address)
+        if remote is None:
+            continue
+        if not can_handle_request(remote.capabilities, "update_available"):
+            continue
+        remotes[mac_address] = remote
+    if len(remotes) == 0:
+        return 0
+
+    connected: List[Tuple[RemoteDevice, dict[str, str]]] = []
+    members = server.instance._updates_db.fetch_active_members(
+        group, list(remotes)
+    )
+    for device in members:
+        connected.append(
+            (remotes[device.mac_address], json.loads(device.device_metadata))
+        )
+    # Don't bother resolving anything when no device can be notified
+    if len(connected) == 0:
+        return 0
+
+    model = server.instance._groups_db.fetch_one(group)
+    if model is None:
+        return 0
+    try:
+        policy = server.instance.group_policies.get(group, model.policy)
+    except RuntimeError:
+        return 0
+    packages = server.instance._groups_db.fetch_assigned_data(group)
+    if len(packages) == 0:
+        return 0
+    graph = server.instance.package_graphs.get(group, packages)
+
+    notified = 0
+    decisions: DecisionCache = server.instance.update_decisions
+    for remote, device_meta in connected:
+        if (META_DEVICE_TYPE in device_meta and
+                META_SOFT_VER in device_meta):
+            # Share the memoized decisions with the update check endpoint
+            target_version = policy.evaluate(device_meta, graph.versions)
+            key = DecisionCache.make_key(
+                group, packages, graph, target_version, device_meta
+            )
+            found, index = decisions.get(key)
+            if not found:
+                resolver = PackageResolver(
+                    device_meta, graph.packages, policy, graph
+                )
+                index = resolver.resolve_target(target_version)
+                decisions.put(key, index)
+            if index is None:
+                continue
+
+        try:
+            remote.send_message(UpdateAvailable())
+            notified += 1
+        except WebSocketException as e:
+            print("Notifying device", remote.token.device_id,
+                  "about an update failed:", e.message, flush=True)
+    return notified
@@ -1,16 +1,26 @@
 from typing import Optional
+from update.versions import VersionIndex
 
 
 class BasePolicy():
+    """ Base class of update policies
+
+    Policies are compiled once from the policy string of a group and then
+    shared by all update checks of the group's devices, so a policy must not
+    modify its state in `evaluate`.
+    """
     def __init__(self, args) -> None:
         pass
 
-    def evaluate(self, metadata: dict[str, str]) -> Optional[str]:
+    def evaluate(self, metadata: dict[str, str],
+                 versions: Optional[VersionIndex] = None) -> Optional[str]:
         """ Evaluate the result of applying the given policy
             on a specified device
 
         Args:
             metadata: device metadata
+            versions: optional, index of the versions provided by the
+                      packages assigned to the group
 
         Returns:
             None, if the policy indicates no specific version for this device
@@ -1,5 +1,6 @@
 from typing import Optional
 from update.policies.base import BasePolicy
+from update.versions import VersionIndex
 
 
 class ExactMatch(BasePolicy):
@@ -15,5 +16,6 @@ class ExactMatch(BasePolicy):
     def __init__(self, args) -> None:
         self.version = args
 
-    def evaluate(self, metadata: dict[str, str]) -> Optional[str]:
+    def evaluate(self, metadata: dict[str, str],
+                 versions: Optional[VersionIndex] = None) -> Optional[str]:
         return self.version
@@ -0,0 +1,46 @@
+from typing import Optional
+from rdfm.schema.v1.updates import META_DEVICE_TYPE, META_SOFT_VER
+from update.policies.base import BasePolicy
+import update.versions
+from update.versions import VersionIndex, VersionKey
+
+
+class LatestCompatible(BasePolicy):
+    """ Latest compatible policy - always update to the newest version
+        available for the device type
+
+    This policy takes in a single argument: the comparator used for ordering
+    the software versions of the packages assigned to the group. Accepted
+    comparators are `semver` (Semantic Versioning precedence), `numeric`
+    (dot-separated numbers, compared component-wise) and `lexical` (plain
+    string comparison). Versions that cannot be ordered using the comparator
+    are ignored.
+
+    Example: `latest_compatible,semver`
+
+    The server will attempt to update every device within the group to the
+    newest version provided by the packages matching the device type.
+    Devices already running the newest version, or a newer one, are not
+    updated. The same applies to devices whose current version cannot be
+    ordered using the comparator.
+    """
+    comparator: str
+    key: VersionKey
+
+    def __init__(self, args) -> None:
+        self.comparator = args
+        self.key = update.versions.create(args)
+
+    def evaluate(self, metadata: dict[str, str],
+                 versions: Optional[VersionIndex] = None) -> Optional[str]:
+        if (versions is None or META_DEVICE_TYPE not in metadata or
+                META_SOFT_VER not in metadata):
+            return None
+        latest = versions.latest(metadata[META_DEVICE_TYPE], self.key)
+        if latest is None:
+            return None
+        current = self.key(metadata[META_SOFT_VER])
+        # Never downgrade devices that are ahead of the assigned packages
+        if current is None or current >= self.key(latest):
+            return None
+        return latest
@@ -1,5 +1,6 @@
 from typing import Optional
 from update.policies.base import BasePolicy
+from update.versions import VersionIndex
 
 
 class NoUpdate(BasePolicy):
@@ -13,5 +14,6 @@ class NoUpdate(BasePolicy):
     def __init__(self, args) -> None:
         pass
 
-    def evaluate(self, metadata: dict[str, str]) -> Optional[str]:
+    def evaluate(self, metadata: dict[str, str],
+                 versions: Optional[VersionIndex] = None) -> Optional[str]:
         return None
@@ -0,0 +1,97 @@
+import bisect
+import datetime
+import hashlib
+import time
+from typing import List, Optional, Tuple
+from rdfm.schema.v1.updates import META_MAC_ADDRESS
+from update.policies.base import BasePolicy
+from update.versions import VersionIndex
+
+
+""" Count of buckets devices are distributed into, this allows specifying
+    the rollout percentage with a precision of 0.01%
+"""
+ROLLOUT_BUCKETS = 10000
+
+
+class StagedRollout(BasePolicy):
+    """ Staged rollout policy - update a growing fraction of the group to the
+        specified software version
+
+    This policy takes in the target software version, followed by one or
+    more rollout steps, separated by commas. Each step is written as
+    `<percent>@<timestamp>`, and specifies the percentage of devices in the
+    group that should be updated starting from the given time (ISO 8601
+    format, UTC is assumed if no timezone is given). The timestamp can be
+    omitted, in which case the step applies immediately.
+
+    Example: `staged_rollout,v2,5,25@2024-06-01T12:00:00,100@2024-06-03`
+
+    Each device is assigned to a stable bucket derived from its MAC address
+    and the target version, so the set of updated devices only ever grows as
+    the percentage is increased. Devices outside of the admitted fraction
+    are treated as up-to-date.
+    """
+    version: str
+    steps: List[Tuple[float, int]]
+
+    def __init__(self, args) -> None:
+        parts = args.split(",")
+        self.version = parts[0]
+        if len(self.version) == 0:
+            raise RuntimeError("staged rollout requires a target version")
+        if len(parts) < 2:
+            raise RuntimeError("staged rollout requires at least one step")
+
+        # Steps as (start timestamp, admitted bucket count)
+        self.steps = []
+        for step in parts[1:]:
+            percent, _, start = step.partition("@")
+            try:
+                percent = float(percent)
+            except ValueError:
+                raise RuntimeError(f"invalid rollout percentage: '{step}'")
+            if not 0 <= percent <= 100:
+                raise RuntimeError(f"invalid rollout percentage: '{step}'")
+
+            timestamp = float("-inf")
+            if len(start) > 0:
+                try:
+                    when = datetime.datetime.fromisoformat(start)
+                except ValueError:
+                    raise RuntimeError(f"invalid rollout timestamp: '{step}'")
+                if when.tzinfo is None:
+                    when = when.replace(tzinfo=datetime.timezone.utc)
+                timestamp = when.timestamp()
+
+            if len(self.steps) > 0 and timestamp <= self.steps[-1][0]:
+                raise RuntimeError(
+                    "rollout steps must be given in chronological order"
+                )
+            self.steps.append(
+                (timestamp, round(percent * ROLLOUT_BUCKETS / 100))
+            )
+        self._starts = [start for start, _ in self.steps]
+
+    def admitted_at(self, timestamp: float) -> int:
+        """ Returns the count of buckets admitted at the given time """
+        step = bisect.bisect_right(self._starts, timestamp) - 1
+        if step < 0:
+            return 0
+        return self.steps[step][1]
+
+    def bucket(self, mac_address: str) -> int:
+        """ Returns the stable rollout bucket of the given device """
+        digest = hashlib.sha256(
+            f"{self.version}/{mac_address}".encode()
+        ).digest()
+        return int.from_bytes(digest[:8], "big") % ROLLOUT_BUCKETS
+
+    def evaluate(self, metadata: dict[str, str],
+                 versions: Optional[VersionIndex] = None) -> Optional[str]:
+        if META_MAC_ADDRESS not in metadata:
+            return None
+        admitted = self.admitted_at(time.time())
+        if self.bucket(metadata[META_MAC_ADDRESS]) >= admitted:
+            return None
+        return self.version
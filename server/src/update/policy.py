@@ -1,11 +1,17 @@
 from typing import Type
 from update.policies.exact_match import ExactMatch
+from update.policies.latest_compatible import LatestCompatible
 from update.policies.base import BasePolicy
 from update.policies.no_update import NoUpdate
+from update.policies.staged_rollout import StagedRollout
 
 
 def create(policy_str: str) -> Type[BasePolicy]:
-    """Parses a given policy string and creates an associated policy object."""
+    """Parses a given policy string and creates an associated policy object.
+
+    Update checks should use the compiled policies cached in
+    `server.instance.group_policies` instead of calling this directly.
+    """
     parts = policy_str.split(",", 1)
     if len(parts) != 2:
         raise RuntimeError("invalid policy string, missing arguments")
@@ -18,5 +24,9 @@ def create(policy_str: str) -> Type[BasePolicy]:
             return NoUpdate(args)
         case "exact_match":
             return ExactMatch(args)
+        case "staged_rollout":
+            return StagedRollout(args)
+        case "latest_compatible":
+            return LatestCompatible(args)
         case _:
             raise RuntimeError(f"invalid policy type: '{policy}'")
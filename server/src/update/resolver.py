@@ -1,7 +1,10 @@
-from typing import List, Optional, Type
-import networkx as nx
+import heapq
+import threading
+from typing import Any, List, Optional, Tuple, Type
 from rdfm.schema.v1.updates import META_DEVICE_TYPE, META_SOFT_VER
+from update.costs import CostFunction, cost_bytes
 from update.policies.base import BasePolicy
+from update.versions import VersionIndex
 
 
 def requirements_satisfied(base: dict[str, str], update: dict[str, str]
@@ -38,16 +41,311 @@ def requirements_satisfied(base: dict[str, str], update: dict[str, str]
     return compatible
 
 
+def version_node(metadata: dict[str, str]) -> Tuple[str, str]:
+    """Returns the graph node representing the software version described
+       by the given package/device metadata.
+
+    Nodes are identified by both the device type and the software version,
+    so that packages for different device types that happen to share version
+    strings are never mixed together in a single upgrade path.
+    """
+    return (metadata[META_DEVICE_TYPE], metadata[META_SOFT_VER])
+
+
+class PackageRequirements:
+    """Precompiled requirements of a single package
+
+    Parses the `requires:` clauses of the package metadata once, so that
+    they don't have to be extracted again on every compatibility check.
+    """
+    devtype: str
+    version: str
+    required: Tuple[Tuple[str, Any], ...]
+
+    def __init__(self, metadata: dict[str, str]) -> None:
+        self.devtype = metadata[META_DEVICE_TYPE]
+        self.version = metadata[META_SOFT_VER]
+        self.required = tuple(
+            (k.removeprefix("requires:"), v)
+            for k, v in metadata.items()
+            if k.startswith("requires:")
+        )
+
+    def satisfied_by(self, base: dict[str, str]) -> bool:
+        """Checks if this package can be installed on top of `base`
+
+        This is equivalent to `requirements_satisfied(base, <package>)`.
+        """
+        if base[META_SOFT_VER] == self.version:
+            return False
+        if base[META_DEVICE_TYPE] != self.devtype:
+            return False
+        return all(
+            key in base and base[key] == value for key, value in self.required
+        )
+
+
+class RequirementIndex:
+    """Index of packages by device type and required (key, value) pairs
+
+    Finding the packages that can be installed on top of a given metadata set
+    is done with hash lookups of the metadata pairs instead of checking the
+    requirements of every single package.
+    """
+    requirements: List[PackageRequirements]
+    required_keys: frozenset[str]
+
+    def __init__(self, packages: List[dict[str, str]]) -> None:
+        """Compiles the requirements of all packages and indexes them
+
+        Args:
+            packages: list of package metadata. The index refers to the
+                      packages by their index in this list.
+        """
+        self.requirements = [PackageRequirements(p) for p in packages]
+        # Packages without any `requires:` clauses, by device type
+        self._unconstrained: dict[str, List[int]] = {}
+        # Packages by each of their (device type, key, value) requirements
+        self._by_requirement: dict[Tuple[str, str, Any], List[int]] = {}
+
+        for idx, compiled in enumerate(self.requirements):
+            if len(compiled.required) == 0:
+                self._unconstrained.setdefault(
+                    compiled.devtype, []
+                ).append(idx)
+            for key, value in compiled.required:
+                self._by_requirement.setdefault(
+                    (compiled.devtype, key, value), []
+                ).append(idx)
+
+        self.required_keys = frozenset(
+            key for compiled in self.requirements
+            for key, _ in compiled.required
+        )
+
+    def installable_on(self, metadata: dict[str, str]) -> List[int]:
+        """Finds all packages that can be installed on top of `metadata`
+
+        Args:
+            metadata: metadata of the device or package acting as the base
+
+        Returns:
+            Sorted list of indices of the packages whose requirements are
+            all satisfied by `metadata`.
+        """
+        devtype = metadata[META_DEVICE_TYPE]
+        version = metadata[META_SOFT_VER]
+
+        # Count how many requirements of each package were matched. A package
+        # is installable when all of its requirements were matched.
+        matched: dict[int, int] = {}
+        for key in self.required_keys:
+            if key not in metadata:
+                continue
+            try:
+                candidates = self._by_requirement.get(
+                    (devtype, key, metadata[key]), []
+                )
+            except TypeError:
+                # Unhashable metadata values never match a requirement
+                continue
+            for idx in candidates:
+                matched[idx] = matched.get(idx, 0) + 1
+
+        result = [
+            idx for idx, count in matched.items()
+            if count == len(self.requirements[idx].required)
+        ]
+        result += self._unconstrained.get(devtype, [])
+        return sorted(
+            idx for idx in result
+            if self.requirements[idx].version != version
+        )
+
+
+class PackageGraph:
+    """Device-independent upgrade graph of a set of packages
+
+    The nodes of the graph are software versions, and the edges are packages
+    that can be installed on top of a package providing the source version.
+    The edges are found using a `RequirementIndex` of the packages. The graph
+    only depends on the packages themselves, so it can be built once for a
+    given package assignment and shared between all devices that use it.
+
+    Versions are identified by integer ids (see `node_id`), and the edges are
+    stored in plain adjacency lists indexed by the destination version, which
+    is all that is needed to find the cost of reaching a target version.
+    The cost of each edge is given by a cost function of the package (see
+    `update.costs`), by default the size of the package.
+
+    This does not take into consideration local device metadata!
+    In very niche edge cases, these edges may not actually be compatible
+    with the device, but the next hop is always picked from the edges that
+    were verified against the device metadata (see `PackageResolver`).
+    """
+    packages: List[dict[str, str]]
+    index: RequirementIndex
+    versions: VersionIndex
+    node_ids: dict[Tuple[str, str], int]
+    package_nodes: List[int]
+    costs: List[int]
+    incoming: List[List[Tuple[int, int]]]
+    outgoing: List[List[int]]
+
+    def __init__(
+        self,
+        packages: List[dict[str, str]],
+        cost: CostFunction = cost_bytes,
+    ) -> None:
+        """Builds the upgrade graph
+
+        Args:
+            packages: list of package metadata. Edges of the graph refer to
+                      the packages by their index in this list.
+            cost: cost function used for the edges of the graph. Costs
+                  below 1 are raised to 1.
+        """
+        self.packages = packages
+        self.index = RequirementIndex(packages)
+        self.versions = VersionIndex(packages)
+        # Cost of installing each package. Every edge must have a positive
+        # cost for the path planning to terminate (see `path_from`).
+        self.costs = [max(cost(package_meta), 1) for package_meta in packages]
+        # Version id of each version node
+        self.node_ids = {}
+        # Version id of the version provided by each package
+        self.package_nodes = []
+        # Edges by the destination version id, as (source id, cost) pairs
+        self.incoming = []
+        self._distances: dict[int, List[Optional[int]]] = {}
+        self._lock = threading.Lock()
+
+        for package_meta in packages:
+            node = version_node(package_meta)
+            if node not in self.node_ids:
+                self.node_ids[node] = len(self.node_ids)
+                self.incoming.append([])
+            self.package_nodes.append(self.node_ids[node])
+
+        # Packages sharing the source version yield the same edges, collect
+        # them per source version to deduplicate them.
+        edges: List[set[int]] = [set() for _ in self.node_ids]
+        for base_idx, base in enumerate(packages):
+            edges[self.package_nodes[base_idx]].update(
+                self.index.installable_on(base)
+            )
+
+        # Packages installable on top of each version, by the version id
+        self.outgoing = [sorted(targets) for targets in edges]
+        for source, targets in enumerate(self.outgoing):
+            for idx in targets:
+                self.incoming[self.package_nodes[idx]].append(
+                    (source, self.costs[idx])
+                )
+
+    def node_id(self, node: Tuple[str, str]) -> Optional[int]:
+        """Returns the id of the given version node (see `version_node`),
+           or None if the version is not present in the graph
+        """
+        return self.node_ids.get(node)
+
+    def distances_to(self, target: Tuple[str, str]
+                     ) -> Optional[List[Optional[int]]]:
+        """Finds the cost of the shortest paths from all nodes to the
+           specified target
+
+        The result only depends on the graph, so it is computed once per
+        target version and reused for all subsequent calls.
+
+        Args:
+            target: target node, see `version_node`
+
+        Returns:
+            None, if the target version is not present in the graph.
+            Otherwise, list indexed by the version id of the source node,
+            containing the total cost of reaching `target` (None for nodes
+            from which the target is unreachable).
+        """
+        target_id = self.node_id(target)
+        if target_id is None:
+            return None
+
+        with self._lock:
+            cached = self._distances.get(target_id)
+        if cached is not None:
+            return cached
+
+        # Running Dijkstra from the target over the incoming edges yields
+        # the costs from every node to the target at once
+        distances: List[Optional[int]] = [None] * len(self.incoming)
+        distances[target_id] = 0
+        queue = [(0, target_id)]
+        while len(queue) > 0:
+            distance, node = heapq.heappop(queue)
+            if distance > distances[node]:
+                continue
+            for source, cost in self.incoming[node]:
+                candidate = distance + cost
+                if distances[source] is None or candidate < distances[source]:
+                    distances[source] = candidate
+                    heapq.heappush(queue, (candidate, source))
+
+        with self._lock:
+            self._distances[target_id] = distances
+        return distances
+
+    def path_from(self, first: int, target: Tuple[str, str]) -> List[int]:
+        """Finds the cheapest installation path to the target that starts
+           with the specified package
+
+        Only the first package is expected to be verified against the
+        device metadata, the remaining packages are picked using the edges
+        of the graph.
+
+        Args:
+            first: index of the first package of the path
+            target: target node, see `version_node`
+
+        Returns:
+            List of indices of the packages to install, in order. The path
+            only contains `first` if the target can't be reached from it.
+        """
+        path = [first]
+        distances = self.distances_to(target)
+        if distances is None:
+            return path
+
+        node = self.package_nodes[first]
+        while distances[node] is not None and distances[node] > 0:
+            best: Optional[int] = None
+            best_cost = None
+            for idx in self.outgoing[node]:
+                remaining = distances[self.package_nodes[idx]]
+                if remaining is None:
+                    continue
+                cost = self.costs[idx] + remaining
+                if best_cost is None or cost < best_cost:
+                    best = idx
+                    best_cost = cost
+            # Costs are positive, so every hop gets strictly closer to the
+            # target and the loop always terminates
+            path.append(best)
+            node = self.package_nodes[best]
+        return path
+
+
 class PackageResolver:
     device: dict[str, str]
     packages: List[dict[str, str]]
     policy: Type[BasePolicy]
+    graph: PackageGraph
 
     def __init__(
         self,
         device_meta: dict[str, str],
         packages: List[dict[str, str]],
         policy: Type[BasePolicy],
+        graph: Optional[PackageGraph] = None,
     ) -> None:
         """Initializes the package resolver
 
@@ -55,10 +353,13 @@ class PackageResolver:
             device_meta: current metadata reported by the device
             packages: list of assigned packages
             policy: policy object used for the group
+            graph: optional, prebuilt upgrade graph of `packages`. When
+                   not provided, the graph is built from scratch.
         """
         self.device = device_meta
         self.packages = packages
         self.policy = policy
+        self.graph = graph if graph is not None else PackageGraph(packages)
 
     def resolve(self) -> Optional[int]:
         """Attempt to resolve the path to the target software version specified
@@ -70,10 +371,24 @@ class PackageResolver:
             latest version int, index number of the next package that should be
             installed from the list provided in the resolver constructor
         """
+        # Target version, as indicated by the policy applied on the device
+        return self.resolve_target(
+            self.policy.evaluate(self.device, self.graph.versions)
+        )
+
+    def resolve_target(self, target_version: Optional[str]) -> Optional[int]:
+        """Same as `resolve`, but with the target version already evaluated
+            from the policy
+
+        Args:
+            target_version: result of evaluating the group policy on the
+                            device metadata
+
+        Returns:
+            See `resolve`
+        """
         # Current running version
         current_version = self.device[META_SOFT_VER]
-        # Target version, as indicated by the policy applied on the device
-        target_version = self.policy.evaluate(self.device)
         if target_version is None:
             print(
                 "Skipping update check for device with metadata:",
@@ -82,27 +397,14 @@ class PackageResolver:
             )
             return None
 
-        G = nx.MultiDiGraph()
-        # Add node for the base version, i.e the device's currently
-        # installed software
-        G.add_node(
-                current_version, subset=str(current_version), package="base")
-        # Create initial nodes for all software versions reachable from the
-        # available packages, we don't care about requirements at this stage
-        # other than the package must be device-type compatible.
-        for package_meta in self.packages:
-            if package_meta[META_DEVICE_TYPE] != self.device[META_DEVICE_TYPE]:
-                continue
-            # There may be many packages with the same target software version
-            if G.has_node(package_meta):
-                continue
-
-            ver = package_meta[META_SOFT_VER]
-            G.add_node(ver, subset=str(ver), package=str(ver))
+        if target_version == current_version:
+            return None
 
+        target = (self.device[META_DEVICE_TYPE], target_version)
+        distances = self.graph.distances_to(target)
         # Sanity check - does the target version exist on the graph?
         # If not, there is nothing we can do.
-        if not G.has_node(target_version):
+        if distances is None:
             print(
                 f"Package graph has no node with version '{target_version}'! \
                   Most likely no compatible packages were assigned to the \
@@ -110,73 +412,27 @@ class PackageResolver:
             )
             return None
 
-        # First, resolve the packages that can be installed on top of the
-        # currently running version. This is done by checking every single
-        # package against the current device metadata and seeing if
-        # any are compatible.
+        # Only the device-specific edges are resolved here, i.e the packages
+        # that can be installed on top of the currently running version.
         # Packages may have `requires` clauses on keys that change their value
         # after an update, so only the edges coming from the current version
         # are guaranteed to be 100% compatible with the device.
-        for idx, target in enumerate(self.packages):
-            if not requirements_satisfied(self.device, target):
+        # The rest of the path is taken from the (shared) package graph.
+        best: Optional[int] = None
+        best_cost = None
+        for idx in self.graph.index.installable_on(self.device):
+            remaining = distances[self.graph.package_nodes[idx]]
+            if remaining is None:
                 continue
 
-            cost = 1  # FIXME
-            G.add_edge(
-                current_version,
-                target[META_SOFT_VER],
-                package=idx,
-                metadata=target,
-                cost=cost,
-            )
-
-        # Next, resolve which packages can be installed on top of which other
-        # packages.
-        # This is done by checking every package against each other, which
-        # makes this O(n^2) in the count of assigned packages.
-        # This does not take into consideration local device metadata!
-        # In very niche edge cases, these edges may not actually be compatible
-        # with the device, but at no point will an incompatible package ever
-        # be chosen as the next hop.
-        for base in self.packages:
-            for idx, target in enumerate(self.packages):
-                if not requirements_satisfied(base, target):
-                    continue
-
-                cost = 1  # FIXME
-                G.add_edge(
-                    base[META_SOFT_VER],
-                    target[META_SOFT_VER],
-                    package=idx,
-                    metadata=target,
-                    cost=cost,
-                )
-
-        try:
-            # Try finding the shortest installation path to the target
-            sp = nx.shortest_path(
-                G, source=current_version, target=target_version, weight="cost"
-            )
+            cost = self.graph.costs[idx] + remaining
+            if best_cost is None or cost < best_cost:
+                best = idx
+                best_cost = cost
 
-            edge_path = []
-            # Reconstruct the edges for the shortest path
-            # NetworkX only returns the nodes of the shortest path
-            for subpath in nx.utils.pairwise(sp):
-                # `G.out_edges` ignores the destination, filter the edges that
-                # don't lead to the correct node.
-                valid_edges = list(
-                    filter(
-                        lambda edge: edge[1] == subpath[1],
-                        G.out_edges(subpath, data=True),
-                    )
-                )
-                _, _, minimal = min(valid_edges, key=lambda e: e[2]["cost"])
-                edge_path.append(minimal["package"])
-
-            return edge_path[0] if len(edge_path) > 0 else None
-        except nx.NetworkXNoPath:
+        if best is None:
             print(
                 f"No path to the policy-specified target version \
                 '{target_version}' was found!"
             )
-            return None
+        return best
@@ -0,0 +1,126 @@
+from typing import List, Optional, Tuple, Type
+import models.package
+from rdfm.schema.v1.updates import META_DEVICE_TYPE, META_SOFT_VER
+from update.cache import DecisionCache
+from update.costs import package_size
+from update.policies.base import BasePolicy
+from update.resolver import PackageGraph, PackageResolver
+
+
+class PackageDistribution:
+    """Devices that would receive a given package as their next update"""
+
+    """ The package that would be installed """
+    package: models.package.Package
+    """ Count of devices that would receive the package """
+    devices: int
+    """ Total bytes transferred to the devices, over the whole upgrade path
+        starting with the package (packages of unknown size are not counted)
+    """
+    bytes: int
+
+    def __init__(self, package: models.package.Package) -> None:
+        self.package = package
+        self.devices = 0
+        self.bytes = 0
+
+
+class RolloutSimulation:
+    """Result of a dry run of update checks of all devices in a group"""
+
+    """ Count of devices that were simulated """
+    devices: int
+    """ Count of distinct device equivalence classes that were resolved """
+    classes: int
+    """ Count of devices that would not receive any update """
+    no_update: int
+    """ Count of devices whose stored metadata is not sufficient for an
+        update check (missing device type or software version)
+    """
+    unknown: int
+    """ Devices receiving each package, ordered by package identifier """
+    distribution: List[PackageDistribution]
+    """ Total bytes transferred to all devices until they reach their
+        target version
+    """
+    bytes: int
+
+    def __init__(self) -> None:
+        self.devices = 0
+        self.classes = 0
+        self.no_update = 0
+        self.unknown = 0
+        self.distribution = []
+        self.bytes = 0
+
+
+def simulate(
+    group: int,
+    devices: List[dict[str, str]],
+    packages: List[models.package.Package],
+    policy: Type[BasePolicy],
+    graph: PackageGraph,
+) -> RolloutSimulation:
+    """Simulates the update checks of the given devices, without affecting
+       the devices in any way
+
+    Devices whose resolution-relevant metadata is identical (see
+    `DecisionCache.make_key`) always receive the same package, so they are
+    grouped into equivalence classes and each class is resolved only once.
+
+    The transferred bytes cover every package on the upgrade path of a
+    device, not only the next one. The path is planned the same way as for
+    update checks requesting the whole plan (see `PackageGraph.path_from`).
+
+    Args:
+        group: group identifier
+        devices: last known metadata of each device
+        packages: packages assigned to the group
+        policy: update policy of the group
+        graph: upgrade graph of `packages`
+    """
+    result = RolloutSimulation()
+    # Equivalence classes keyed by the memoization key of the class. Each
+    # value contains the metadata of the first device of the class (which is
+    # used for resolving the class), the target version and the device count.
+    classes: dict[Tuple, Tuple[dict[str, str], Optional[str], int]] = {}
+    for device_meta in devices:
+        result.devices += 1
+        if (META_DEVICE_TYPE not in device_meta or
+                META_SOFT_VER not in device_meta):
+            result.unknown += 1
+            continue
+
+        target_version = policy.evaluate(device_meta, graph.versions)
+        key = DecisionCache.make_key(
+            group, packages, graph, target_version, device_meta
+        )
+        first, _, count = classes.get(key, (device_meta, None, 0))
+        classes[key] = (first, target_version, count + 1)
+
+    distribution: dict[int, PackageDistribution] = {}
+    for device_meta, target_version, count in classes.values():
+        resolver = PackageResolver(device_meta, graph.packages, policy, graph)
+        index = resolver.resolve_target(target_version)
+        if index is None:
+            result.no_update += count
+            continue
+
+        package = packages[index]
+        if package.id not in distribution:
+            distribution[package.id] = PackageDistribution(package)
+        entry = distribution[package.id]
+        entry.devices += count
+        path = graph.path_from(
+            index, (device_meta[META_DEVICE_TYPE], target_version)
+        )
+        entry.bytes += count * sum(
+            package_size(packages[idx].info) or 0 for idx in path
+        )
+
+    result.classes = len(classes)
+    result.distribution = [
+        distribution[identifier] for identifier in sorted(distribution)
+    ]
+    result.bytes = sum(entry.bytes for entry in result.distribution)
+    return result
@@ -0,0 +1,129 @@
+import re
+from typing import Any, Callable, List, Optional
+from rdfm.schema.v1.updates import META_DEVICE_TYPE, META_SOFT_VER
+
+
+""" Version ordering key type, returns a sortable key for a version string,
+    or None if the version cannot be ordered using the comparator
+"""
+VersionKey = Callable[[str], Optional[Any]]
+
+SEMVER_REGEX = re.compile(
+    r"^v?(0|[1-9]\d*)\.(0|[1-9]\d*)\.(0|[1-9]\d*)"
+    r"(?:-([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?"
+    r"(?:\+[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*)?$"
+)
+
+NUMERIC_REGEX = re.compile(r"^v?\d+(\.\d+)*$")
+
+
+def key_semver(version: str) -> Optional[Any]:
+    """Orders versions by Semantic Versioning 2.0.0 precedence
+
+    An optional `v` prefix is accepted. Versions differing only in the
+    build metadata have the same precedence, they are ordered by the
+    version string itself to keep the order deterministic.
+    """
+    match = SEMVER_REGEX.match(version)
+    if match is None:
+        return None
+    major, minor, patch, prerelease = match.groups()
+    if prerelease is None:
+        # Releases take precedence over all of their pre-releases
+        pre = ((1,),)
+    else:
+        pre = tuple(
+            (0, int(part), "") if part.isdigit() else (1, 0, part)
+            for part in prerelease.split(".")
+        )
+        pre = ((0,),) + pre
+    return (int(major), int(minor), int(patch), pre, version)
+
+
+def key_numeric(version: str) -> Optional[Any]:
+    """Orders dot-separated numeric versions (e.g `1.2.10`) component-wise,
+       an optional `v` prefix is accepted
+    """
+    if NUMERIC_REGEX.match(version) is None:
+        return None
+    return (tuple(int(part) for part in version.lstrip("v").split(".")),
+            version)
+
+
+def key_lexical(version: str) -> Optional[Any]:
+    """Orders versions as plain strings"""
+    return version
+
+
+def create(name: str) -> VersionKey:
+    """Gets the version ordering given by the name"""
+    match name:
+        case "semver":
+            return key_semver
+        case "numeric":
+            return key_numeric
+        case "lexical":
+            return key_lexical
+        case _:
+            raise RuntimeError(f"invalid version comparator: '{name}'")
+
+
+class VersionIndex:
+    """Ordered versions provided by a set of packages, for each device type
+
+    The sorted version lists are built once for every comparator that is
+    requested and reused afterwards, so finding the newest version available
+    for a device type is O(1). The index is part of the package graph of a
+    group, so it is rebuilt whenever the package assignment of the group
+    changes.
+    """
+    _versions: dict[str, set[str]]
+    _sorted: dict[VersionKey, dict[str, List[str]]]
+
+    def __init__(self, packages: List[dict[str, str]]) -> None:
+        """Builds the index
+
+        Args:
+            packages: list of package metadata
+        """
+        # Distinct versions provided by the packages, by the device type
+        self._versions = {}
+        for package_meta in packages:
+            if (META_DEVICE_TYPE not in package_meta or
+                    META_SOFT_VER not in package_meta):
+                continue
+            self._versions.setdefault(
+                package_meta[META_DEVICE_TYPE], set()
+            ).add(package_meta[META_SOFT_VER])
+        self._sorted = {}
+
+    def sorted(self, device_type: str, key: VersionKey) -> List[str]:
+        """Returns the versions available for a device type in ascending
+           order, versions that cannot be ordered by `key` are omitted
+
+        Args:
+            device_type: device type to look up
+            key: version ordering to use
+        """
+        by_type = self._sorted.get(key)
+        if by_type is None:
+            # Concurrent update checks may end up sorting the versions
+            # twice, which is harmless as the results are identical.
+            by_type = {}
+            for devtype, versions in self._versions.items():
+                by_type[devtype] = sorted(
+                    (version for version in versions
+                     if key(version) is not None),
+                    key=key,
+                )
+            self._sorted[key] = by_type
+        return by_type.get(device_type, [])
+
+    def latest(self, device_type: str, key: VersionKey) -> Optional[str]:
+        """Returns the newest version available for a device type, or None
+           if no packages for the device type are available
+        """
+        versions = self.sorted(device_type, key)
+        if len(versions) == 0:
+            return None
+        return versions[-1]
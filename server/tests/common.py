@@ -7,8 +7,9 @@ import base64
 import json
 from dataclasses import dataclass
 from typing import Any, Optional
-from Crypto.PublicKey import RSA
+from Crypto.PublicKey import ECC, RSA
 from Crypto.Hash import SHA256
+from Crypto.Signature import DSS, eddsa
 from Crypto.Signature.pkcs1_15 import PKCS115_SigScheme
 
 
@@ -46,18 +47,24 @@ class ProcessConfig():
 def make_signature(key_pair, payload_bytes):
     """ Generates the signature that will be placed in the signature header
     """
-    h = SHA256.new(payload_bytes)
-    s = PKCS115_SigScheme(key_pair)
-    signature = s.sign(h)
+    if isinstance(key_pair, ECC.EccKey) and key_pair.curve == "Ed25519":
+        signature = eddsa.new(key_pair, "rfc8032").sign(payload_bytes)
+    elif isinstance(key_pair, ECC.EccKey):
+        signature = DSS.new(key_pair, "fips-186-3", encoding="der").sign(SHA256.new(payload_bytes))
+    else:
+        signature = PKCS115_SigScheme(key_pair).sign(SHA256.new(payload_bytes))
     return base64.b64encode(signature)
 
 
 def make_authentication_request(metadata, key_pair):
     """ Creates the authentication request structure
     """
+    public_key = key_pair.public_key().export_key(format="PEM")
+    if isinstance(public_key, bytes):
+        public_key = public_key.decode("utf-8")
     return {
         "metadata": metadata,
-        "public_key": key_pair.public_key().export_key("PEM").decode("utf-8"),
+        "public_key": public_key,
         "timestamp": int(time.time())
     }
 
@@ -18,7 +18,10 @@ def pytest_addoption(parser):
 
 
 def pytest_generate_tests(metafunc):
-    if "process" in metafunc.fixturenames:
+    if "process" in metafunc.fixturenames or (
+        "db" in metafunc.fixturenames and
+        "process_gunicorn" not in metafunc.fixturenames
+    ):
         fixtures = []
         if metafunc.config.getoption("sqlite"):
             fixtures.append("db_sqlite")
@@ -41,6 +41,7 @@ MOCKS_PORT = 9999
 MOCKS_BASE_URL = f"http://127.0.0.1:{MOCKS_PORT}/"
 MOCKS_INTROSPECT_PATH = '/token/introspect'
 MOCKS_CONFIG_PATH = '/.configure-mock'
+MOCKS_JWKS_PATH = '/certs'
 app = flask.Flask("test-oauth2-mock")
 data = MockConfig()
 
@@ -48,10 +49,23 @@ data = MockConfig()
 @app.route(MOCKS_INTROSPECT_PATH, methods=['POST'])
 def token_introspection_endpoint():
     global data
-    # From the server's PoV, only the `active` and `scope` fields matter.
-    return {
+    # From the server's PoV, only the `active`, `scope` and `exp` fields matter.
+    response = {
         "active": data.token_valid,
         "scope": " ".join(data.token_scopes),
+    }
+    # Optional token lifetime in seconds, counted from the introspection
+    if hasattr(data, "token_lifetime"):
+        response["exp"] = int(time.time()) + data.token_lifetime
+    return response, 200
+
+
+@app.route(MOCKS_JWKS_PATH, methods=['GET'])
+def jwks_endpoint():
+    global data
+    # Public keys configured in the `jwks` field, in JWK format
+    return {
+        "keys": getattr(data, "jwks", []),
     }, 200
 
 
@@ -84,6 +98,7 @@ def start_token_mock():
 
     The following are mocked:
         - Token Introspection
+        - JSON Web Key Set (JWKS) endpoint
     """
     print("Starting OAuth2 Token Introspection mock server..")
 
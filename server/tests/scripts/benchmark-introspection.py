@@ -0,0 +1,111 @@
+"""Benchmark of management token validation
+
+Starts the OAuth2 Token Introspection mock used by the tests and measures
+the time of validating a token:
+    - with a new HTTP session for every request (previous behavior),
+    - with a pooled session, without caching,
+    - with a pooled session and the introspection cache enabled,
+    - locally, as a JWT signed with a key from the mock's JWKS.
+
+Usage (from the `server/src` directory):
+
+    python ../tests/scripts/benchmark-introspection.py --requests 500
+"""
+import argparse
+import base64
+import contextlib
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Iterator
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import jwt  # noqa
+import requests  # noqa
+from Crypto.PublicKey import RSA  # noqa
+from authlib.integrations.requests_client import OAuth2Session  # noqa
+import server  # noqa
+from auth.introspection import TokenIntrospector  # noqa
+from auth.jwks import JWKSValidator  # noqa
+from mocks import oauth2_token_introspection as mock  # noqa
+
+
+CLIENT_ID = "rdfm-server-introspection"
+CLIENT_SECRET = "benchmark"
+TOKEN = "AAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+
+
+class UnpooledIntrospector(TokenIntrospector):
+    """Creates a new session for every introspection request"""
+    @contextlib.contextmanager
+    def _session(self) -> Iterator[OAuth2Session]:
+        with OAuth2Session(self.client_id, self.client_secret) as session:
+            yield session
+
+
+def measure(validator, token: str, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        assert validator.validate(token) is not None
+    return time.perf_counter() - start
+
+
+def b64(value: int) -> str:
+    raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="management token validation benchmark"
+    )
+    parser.add_argument("--requests", type=int, default=500,
+                        help="count of validated tokens per variant")
+    args = parser.parse_args()
+
+    url = f"{mock.MOCKS_BASE_URL}{mock.MOCKS_INTROSPECT_PATH}"
+    jwks_url = f"{mock.MOCKS_BASE_URL}{mock.MOCKS_JWKS_PATH}"
+    key = RSA.generate(2048)
+    jwk = {"kty": "RSA", "kid": "bench", "alg": "RS256",
+           "n": b64(key.n), "e": b64(key.e)}
+    signed_token = jwt.encode(
+        {"exp": int(time.time()) + 3600, "scope": "rdfm_admin_ro"},
+        key.export_key(), algorithm="RS256", headers={"kid": "bench"},
+    )
+    process = subprocess.Popen([sys.executable, mock.__file__],
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(3)
+        requests.post(f"{mock.MOCKS_BASE_URL}{mock.MOCKS_CONFIG_PATH}",
+                      data=mock.MockConfig(valid=True,
+                                           scopes=["rdfm_admin_ro"],
+                                           jwks=[jwk]).serialize(),
+                      headers={"Content-Type": "application/json"})
+
+        variants = [
+            ("new session per request",
+             UnpooledIntrospector(url, CLIENT_ID, CLIENT_SECRET, 0), TOKEN),
+            ("pooled session",
+             TokenIntrospector(url, CLIENT_ID, CLIENT_SECRET, 0), TOKEN),
+            ("pooled session + cache",
+             TokenIntrospector(url, CLIENT_ID, CLIENT_SECRET, 30), TOKEN),
+            ("offline JWKS validation",
+             JWKSValidator(jwks_url), signed_token),
+        ]
+        baseline = None
+        for name, validator, token in variants:
+            elapsed = measure(validator, token, args.requests)
+            if baseline is None:
+                baseline = elapsed
+            print(f"{name:<26} {elapsed * 1000 / args.requests:8.3f} "
+                  f"ms/request  speedup: {baseline / elapsed:7.1f}x")
+    finally:
+        process.kill()
+
+
+if __name__ == "__main__":
+    main()
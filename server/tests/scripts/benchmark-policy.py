@@ -0,0 +1,76 @@
+"""Benchmark of update policy evaluation
+
+Measures the per-update-check cost of obtaining and evaluating a group
+policy, when the policy string is compiled on every update check and when
+the compiled policy is taken from the policy cache.
+
+Usage (from the `server/src` directory):
+
+    python ../tests/scripts/benchmark-policy.py --iterations 100000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+import update.policy  # noqa
+from update.cache import PolicyCache  # noqa
+
+
+POLICIES = [
+    "no_update,",
+    "exact_match,v2",
+    "staged_rollout,v2,5@2024-06-01,25@2024-06-02T12:00:00,"
+    "50@2024-06-03,100@2024-06-04",
+]
+
+DEVICE = {
+    "rdfm.software.version": "v1",
+    "rdfm.hardware.devtype": "bench",
+    "rdfm.hardware.macaddr": "00:11:22:33:44:55",
+}
+
+
+def measure(fn: Callable[[], None], iterations: int) -> float:
+    """Returns the average time of calling `fn`, in microseconds"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000 * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="update policy benchmark")
+    parser.add_argument("--iterations", type=int, default=100000,
+                        help="update checks measured per policy")
+    args = parser.parse_args()
+
+    print(f"{'policy':>16} {'compile [us]':>14} {'cached [us]':>14} "
+          f"{'evaluate [us]':>14} {'speedup':>9}")
+    for policy_str in POLICIES:
+        cache = PolicyCache()
+        compiled = update.policy.create(policy_str)
+
+        compile = measure(
+            lambda: update.policy.create(policy_str).evaluate(DEVICE),
+            args.iterations,
+        )
+        cached = measure(
+            lambda: cache.get(1, policy_str).evaluate(DEVICE),
+            args.iterations,
+        )
+        evaluate = measure(
+            lambda: compiled.evaluate(DEVICE),
+            args.iterations,
+        )
+
+        name = policy_str.split(",", 1)[0]
+        print(f"{name:>16} {compile:>14.3f} {cached:>14.3f} "
+              f"{evaluate:>14.3f} {compile / cached:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
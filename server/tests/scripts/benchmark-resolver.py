@@ -0,0 +1,196 @@
+"""Benchmark of the update resolver
+
+Compares the update resolver against the previous networkx-based
+implementation on synthetic groups of packages. For each group size, the
+time of a single update check is measured for:
+
+- the legacy resolver, which builds the full networkx graph on every call,
+- the current resolver, including building the package graph,
+- the current resolver with an already built (cached) package graph.
+
+The results of both implementations are compared, and the benchmark fails
+if they pick packages with different installation path costs.
+
+Usage (from the `server/src` directory):
+
+    python ../tests/scripts/benchmark-resolver.py --sizes 10 100 1000 5000
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+from rdfm.schema.v1.updates import META_DEVICE_TYPE, META_SOFT_VER  # noqa
+from update.policies.exact_match import ExactMatch  # noqa
+from update.resolver import (  # noqa
+    PackageGraph,
+    PackageResolver,
+    requirements_satisfied,
+)
+
+
+def legacy_resolve(device: dict[str, str], packages: List[dict[str, str]],
+                   target_version: str) -> Optional[int]:
+    """Previous networkx-based implementation of `PackageResolver.resolve`"""
+    import networkx as nx
+
+    current_version = device[META_SOFT_VER]
+    G = nx.MultiDiGraph()
+    G.add_node(current_version, subset=str(current_version), package="base")
+    for package_meta in packages:
+        if package_meta[META_DEVICE_TYPE] != device[META_DEVICE_TYPE]:
+            continue
+        if G.has_node(package_meta):
+            continue
+        ver = package_meta[META_SOFT_VER]
+        G.add_node(ver, subset=str(ver), package=str(ver))
+
+    if not G.has_node(target_version):
+        return None
+
+    for idx, target in enumerate(packages):
+        if not requirements_satisfied(device, target):
+            continue
+        G.add_edge(current_version, target[META_SOFT_VER],
+                   package=idx, metadata=target, cost=1)
+
+    for base in packages:
+        for idx, target in enumerate(packages):
+            if not requirements_satisfied(base, target):
+                continue
+            G.add_edge(base[META_SOFT_VER], target[META_SOFT_VER],
+                       package=idx, metadata=target, cost=1)
+
+    try:
+        sp = nx.shortest_path(
+            G, source=current_version, target=target_version, weight="cost"
+        )
+        edge_path = []
+        for subpath in nx.utils.pairwise(sp):
+            valid_edges = list(
+                filter(
+                    lambda edge: edge[1] == subpath[1],
+                    G.out_edges(subpath, data=True),
+                )
+            )
+            _, _, minimal = min(valid_edges, key=lambda e: e[2]["cost"])
+            edge_path.append(minimal["package"])
+        return edge_path[0] if len(edge_path) > 0 else None
+    except nx.NetworkXNoPath:
+        return None
+
+
+def make_group(size: int, rng: random.Random) -> List[dict[str, str]]:
+    """Creates a synthetic group of packages
+
+    Half of the packages form a sequential chain of versions, the other half
+    are delta packages jumping forward over a random count of versions.
+    """
+    versions = max(size // 2, 1)
+    packages = [{
+        META_SOFT_VER: "v0",
+        META_DEVICE_TYPE: "bench",
+    }]
+    for i in range(1, versions):
+        packages.append({
+            META_SOFT_VER: f"v{i}",
+            META_DEVICE_TYPE: "bench",
+            f"requires:{META_SOFT_VER}": f"v{i - 1}",
+        })
+    while len(packages) < size:
+        base = rng.randrange(versions)
+        target = min(base + rng.randint(2, 50), versions - 1)
+        packages.append({
+            META_SOFT_VER: f"v{target}",
+            META_DEVICE_TYPE: "bench",
+            f"requires:{META_SOFT_VER}": f"v{base}",
+        })
+    return packages
+
+
+def measure(fn: Callable[[], None], repeat: int) -> float:
+    """Returns the average run time of `fn`, in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def path_cost(graph: PackageGraph, package: Optional[int],
+              target: str) -> Optional[int]:
+    """Returns the cost of the installation path starting with `package`"""
+    if package is None:
+        return None
+    distances = graph.distances_to(("bench", target))
+    return graph.costs[package] + distances[graph.package_nodes[package]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="update resolver benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10, 100, 1000, 5000],
+                        help="group sizes (package counts) to benchmark")
+    parser.add_argument("--devices", type=int, default=5,
+                        help="update checks measured per group size")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    import networkx  # noqa
+    print("networkx import time: "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+
+    rng = random.Random(args.seed)
+    print(f"{'packages':>10} {'legacy [ms]':>14} {'build [ms]':>14} "
+          f"{'cached [ms]':>14} {'speedup (build)':>16} "
+          f"{'speedup (cached)':>17}")
+    for size in args.sizes:
+        packages = make_group(size, rng)
+        latest = packages[max(size // 2, 1) - 1][META_SOFT_VER]
+        policy = ExactMatch(latest)
+        devices = [
+            {
+                META_SOFT_VER: rng.choice(packages)[META_SOFT_VER],
+                META_DEVICE_TYPE: "bench",
+            }
+            for _ in range(args.devices)
+        ]
+
+        legacy_results = []
+        start = time.perf_counter()
+        for device in devices:
+            legacy_results.append(legacy_resolve(device, packages, latest))
+        legacy = (time.perf_counter() - start) / len(devices) * 1000
+
+        build = measure(
+            lambda: [PackageResolver(d, packages, policy).resolve()
+                     for d in devices],
+            1,
+        ) / len(devices)
+
+        graph = PackageGraph(packages)
+        results = [
+            PackageResolver(d, packages, policy, graph).resolve()
+            for d in devices
+        ]
+        cached = measure(
+            lambda: [PackageResolver(d, packages, policy, graph).resolve()
+                     for d in devices],
+            100,
+        ) / len(devices)
+
+        for device, old, new in zip(devices, legacy_results, results):
+            if path_cost(graph, old, latest) != path_cost(graph, new, latest):
+                print("Result mismatch for device", device, ":", old, new)
+                sys.exit(1)
+
+        print(f"{size:>10} {legacy:>14.3f} {build:>14.3f} {cached:>14.4f} "
+              f"{legacy / build:>15.1f}x {legacy / cached:>16.0f}x")
+
+
+if __name__ == "__main__":
+    main()
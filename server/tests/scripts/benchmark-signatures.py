@@ -0,0 +1,74 @@
+"""Benchmark of device signature verification
+
+Measures the throughput of `auth.device.verify_signature` for each of the
+supported device key types, on a payload resembling a device
+authentication request. The parsed public keys are cached by the server,
+so the keys are parsed once before measuring.
+
+Usage (from the `server/src` directory):
+
+    python ../tests/scripts/benchmark-signatures.py --duration 2
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from Crypto.PublicKey import ECC, RSA  # noqa
+import server  # noqa
+from auth.device import verify_signature  # noqa
+from common import make_signature  # noqa
+
+
+KEYS = [
+    ("RSA-2048", lambda: RSA.generate(2048)),
+    ("RSA-4096", lambda: RSA.generate(4096)),
+    ("ECDSA P-256", lambda: ECC.generate(curve="P-256")),
+    ("Ed25519", lambda: ECC.generate(curve="Ed25519")),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="device signature verification benchmark"
+    )
+    parser.add_argument("--duration", type=float, default=2.0,
+                        help="time spent measuring each key type, in seconds")
+    args = parser.parse_args()
+
+    payload = json.dumps({
+        "metadata": {
+            "rdfm.software.version": "v0",
+            "rdfm.hardware.devtype": "bench",
+            "rdfm.hardware.macaddr": "00:11:22:33:44:55",
+        },
+        "timestamp": int(time.time()),
+    }).encode()
+
+    print(f"{'key type':>12} {'verify [us]':>12} {'verifications/s':>16}")
+    for name, generate in KEYS:
+        key = generate()
+        public_key = key.public_key().export_key(format="PEM")
+        if isinstance(public_key, bytes):
+            public_key = public_key.decode()
+        signature = make_signature(key, payload)
+        if not verify_signature(payload, public_key, signature):
+            print("Signature verification failed for", name)
+            sys.exit(1)
+
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.duration:
+            verify_signature(payload, public_key, signature)
+            count += 1
+        elapsed = time.perf_counter() - start
+        print(f"{name:>12} {elapsed / count * 1000 * 1000:>12.1f} "
+              f"{count / elapsed:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
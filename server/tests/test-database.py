@@ -0,0 +1,287 @@
+import datetime
+import json
+import secrets
+import pytest
+from sqlalchemy import desc, event, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import server
+import configuration
+import database.db
+import rdfm_mgmt_server
+import models.package
+from database.db import EngineProfile, PROFILES, engine_options
+from models.device import Device, DeviceGroupAssignment
+from models.group import Group, GroupPackageAssignment
+from models.log import Log
+from models.package import Package
+
+
+def fetch_pragma(engine, name: str):
+    with engine.connect() as connection:
+        return connection.execute(text(f"pragma {name}")).scalar()
+
+
+def test_default_profile_does_not_echo():
+    """ This tests that SQL statements are not logged by default
+    """
+    options = engine_options("sqlite:///devices.db", PROFILES["default"])
+    assert options["echo"] is False, "statements should not be logged by default"
+    assert PROFILES["debug"].echo is True, "the debug profile should log statements"
+
+
+def test_profile_overrides():
+    """ This tests overriding individual settings of a profile
+    """
+    profile = PROFILES["high_concurrency"].with_overrides(pool_size=5, echo=None)
+    assert profile.pool_size == 5, "the setting should have been overridden"
+    assert profile.max_overflow == PROFILES["high_concurrency"].max_overflow, "other settings should be kept"
+    assert profile.echo is False, "settings given as None should be kept"
+    assert PROFILES["high_concurrency"].pool_size == 20, "the predefined profile should not be modified"
+    with pytest.raises(AttributeError):
+        EngineProfile(pool_sizee=5)
+
+
+def test_pool_options_skipped_for_memory_sqlite():
+    """ This tests that pool sizing is only applied to pools which support it
+    """
+    profile = PROFILES["high_concurrency"]
+    options = engine_options("sqlite://", profile)
+    assert "pool_size" not in options, "in-memory SQLite does not support pool sizing"
+    assert database.db.create("sqlite://", profile) is not None, "the engine should have been created"
+
+    options = engine_options("postgresql://user@localhost/rdfm", profile)
+    assert options["pool_size"] == 20
+    assert options["max_overflow"] == 30
+    assert options["pool_recycle"] == 1800
+    assert options["pool_pre_ping"] is True
+
+
+def test_sqlite_pragmas(tmp_path):
+    """ This tests the SQLite pragmas set by the high concurrency profile
+    """
+    engine = database.db.create(f"sqlite:///{tmp_path / 'test.db'}", PROFILES["high_concurrency"])
+    assert engine is not None, "the engine should have been created"
+    assert engine.pool.size() == 20, "the pool size should be applied"
+    assert fetch_pragma(engine, "foreign_keys") == 1
+    assert fetch_pragma(engine, "journal_mode") == "wal"
+    assert fetch_pragma(engine, "synchronous") == 1, "synchronous should be NORMAL"
+    assert fetch_pragma(engine, "busy_timeout") == 5000
+    assert fetch_pragma(engine, "mmap_size") == 256 * 1024 * 1024
+
+    engine = database.db.create(f"sqlite:///{tmp_path / 'default.db'}")
+    assert fetch_pragma(engine, "foreign_keys") == 1
+    assert fetch_pragma(engine, "journal_mode") == "delete", "the default journal mode should be kept"
+
+
+def explain(engine, stmt) -> str:
+    """ Returns the query plan of the given statement
+    """
+    compiled = stmt.compile(engine)
+    with engine.connect() as connection:
+        if engine.dialect.name == "sqlite":
+            params = tuple(compiled.params[name] for name in compiled.positiontup)
+            rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)
+            return "\n".join(row[3] for row in rows)
+        # The tables are empty, so a sequential scan would always be cheaper
+        connection.exec_driver_sql("SET enable_seqscan = off")
+        rows = connection.exec_driver_sql(f"EXPLAIN {compiled}", compiled.params)
+        return "\n".join(row[0] for row in rows)
+
+
+def assert_uses_index(plan: str, index: str):
+    assert index in plan, f"the query should use the index {index}, plan:\n{plan}"
+
+
+def test_query_plans(db, request):
+    """ This tests that frequent lookups are served by indexes
+    """
+    engine = database.db.create(request.getfixturevalue(db))
+    assert engine is not None, "the engine should have been created"
+    now = datetime.datetime.utcnow()
+
+    plan = explain(engine, select(Device).where(Device.mac_address == "00:00:00:00:00:00"))
+    assert_uses_index(plan, "ix_devices_mac_address")
+
+    plan = explain(engine, select(DeviceGroupAssignment.device_id).where(DeviceGroupAssignment.group_id == 1))
+    assert_uses_index(plan, "ix_devices_groups_group_id")
+
+    plan = explain(engine, select(GroupPackageAssignment.group_id).where(GroupPackageAssignment.package_id == 1))
+    assert_uses_index(plan, "ix_groups_pkgs_package_id")
+
+    plan = explain(engine, select(Package).where(models.package.device_type() == "dummy").order_by(desc(Package.created)))
+    assert_uses_index(plan, "ix_packages_devtype_created")
+
+    plan = explain(engine, select(Log).where(Log.device_id == 1).where(Log.device_timestamp >= now))
+    assert_uses_index(plan, "ix_logs_device_id_device_timestamp")
+
+    plan = explain(engine, select(Log).where(Log.name == "syslog").where(Log.device_timestamp >= now))
+    assert_uses_index(plan, "ix_logs_name_device_timestamp")
+
+    plan = explain(engine, select(Log).where(Log.device_timestamp >= now).order_by(desc(Log.device_timestamp)))
+    assert_uses_index(plan, "ix_logs_device_timestamp")
+
+
+def test_json_text_cache_key(db, request):
+    """ This tests that JSON key expressions with different keys are not
+        served from the same cached statement
+    """
+    engine = database.db.create(request.getfixturevalue(db))
+    with Session(engine) as session:
+        session.add(Package(created=datetime.datetime.utcnow(), driver="local", sha256="",
+                            info={"a": "first", "b": "second"}))
+        session.commit()
+        first = session.scalar(select(models.package.json_text(Package.info, "a")))
+        second = session.scalar(select(models.package.json_text(Package.info, "b")))
+    assert first == "first"
+    assert second == "second", "the value of the second key should have been returned"
+
+
+def test_unique_mac_address(db, request):
+    """ This tests that two devices can't share a MAC address
+    """
+    engine = database.db.create(request.getfixturevalue(db))
+
+    def make_device() -> Device:
+        return Device(name="dummy", mac_address="00:00:00:00:00:00", capabilities="{}",
+                      device_metadata="{}", last_access=None, public_key=None)
+
+    with Session(engine) as session:
+        session.add(make_device())
+        session.commit()
+        session.add(make_device())
+        with pytest.raises(IntegrityError):
+            session.commit()
+
+
+@pytest.fixture
+def app(db, request):
+    """ Creates an in-process server app using a fresh database, without
+        API authentication
+    """
+    config = configuration.ServerConfig()
+    config.db_conn = request.getfixturevalue(db)
+    config.disable_api_auth = True
+    config.last_access_flush_interval = 0
+    previous = getattr(server, "instance", None)
+    app = rdfm_mgmt_server.setup(config)
+    yield app
+    server.instance = previous
+
+
+def add_devices(count: int, groups: list[int]):
+    """ Inserts devices assigned to all of the given groups
+    """
+    with Session(server.instance.db) as session:
+        for _ in range(count):
+            device = Device(name="dummy", mac_address=secrets.token_hex(6), capabilities="{}",
+                            device_metadata="{}", last_access=None, public_key=None)
+            session.add(device)
+            session.flush()
+            for group in groups:
+                session.add(DeviceGroupAssignment(device_id=device.id, group_id=group))
+        session.commit()
+
+
+def add_group(priority: int, packages: int) -> int:
+    """ Inserts a group with the given count of packages assigned
+    """
+    with Session(server.instance.db) as session:
+        group = Group(created=datetime.datetime.utcnow(), info={}, policy="no_update,", priority=priority)
+        session.add(group)
+        session.flush()
+        for _ in range(packages):
+            package = Package(created=datetime.datetime.utcnow(), driver="local", sha256="",
+                              info={"rdfm.hardware.devtype": "dummy", "rdfm.software.version": "v1"})
+            session.add(package)
+            session.flush()
+            session.add(GroupPackageAssignment(group_id=group.id, package_id=package.id))
+        session.commit()
+        return group.id
+
+
+def count_queries(client, path: str) -> int:
+    """ Returns the count of SQL statements executed when fetching the given path
+    """
+    statements = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(server.instance.db, "before_cursor_execute", _count)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(server.instance.db, "before_cursor_execute", _count)
+    assert response.status_code == 200, "the list should have been fetched"
+    return len(statements)
+
+
+LIST_ENDPOINTS = ["/api/v1/devices", "/api/v2/devices", "/api/v1/groups", "/api/v2/groups"]
+
+
+def test_list_query_count(app):
+    """ This tests that listing devices and groups runs a constant number
+        of queries, regardless of the count of devices and groups
+    """
+    client = app.test_client()
+    first = add_group(priority=10, packages=2)
+    second = add_group(priority=20, packages=1)
+    add_devices(2, [first, second])
+    small = {path: count_queries(client, path) for path in LIST_ENDPOINTS}
+
+    for priority in range(30, 40):
+        group = add_group(priority=priority, packages=3)
+        add_devices(10, [first, group])
+    for path in LIST_ENDPOINTS:
+        assert count_queries(client, path) == small[path], f"listing {path} should not run queries per entry"
+
+    devices = json.loads(client.get("/api/v1/devices").data)
+    assert all(device["group"] == first for device in devices), "the group with the lowest priority should be active"
+    groups = {group["id"]: group for group in json.loads(client.get("/api/v2/groups").data)}
+    assert len(groups[first]["devices"]) == 102
+    assert len(groups[second]["devices"]) == 2
+    assert len(groups[second]["packages"]) == 1
+
+
+def test_active_group_tiebreak(app):
+    """ This tests that update checks and the device API agree on the active
+        group of a device assigned to groups with the same priority
+    """
+    groups = [add_group(priority=10, packages=0) for _ in range(3)]
+    add_devices(1, list(reversed(groups)))
+    with Session(server.instance.db) as session:
+        device = session.scalars(select(Device)).one()
+
+    active = server.instance._devices_db.fetch_active_groups()
+    assert active[device.id] == min(groups), "ties should be broken by the group identifier"
+    data = server.instance._updates_db.fetch_check_data(device.mac_address)
+    assert data.group.id == active[device.id]
+    bulk = server.instance._updates_db.fetch_check_data_bulk([device.mac_address])
+    assert bulk[device.mac_address].group.id == active[device.id]
+    for group in groups:
+        members = [member.id for member in server.instance._updates_db.fetch_active_members(group)]
+        assert members == ([device.id] if group == active[device.id] else [])
+
+    members = server.instance._updates_db.fetch_active_members(active[device.id], [device.mac_address, "unknown"])
+    assert [member.id for member in members] == [device.id], "members should be filtered by the MAC address"
+    assert server.instance._updates_db.fetch_active_members(active[device.id], ["unknown"]) == []
+
+
+def test_notification_failure_keeps_policy_change(app, monkeypatch):
+    """ This tests that a failing update notification does not fail a policy
+        change that was already stored
+    """
+    import update.notify
+
+    def failing_notify(group: int) -> int:
+        raise RuntimeError("notification failed")
+
+    monkeypatch.setattr(update.notify, "notify_group", failing_notify)
+    group = add_group(priority=10, packages=0)
+    client = app.test_client()
+    for endpoint in [f"/api/v1/groups/{group}/policy", f"/api/v2/groups/{group}/policy"]:
+        response = client.post(endpoint, json={"policy": "exact_match,v2"})
+        assert response.status_code == 200, "the policy change should succeed"
+    with Session(server.instance.db) as session:
+        assert session.get(Group, group).policy == "exact_match,v2"
@@ -6,10 +6,10 @@ import subprocess
 import pytest
 import base64
 from typing import Any, Optional
-from Crypto.PublicKey import RSA
+from Crypto.PublicKey import ECC, RSA
 from Crypto.Hash import SHA256
 from Crypto.Signature.pkcs1_15 import PKCS115_SigScheme
-from common import UPDATES_ENDPOINT, SimpleDevice, ProcessConfig
+from common import UPDATES_ENDPOINT, SimpleDevice, ProcessConfig, make_signature
 
 
 SERVER = "http://127.0.0.1:5000/"
@@ -282,6 +282,57 @@ def test_device_metadata_change(process,
     assert list_devices[0]["metadata"][TEST_METADATA_CACHING_KEY] == TEST_METADATA_CACHING_EXPECTED_VALUE, "the metadata should have been updated on the server"
 
 
+def submit_signed(request: dict[str, Any]):
+    """ Sign and submit an arbitrary authentication request of the test device
+    """
+    payload = json.dumps(request).encode("utf-8")
+    return requests.post(AUTH,
+                         data=payload,
+                         headers={
+                             "Content-Type": "application/json",
+                             "X-RDFM-Device-Signature": make_signature(test_device.key_pair, payload),
+                         })
+
+
+@pytest.mark.parametrize("process_config", [ProcessConfig(insert_mocks=False)])
+def test_device_metadata_revision(process, submit_and_approve):
+    """ This tests if the stored metadata is only rewritten when it changes,
+        and if devices can send metadata deltas against a known revision
+    """
+    response = submit_signed(test_device.request)
+    assert response.status_code == 200, "the device should receive a successful authentication response"
+    revision = response.json()["metadata_revision"]
+
+    response = submit_signed(test_device.request)
+    assert response.status_code == 200, "the device should receive a successful authentication response"
+    assert response.json()["metadata_revision"] == revision, "unchanged metadata should not create a new revision"
+
+    delta = dict(test_device.request)
+    delta["metadata"] = METADATA | {"custom.key": "value"}
+    delta["metadata_revision"] = revision
+    response = submit_signed(delta)
+    assert response.status_code == 200, "the metadata delta should have been accepted"
+    assert response.json()["metadata_revision"] == revision + 1, "the metadata change should create a new revision"
+
+    delta["metadata"] = METADATA
+    delta["removed_metadata"] = ["custom.key"]
+    response = submit_signed(delta)
+    assert response.status_code == 409, "a delta against a stale revision should be rejected"
+
+    delta["metadata_revision"] = revision + 1
+    for required in ["rdfm.software.version", "rdfm.hardware.devtype", "rdfm.hardware.macaddr"]:
+        response = submit_signed(delta | {"removed_metadata": ["custom.key", required]})
+        assert response.status_code == 400, "required metadata keys should not be removable"
+
+    response = submit_signed(delta)
+    assert response.status_code == 200, "the metadata delta should have been accepted"
+    assert response.json()["metadata_revision"] == revision + 2, "the metadata change should create a new revision"
+
+    response = requests.get(f"{SERVER}/api/v1/devices")
+    assert response.status_code == 200, "devices should have been fetched successfully"
+    assert response.json()[0]["metadata"] == METADATA, "removed keys should have been deleted from the metadata"
+
+
 @pytest.mark.parametrize("process_config", [ProcessConfig(insert_mocks=False)])
 def test_device_last_access_tracking(process,
                                      submit_and_approve,
@@ -331,3 +382,233 @@ def test_device_token_verification_valid(process, submit_and_approve, submit_aut
         "Authorization": f"Bearer token={token}"
     })
     assert response.status_code != 401, "the endpoint should now be accessible"
+
+
+def test_device_token_refresh(process, submit_and_approve, submit_authorization):
+    """ This tests if a device can exchange its token for a new one
+    """
+    token = submit_authorization.json()["token"]
+
+    response = requests.post(f"{AUTH}/refresh", headers={
+        "Authorization": f"Bearer token={token}"
+    })
+    assert response.status_code == 200, "a valid token should be refreshed"
+    refreshed = response.json()["token"]
+
+    response = requests.post(f"{SERVER}/api/v1/update/check", json=METADATA, headers={
+        "Authorization": f"Bearer token={refreshed}"
+    })
+    assert response.status_code != 401, "the refreshed token should be accepted"
+
+    response = requests.post(f"{AUTH}/refresh", headers={
+        "Authorization": f"Bearer token={refreshed}"
+    })
+    assert response.status_code == 429, "refreshing again right away should be rate limited"
+    assert int(response.headers["Retry-After"]) > 0
+
+
+def test_device_token_refresh_invalid(process):
+    """ This tests if invalid tokens are not refreshed
+    """
+    response = requests.post(f"{AUTH}/refresh")
+    assert response.status_code == 400, "refreshing without a token should fail"
+
+    response = requests.post(f"{AUTH}/refresh", headers={
+        "Authorization": "Bearer token=invalid"
+    })
+    assert response.status_code == 401, "an invalid token should not be refreshed"
+
+
+def test_device_token_refresh_rules():
+    """ Test the token refresh grace period, lifetime and revocation
+    """
+    import jwt
+    from auth.device import (
+        DEVICE_JWT_ALGO, DEVICE_JWT_EXPIRY, DEVICE_JWT_REFRESH_GRACE,
+        DEVICE_JWT_REFRESH_INTERVAL, DEVICE_JWT_MAX_REFRESH_LIFETIME,
+        TokenDenylist, decode_and_verify_token, try_refresh_token,
+    )
+    import auth.device
+
+    def make_token(device_id, created_at, **claims):
+        return jwt.encode({
+            "device_id": device_id,
+            "created_at": created_at,
+            "expires": DEVICE_JWT_EXPIRY,
+        } | claims, os.environ["JWT_SECRET"], algorithm=DEVICE_JWT_ALGO)
+
+    now = int(time.time())
+    expired = now - DEVICE_JWT_EXPIRY - 1
+    result, _ = try_refresh_token(make_token("refresh-a", expired), now)
+    assert result is not None, "recently expired tokens should be refreshed"
+    assert result[1].authenticated_at == expired, "the authentication time should be kept"
+    assert decode_and_verify_token(result[0]).device_id == "refresh-a"
+
+    result, retry_after = try_refresh_token(make_token("refresh-a", now), now + 1)
+    assert result is None and retry_after == DEVICE_JWT_REFRESH_INTERVAL - 1, "refreshing should be rate limited"
+
+    too_old = now - DEVICE_JWT_EXPIRY - DEVICE_JWT_REFRESH_GRACE
+    assert try_refresh_token(make_token("refresh-b", too_old), now) == (None, None), \
+        "tokens expired for longer than the grace period should not be refreshed"
+
+    stale = make_token("refresh-c", now, authenticated_at=now - DEVICE_JWT_MAX_REFRESH_LIFETIME)
+    assert try_refresh_token(stale, now) == (None, None), "tokens should not be refreshed indefinitely"
+
+    denylist = TokenDenylist()
+    denylist.revoke("refresh-d", now)
+    auth.device.revoked_tokens, previous = denylist, auth.device.revoked_tokens
+    try:
+        assert try_refresh_token(make_token("refresh-d", now - 1), now) == (None, None), \
+            "revoked tokens should not be refreshed"
+        assert decode_and_verify_token(make_token("refresh-d", now - 1), now=now) is None, \
+            "revoked tokens should be rejected"
+        assert decode_and_verify_token(make_token("refresh-d", now), now=now) is not None, \
+            "tokens created after the revocation should be accepted"
+    finally:
+        auth.device.revoked_tokens = previous
+
+
+@pytest.mark.parametrize("key", [
+    RSA.generate(2048),
+    ECC.generate(curve="P-256"),
+    ECC.generate(curve="Ed25519"),
+], ids=["rsa", "p256", "ed25519"])
+def test_signature_key_types(key):
+    """ Test signature verification for all supported key types
+    """
+    from auth.device import verify_signature
+
+    device = SimpleDevice(METADATA, key)
+    public_key = device.request["public_key"]
+    assert verify_signature(device.request_bytes, public_key, device.signature), \
+        "a valid signature should be verified"
+    assert not verify_signature(device.request_bytes + b" ", public_key, device.signature), \
+        "a signature of different data should be rejected"
+    other_key = RSA.generate(2048) if isinstance(key, RSA.RsaKey) else ECC.generate(curve=key.curve)
+    other = SimpleDevice(METADATA, other_key)
+    assert not verify_signature(device.request_bytes, other.request["public_key"], device.signature), \
+        "a signature made with a different key should be rejected"
+
+
+def test_signature_p256_raw():
+    """ Test if raw (r || s) ECDSA P-256 signatures are accepted
+    """
+    from Crypto.Hash import SHA256
+    from Crypto.Signature import DSS
+    from auth.device import verify_signature
+
+    key = ECC.generate(curve="P-256")
+    body = b"payload"
+    signature = DSS.new(key, "fips-186-3").sign(SHA256.new(body))
+    public_key = key.public_key().export_key(format="PEM")
+    assert verify_signature(body, public_key, base64.b64encode(signature)), "raw signatures should be verified"
+
+
+def test_signature_unsupported_curve():
+    """ Test if keys on unsupported curves are rejected
+    """
+    from auth.device import verify_signature
+
+    key = ECC.generate(curve="P-384")
+    assert not verify_signature(b"payload", key.public_key().export_key(format="PEM"), make_signature(key, b"payload")), \
+        "keys on unsupported curves should be rejected"
+
+
+def test_auth_ed25519_device(process):
+    """ This tests the whole authentication flow of a device using an Ed25519 key
+    """
+    device = SimpleDevice(METADATA | {"rdfm.hardware.macaddr": "11:11:11:11:11:11"}, ECC.generate(curve="Ed25519"))
+    headers = {
+        "Content-Type": "application/json",
+        "X-RDFM-Device-Signature": device.signature,
+    }
+    response = requests.post(AUTH, data=device.request_bytes, headers=headers)
+    assert response.status_code == 401, "the signature should be verified and a registration created"
+
+    response = requests.post(f"{SERVER}/api/v1/auth/register", json={
+        "public_key": device.request["public_key"],
+        "mac_address": "11:11:11:11:11:11",
+    })
+    assert response.status_code == 200, "the device registration should have been accepted"
+
+    response = requests.post(AUTH, data=device.request_bytes, headers=headers)
+    assert response.status_code == 200, "the device should be authenticated"
+    assert "token" in response.json()
+
+
+def test_public_key_cache():
+    """ Test if parsed public keys are reused by the signature verification
+    """
+    from auth.device import PublicKeyCache
+
+    cache = PublicKeyCache(capacity=2)
+    pem = RSA.generate(2048).public_key().export_key().decode()
+    key = cache.import_key(pem)
+    assert cache.import_key(pem) is key, "parsed key should be reused"
+    assert cache.import_key(pem) is key
+
+    with pytest.raises(ValueError):
+        cache.import_key("invalid key")
+
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2
+    assert stats["size"] == 1, "invalid keys should not be cached"
+    assert stats["hit_rate"] == 0.5
+    assert stats["time_saved"] > 0
+
+
+def test_server_metrics(process, submit_and_approve, make_dummy_authenticated_request):
+    """ Test if the cache statistics are exposed through the metrics API
+    """
+    response = requests.get(f"{SERVER}/api/v1/metrics")
+    assert response.status_code == 200, "the metrics should have been fetched"
+    metrics = response.json()
+    assert metrics["device_keys"]["size"] == 1, "the device key should have been cached"
+    assert metrics["device_keys"]["hits"] + metrics["device_keys"]["misses"] > 0
+    assert "hit_rate" in metrics["device_keys"] and "time_saved" in metrics["device_keys"]
+    assert "hit_rate" in metrics["update_decisions"]
+    assert metrics["token_introspection"] is None, "tokens are not introspected when the API auth is disabled"
+
+
+def test_last_access_buffer():
+    """ Test if device accesses are coalesced and written in bulk
+    """
+    import datetime
+    from database.last_access import LastAccessBuffer
+
+    class RecordingDevicesDB:
+        def __init__(self):
+            self.bulk = []
+            self.single = []
+
+        def update_timestamps(self, timestamps):
+            self.bulk.append(dict(timestamps))
+
+        def update_timestamp(self, mac, timestamp):
+            self.single.append((mac, timestamp))
+
+    t0 = datetime.datetime(2024, 1, 1)
+    t1 = t0 + datetime.timedelta(seconds=1)
+    db = RecordingDevicesDB()
+    buffer = LastAccessBuffer(db, 5, connected=lambda: ["cc"])
+    buffer.record("aa", t1)
+    buffer.record("aa", t0)
+    buffer.record("bb", t0)
+    assert buffer.get("aa") == t1, "the latest access should be kept"
+    assert db.bulk == [], "nothing should be written before a flush"
+
+    buffer.flush()
+    assert len(db.bulk) == 1, "all accesses should be written in a single update"
+    assert db.bulk[0]["aa"] == t1 and db.bulk[0]["bb"] == t0
+    assert "cc" in db.bulk[0], "connected devices should be treated as accessed"
+    assert buffer.get("aa") is None, "flushed accesses should not be pending"
+
+    buffer.flush()
+    assert len(db.bulk) == 1, "recently stamped connected devices should not be written again"
+    buffer.connected_interval = 0
+    buffer.flush()
+    assert len(db.bulk) == 2 and list(db.bulk[1]) == ["cc"], "stale connected devices should be stamped again"
+
+    unbuffered = LastAccessBuffer(db, 0)
+    unbuffered.record("aa", t0)
+    assert db.single == [("aa", t0)], "accesses should be written immediately when buffering is disabled"
@@ -168,3 +168,51 @@ def test_delete_package(delete_dummy: dict[str, str],
     The object should no longer exist after deleting it using the driver.
     """
     assert len(list_test_bucket_contents) == 0, "the test bucket should be empty after deleting the uploaded package"
+
+
+def test_generate_package_link_cached(upload_dummy: dict[str, str],
+                                      create_driver,
+                                      monkeypatch):
+    """ Test if generated links are reused until shortly before they expire
+    """
+    import storage.s3
+    from storage.s3 import S3Storage
+    create_driver: S3Storage = create_driver
+
+    signed = []
+    generate_presigned_url = create_driver.client.generate_presigned_url
+
+    def count_signing(*args, **kwargs):
+        signed.append(kwargs["ExpiresIn"])
+        return generate_presigned_url(*args, **kwargs)
+
+    monkeypatch.setattr(create_driver.client, "generate_presigned_url", count_signing)
+
+    now = 1700000000.0
+    monkeypatch.setattr(storage.s3.time, "time", lambda: now)
+    link = create_driver.generate_url(upload_dummy, TEST_EXPIRY_TIME)
+    assert create_driver.generate_url(upload_dummy, TEST_EXPIRY_TIME) == link, "link should be reused"
+
+    margin = min(storage.s3.PRESIGNED_URL_SAFETY_MARGIN, TEST_EXPIRY_TIME // 2)
+    now += TEST_EXPIRY_TIME - margin - 1
+    assert create_driver.generate_url(upload_dummy, TEST_EXPIRY_TIME) == link, "link should be reused before the safety margin"
+    assert len(signed) == 1, "link should only be signed once"
+
+    now += 1
+    create_driver.generate_url(upload_dummy, TEST_EXPIRY_TIME)
+    assert len(signed) == 2, "link should be signed again within the safety margin"
+
+    create_driver.generate_url(upload_dummy, TEST_EXPIRY_TIME * 2)
+    assert signed == [TEST_EXPIRY_TIME, TEST_EXPIRY_TIME, TEST_EXPIRY_TIME * 2], "links with a different expiry should not be shared"
+
+
+def test_driver_reused(create_server_configuration):
+    """ Test if the driver instance is shared between calls
+    """
+    import copy
+    import storage
+    driver = storage.driver_by_name("s3", create_server_configuration)
+    assert storage.driver_by_name("s3", create_server_configuration) is driver, "driver should be reused"
+    other_configuration = copy.copy(create_server_configuration)
+    assert storage.driver_by_name("s3", other_configuration) is not driver, "driver should be recreated for a different configuration"
+    assert storage.driver_by_name("invalid", create_server_configuration) is None
@@ -2,14 +2,17 @@ import time
 from typing import Any
 from common import (DEVICES_WS,
                     manager_shell_ws, device_attach_shell_ws,
-                    create_fake_device_token)
+                    create_fake_device_token, group_create,
+                    group_assign_devices, group_assign_packages,
+                    group_change_policy, package_create_dummy)
 import simple_websocket
 import pytest
 from rdfm.ws import receive_message, send_message
-from rdfm_mgmt_communication import CapabilityReport, DeviceAttachToManager
+from rdfm_mgmt_communication import CapabilityReport, DeviceAttachToManager, UpdateAvailable
 
 
 FAKE_DEVICE_MAC = "00:00:00:00:00:00"
+FAKE_DEVICE_ID = 1
 MESSAGE_WAIT_TIMEOUT = 10.0
 
 
@@ -161,3 +164,29 @@ def test_ws_shell_spawn_on_nonexistent_device(process):
         pytest.fail("shell connection did not close, despite the device not existing")
 
     assert "not connected" in client.close_message, "close message should indicate the device does not exist"
+
+
+def test_ws_device_receives_update_available(process, connect_mock_device):
+    """ This tests if connected devices are notified when the packages or
+        the policy of their group change
+    """
+    send_message(connect_mock_device,
+                 CapabilityReport(capabilities={
+                     "update_available": True
+                 }))
+    # Hacky sleep to ensure delivery
+    time.sleep(5.0)
+
+    gid = group_create()["id"]
+    group_assign_devices(gid, add=[FAKE_DEVICE_ID])
+    package_create_dummy({
+        "rdfm.software.version": "v1",
+        "rdfm.hardware.devtype": "dummy",
+    })
+    group_assign_packages(gid, [1])
+    msg = receive_message(connect_mock_device, MESSAGE_WAIT_TIMEOUT)
+    assert isinstance(msg, UpdateAvailable), "the device should be notified after assigning packages"
+
+    group_change_policy(gid, "exact_match,v1")
+    msg = receive_message(connect_mock_device, MESSAGE_WAIT_TIMEOUT)
+    assert isinstance(msg, UpdateAvailable), "the device should be notified after changing the policy"
@@ -4,6 +4,7 @@ from common import (
         GROUPS_ENDPOINT,
         UPDATES_ENDPOINT,
         create_fake_device_token,
+        group_assign_devices,
         group_assign_packages,
         group_change_policy,
         package_create_dummy,
@@ -119,3 +120,187 @@ def test_package_accessible(prepare_simple_sequential):
     url = package_data["uri"]
     response = requests.get(url)
     assert response.status_code == 200, "the package should be accessible"
+
+
+def test_active_group_priority(prepare_simple_sequential):
+    """ This tests whether the update check uses the group with the lowest
+        priority value when the device is assigned to multiple groups.
+    """
+    meta = {
+        META_SOFT_VER: "v0",
+        META_DEV_TYPE: "dummy",
+        META_MAC_ADDR: DUMMY_DEVICE_MAC
+    }
+    assert update_check(meta) == 2, "device should receive package to go from v0 to v1"
+
+    resp = requests.post(GROUPS_ENDPOINT, json={"metadata": {}, "priority": 0})
+    assert resp.status_code == 200, "group creation should succeed"
+    gid = resp.json()["id"]
+    group_assign_devices(gid, add=[DUMMY_DEVICE_ID])
+    assert update_check(meta) is None, "the higher priority group without updates should take precedence"
+
+    group_assign_devices(gid, remove=[DUMMY_DEVICE_ID])
+    assert update_check(meta) == 2, "device should receive updates from the remaining group"
+
+
+def test_update_check_etag(create_dummy_group, prepare_simple_sequential):
+    """ This tests whether repeated update checks with an unchanged decision
+        can be answered with 304 Not Modified.
+    """
+    meta = {
+        META_SOFT_VER: "v0",
+        META_DEV_TYPE: "dummy",
+        META_MAC_ADDR: DUMMY_DEVICE_MAC
+    }
+    headers = {
+        "Authorization": f"Bearer token={create_fake_device_token()}",
+    }
+    response = requests.post(UPDATES_ENDPOINT, json=meta, headers=headers)
+    assert response.status_code == 200, "the update check should succeed"
+    etag = response.headers.get("ETag")
+    assert etag is not None, "the response should contain an ETag"
+
+    response = requests.post(UPDATES_ENDPOINT, json=meta, headers=headers | {
+        "If-None-Match": etag,
+    })
+    assert response.status_code == 304, "unchanged decision should not be sent again"
+    assert response.headers.get("ETag") == etag
+
+    response = requests.post(UPDATES_ENDPOINT, json=meta | {META_SOFT_VER: "v1"}, headers=headers | {
+        "If-None-Match": etag,
+    })
+    assert response.status_code == 200, "decision for a different version should be sent"
+    assert response.headers.get("ETag") != etag, "different decisions should have different tags"
+
+    group_change_policy(create_dummy_group, "exact_match,v0")
+    response = requests.post(UPDATES_ENDPOINT, json=meta, headers=headers | {
+        "If-None-Match": etag,
+    })
+    assert response.status_code == 204, "decision should change after the policy was changed"
+
+
+def test_update_check_batch(create_dummy_group, prepare_simple_sequential):
+    """ This tests whether a batched update check returns the same results
+        as checking each device separately.
+    """
+    group_assign_devices(create_dummy_group, add=[2])
+    devices = [
+        {
+            META_SOFT_VER: "v0",
+            META_DEV_TYPE: "dummy",
+            META_MAC_ADDR: DUMMY_DEVICE_MAC
+        },
+        {
+            META_SOFT_VER: "v3",
+            META_DEV_TYPE: "dummy",
+            META_MAC_ADDR: "11:11:11:11:11:11"
+        },
+        {
+            # Does not share a group with the calling device
+            META_SOFT_VER: "v0",
+            META_DEV_TYPE: "dummy",
+            META_MAC_ADDR: "22:22:22:22:22:22"
+        },
+        {
+            META_SOFT_VER: "v0",
+            META_MAC_ADDR: DUMMY_DEVICE_MAC
+        },
+        {
+            META_SOFT_VER: "v0",
+            META_DEV_TYPE: "dummy",
+            META_MAC_ADDR: "33:33:33:33:33:33"
+        },
+    ]
+    response = requests.post(f"{UPDATES_ENDPOINT}/batch", json={
+        "devices": devices
+    }, headers={
+        "Authorization": f"Bearer token={create_fake_device_token()}",
+    })
+    assert response.status_code == 200, "the batched update check should succeed"
+
+    results = response.json()
+    assert len(results) == len(devices), "there should be a result for every device"
+    assert results[0]["status"] == 200 and results[0]["body"]["id"] == 2, "device should receive package to go from v0 to v1"
+    assert results[1]["status"] == 204 and results[1]["body"] is None, "device should be up-to-date"
+    assert results[2]["status"] == 403, "devices outside of the caller's groups should not be checked"
+    assert results[3]["status"] == 400, "device with invalid metadata should fail"
+    assert results[4]["status"] == 403, "nonexistent device should not be checked"
+
+    single = requests.post(UPDATES_ENDPOINT, json=devices[0], headers={
+        "Authorization": f"Bearer token={create_fake_device_token()}",
+    })
+    assert single.headers["ETag"] == f'"{results[0]["etag"]}"', "batched and single checks should return the same tag"
+
+
+def test_update_check_batch_invalid(process):
+    """ This tests whether malformed batched update checks are rejected.
+    """
+    headers = {
+        "Authorization": f"Bearer token={create_fake_device_token()}",
+    }
+    for body in [{}, {"devices": []}, [], {"devices": "x"}]:
+        response = requests.post(f"{UPDATES_ENDPOINT}/batch", json=body, headers=headers)
+        assert response.status_code == 400, "malformed request should be rejected"
+
+
+def test_update_check_plan(prepare_simple_sequential):
+    """ This tests whether the whole upgrade path can be requested.
+    """
+    meta = {
+        META_SOFT_VER: "v0",
+        META_DEV_TYPE: "dummy",
+        META_MAC_ADDR: DUMMY_DEVICE_MAC
+    }
+    headers = {
+        "Authorization": f"Bearer token={create_fake_device_token()}",
+    }
+    response = requests.post(UPDATES_ENDPOINT, json=meta, headers=headers)
+    assert response.status_code == 200, "the update check should succeed"
+    assert "path" not in response.json(), "the path should only be returned when requested"
+    etag = response.headers["ETag"]
+
+    response = requests.post(f"{UPDATES_ENDPOINT}?plan=true", json=meta, headers=headers | {
+        "If-None-Match": etag,
+    })
+    assert response.status_code == 200, "the update check should succeed"
+    body = response.json()
+    assert body["id"] == 2, "device should receive package to go from v0 to v1"
+    assert [hop["id"] for hop in body["path"]] == [2, 3, 4], "the whole path to v3 should be returned"
+    for hop in body["path"]:
+        assert requests.get(hop["uri"]).status_code == 200, "every package on the path should be accessible"
+
+    response = requests.post(f"{UPDATES_ENDPOINT}/batch?plan=true", json={"devices": [meta]}, headers=headers)
+    assert response.status_code == 200, "the batched update check should succeed"
+    assert response.json()[0]["body"] == body, "batched check should return the same path"
+
+
+def test_rollout_simulation(create_dummy_group, prepare_simple_sequential):
+    """ This tests the dry-run rollout simulation of a group.
+    """
+    endpoint = f"{GROUPS_ENDPOINT}/{create_dummy_group}/simulate"
+    response = requests.post(endpoint, json={})
+    assert response.status_code == 200, "simulation should succeed"
+    result = response.json()
+    assert result["policy"] == "exact_match,v3", "current policy should be used by default"
+    assert result["packages"] == [1, 2, 3, 4], "current packages should be used by default"
+    assert result["devices"] == 1
+    # Mock devices do not have any stored metadata
+    assert result["unknown"] == 1
+
+    response = requests.post(endpoint, json={"policy": "exact_match,v1", "packages": [1, 2]})
+    assert response.status_code == 200, "simulation should succeed"
+    assert response.json()["policy"] == "exact_match,v1"
+    assert response.json()["packages"] == [1, 2]
+
+    response = requests.post(endpoint, json={"policy": "invalid"})
+    assert response.status_code == 400, "invalid policy should be rejected"
+    response = requests.post(endpoint, json={"packages": [1, 1000]})
+    assert response.status_code == 404, "nonexistent package should be rejected"
+    response = requests.post(f"{GROUPS_ENDPOINT}/1000/simulate", json={})
+    assert response.status_code == 404, "nonexistent group should be rejected"
+
+    assert update_check({
+        META_SOFT_VER: "v0",
+        META_DEV_TYPE: "dummy",
+        META_MAC_ADDR: DUMMY_DEVICE_MAC
+    }) == 2, "simulation should not affect the group"
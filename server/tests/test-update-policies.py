@@ -1,5 +1,7 @@
+import datetime
 import update.policy
 from update.policies.exact_match import ExactMatch
+from update.policies.staged_rollout import StagedRollout
 import pytest
 
 
@@ -18,3 +20,135 @@ def test_exact_match():
         "rdfm.hardware.devtype": "dummy"
     }
     assert policy.evaluate(dummy) == "v0", "evaluating the policy returns the specified version"
+
+
+def test_staged_rollout():
+    policy = update.policy.create("staged_rollout,v2,5,25@2024-06-01T12:00:00,100@2024-06-03T00:00:00+00:00")
+    assert isinstance(policy, StagedRollout), "parsed policy is an instance of StagedRollout"
+    assert policy.version == "v2", "version was parsed correctly"
+
+    start = datetime.datetime(2024, 6, 1, 12, tzinfo=datetime.timezone.utc).timestamp()
+    end = datetime.datetime(2024, 6, 3, tzinfo=datetime.timezone.utc).timestamp()
+    assert policy.admitted_at(start - 1) == 500, "first step applies immediately"
+    assert policy.admitted_at(start) == 2500, "second step applies from its start time"
+    assert policy.admitted_at(end) == 10000, "last step admits the whole group"
+
+    macs = [f"00:00:00:00:{i // 256:02x}:{i % 256:02x}" for i in range(4000)]
+    buckets = [policy.bucket(mac) for mac in macs]
+    assert buckets == [policy.bucket(mac) for mac in macs], "buckets should be stable"
+    admitted = sum(bucket < policy.admitted_at(start) for bucket in buckets)
+    assert 800 < admitted < 1200, "roughly 25% of devices should be admitted"
+
+    # The last step has already started, all devices should be updated
+    device = {
+        "rdfm.software.version": "v1",
+        "rdfm.hardware.devtype": "dummy",
+        "rdfm.hardware.macaddr": macs[0],
+    }
+    assert policy.evaluate(device) == "v2", "admitted device should be updated"
+
+    policy = update.policy.create("staged_rollout,v2,0,100@2999-01-01")
+    assert policy.evaluate(device) is None, "devices should not be updated before the rollout starts"
+    assert policy.evaluate({"rdfm.software.version": "v1"}) is None, "devices without a MAC address are not admitted"
+
+
+@pytest.mark.parametrize("policy", [
+    "staged_rollout,v2",
+    "staged_rollout,,100",
+    "staged_rollout,v2,101",
+    "staged_rollout,v2,-1",
+    "staged_rollout,v2,abc",
+    "staged_rollout,v2,10@invalid",
+    "staged_rollout,v2,10@2024-06-02,20@2024-06-01",
+])
+def test_staged_rollout_invalid(policy):
+    with pytest.raises(RuntimeError):
+        update.policy.create(policy)
+
+
+def test_policy_cache():
+    from update.cache import PolicyCache
+
+    cache = PolicyCache()
+    policy = cache.get(1, "exact_match,v1")
+    assert cache.get(1, "exact_match,v1") is policy, "compiled policy should be reused"
+    assert cache.get(2, "exact_match,v1") is not policy, "policies should be cached per group"
+
+    changed = cache.get(1, "exact_match,v2")
+    assert changed.version == "v2", "a changed policy string should be compiled again"
+
+    cache.invalidate(1)
+    assert cache.get(1, "exact_match,v2") is not changed, "invalidated policy should be compiled again"
+
+    with pytest.raises(RuntimeError):
+        cache.get(3, "invalid_policy")
+
+
+def test_version_ordering():
+    from update.versions import VersionIndex, key_lexical, key_numeric, key_semver
+
+    packages = [
+        {"rdfm.hardware.devtype": "a", "rdfm.software.version": version}
+        for version in ["1.0.0", "1.0.0-rc.1", "1.0.0-alpha", "1.0.0-alpha.beta",
+                        "1.0.0-rc.11", "v1.10.0", "1.2.0", "v2", "1.0.0-rc.1"]
+    ] + [{"rdfm.hardware.devtype": "b", "rdfm.software.version": "2.9"},
+         {"rdfm.hardware.devtype": "b", "rdfm.software.version": "2.10"}]
+    index = VersionIndex(packages)
+
+    assert index.sorted("a", key_semver) == [
+        "1.0.0-alpha", "1.0.0-alpha.beta", "1.0.0-rc.1", "1.0.0-rc.11", "1.0.0", "1.2.0", "v1.10.0",
+    ], "versions should be ordered by semver precedence, skipping invalid versions"
+    assert index.latest("a", key_semver) == "v1.10.0"
+    assert index.latest("b", key_numeric) == "2.10", "numeric versions should be compared component-wise"
+    assert index.latest("b", key_lexical) == "2.9"
+    assert index.latest("b", key_semver) is None, "no versions should be found when none can be ordered"
+    assert index.latest("c", key_lexical) is None
+
+
+def test_latest_compatible():
+    from update.policies.latest_compatible import LatestCompatible
+    from update.versions import VersionIndex
+
+    policy = update.policy.create("latest_compatible,numeric")
+    assert isinstance(policy, LatestCompatible), "parsed policy is an instance of LatestCompatible"
+
+    index = VersionIndex([
+        {"rdfm.hardware.devtype": "a", "rdfm.software.version": "1.9"},
+        {"rdfm.hardware.devtype": "a", "rdfm.software.version": "1.10"},
+        {"rdfm.hardware.devtype": "b", "rdfm.software.version": "3.0"},
+    ])
+    device = {
+        "rdfm.software.version": "1.0",
+        "rdfm.hardware.devtype": "a",
+    }
+    assert policy.evaluate(device, index) == "1.10", "the newest version for the device type should be targeted"
+    assert policy.evaluate(device) is None, "no target should be given without a version index"
+    assert policy.evaluate({"rdfm.software.version": "1.0"}, index) is None
+
+    up_to_date = {**device, "rdfm.software.version": "1.10"}
+    assert policy.evaluate(up_to_date, index) is None, "devices on the newest version should not be updated"
+    unordered = {**device, "rdfm.software.version": "custom-build"}
+    assert policy.evaluate(unordered, index) is None, "versions that can't be ordered should not be updated"
+
+
+def test_latest_compatible_does_not_downgrade():
+    """ This tests that devices ahead of every assigned package are not
+        downgraded
+    """
+    from update.versions import VersionIndex
+
+    policy = update.policy.create("latest_compatible,semver")
+    index = VersionIndex([
+        {"rdfm.hardware.devtype": "a", "rdfm.software.version": "1.0.0"},
+        {"rdfm.hardware.devtype": "a", "rdfm.software.version": "2.0.0"},
+    ])
+    device = {
+        "rdfm.software.version": "3.0.0",
+        "rdfm.hardware.devtype": "a",
+    }
+    assert policy.evaluate(device, index) is None, "the device should not be downgraded"
+    device["rdfm.software.version"] = "1.5.0"
+    assert policy.evaluate(device, index) == "2.0.0"
+
+    with pytest.raises(RuntimeError, match="comparator"):
+        update.policy.create("latest_compatible,invalid")
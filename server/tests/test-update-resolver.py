@@ -1,5 +1,15 @@
 import pytest
-from update.resolver import PackageResolver
+import random
+from update.resolver import (
+    PackageResolver,
+    PackageGraph,
+    RequirementIndex,
+    requirements_satisfied,
+)
+from update.cache import PackageGraphCache, DecisionCache
+from update.costs import cost_bytes, cost_hops, cost_install_time, create as create_cost
+from lru_cache import LRUCache
+from models.package import Package
 from rdfm.schema.v1.updates import META_DEVICE_TYPE, META_SOFT_VER
 from update.policies.exact_match import ExactMatch
 
@@ -171,3 +181,388 @@ def test_ambiguous_packages():
 
     assert PackageResolver(dummy_device("v0"), packages, policy).resolve() is not None, "device should receive any package"
 
+
+def test_shared_package_graph():
+    """ Test resolving multiple devices using a single prebuilt package graph.
+
+    The package-to-package part of the graph does not depend on the device,
+    so the same graph must give identical results as building it from scratch
+    for every device.
+    """
+    packages = [
+        {
+            META_SOFT_VER: "v1",
+            META_DEVICE_TYPE: "dummy",
+        },
+        {
+            META_SOFT_VER: "v2",
+            META_DEVICE_TYPE: "dummy",
+            f"requires:{META_SOFT_VER}": "v1",
+        },
+        {
+            META_SOFT_VER: "v3",
+            META_DEVICE_TYPE: "dummy",
+            f"requires:{META_SOFT_VER}": "v2",
+        },
+    ]
+    policy = ExactMatch("v3")
+    graph = PackageGraph(packages)
+
+    for ver in ["v0", "v1", "v2", "v3"]:
+        device = dummy_device(ver)
+        assert PackageResolver(device, packages, policy, graph).resolve() == \
+            PackageResolver(device, packages, policy).resolve(), "shared graph should resolve identically"
+
+
+def test_device_types_not_mixed():
+    """ Test that packages for different device types sharing version names
+        are never combined into a single upgrade path.
+
+        foo: v1 --> v2
+        bar:        v2 --> v3
+    """
+    packages = [
+        {
+            META_SOFT_VER: "v2",
+            META_DEVICE_TYPE: "foo",
+            f"requires:{META_SOFT_VER}": "v1",
+        },
+        {
+            META_SOFT_VER: "v3",
+            META_DEVICE_TYPE: "bar",
+            f"requires:{META_SOFT_VER}": "v2",
+        },
+    ]
+    device = {
+        META_DEVICE_TYPE: "foo",
+        META_SOFT_VER: "v1",
+    }
+    assert PackageResolver(device, packages, ExactMatch("v3")).resolve() is None, "path through another device type's package must not be used"
+    assert PackageResolver(device, packages, ExactMatch("v2")).resolve() == 0, "device should receive the package of its own device type"
+
+
+def test_package_graph_cache():
+    """ Test reuse and invalidation of cached package graphs.
+    """
+    def make_package(identifier: int, ver: str) -> Package:
+        package = Package()
+        package.id = identifier
+        package.info = {
+            META_SOFT_VER: ver,
+            META_DEVICE_TYPE: "dummy",
+        }
+        return package
+
+    cache = PackageGraphCache()
+    packages = [make_package(1, "v1"), make_package(2, "v2")]
+
+    graph = cache.get(1, packages)
+    assert cache.get(1, packages) is graph, "graph should be reused for the same assignment"
+    assert cache.get(1, packages[:1]) is not graph, "graph should be rebuilt when the assignment changes"
+
+    graph = cache.get(1, packages)
+    cache.invalidate(1)
+    assert cache.get(1, packages) is not graph, "graph should be rebuilt after invalidation"
+
+    graph = cache.get(1, packages)
+    cache.invalidate_package(2)
+    assert cache.get(1, packages) is not graph, "graph should be rebuilt after a package is removed"
+
+
+def test_requirement_index():
+    """ Test that the requirement index finds exactly the same packages as
+        checking `requirements_satisfied` against every single package.
+    """
+    rng = random.Random(1234)
+    packages = []
+    for i in range(200):
+        package = {
+            META_SOFT_VER: f"v{rng.randrange(20)}",
+            META_DEVICE_TYPE: rng.choice(["foo", "bar"]),
+        }
+        if rng.random() < 0.7:
+            package[f"requires:{META_SOFT_VER}"] = f"v{rng.randrange(20)}"
+        if rng.random() < 0.3:
+            package["requires:rootfs"] = rng.choice(["a", "b"])
+        packages.append(package)
+
+    index = RequirementIndex(packages)
+    bases = packages + [
+        {META_SOFT_VER: "v3", META_DEVICE_TYPE: "foo", "rootfs": "a"},
+        {META_SOFT_VER: "v7", META_DEVICE_TYPE: "bar"},
+    ]
+    for base in bases:
+        expected = [
+            idx for idx, target in enumerate(packages)
+            if requirements_satisfied(base, target)
+        ]
+        assert index.installable_on(base) == expected, "index lookup should match a full scan"
+        assert [
+            idx for idx, compiled in enumerate(index.requirements)
+            if compiled.satisfied_by(base)
+        ] == expected, "compiled requirements should match requirements_satisfied"
+
+
+def test_lru_cache():
+    """ Test eviction order and lookup counters of the LRU cache.
+    """
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1, "cached value should be returned"
+    cache.put("c", 3)
+    assert cache.get("b") is None, "least recently used entry should be evicted"
+    assert cache.get("a") == 1 and cache.get("c") == 3, "recently used entries should be kept"
+    stats = cache.stats()
+    assert stats["hits"] == 3 and stats["misses"] == 1 and stats["evictions"] == 1, "lookups should be counted"
+
+    cache.remove_if(lambda key: key == "a")
+    assert cache.get("a", "missing") == "missing", "removed entry should not be returned"
+    assert len(cache) == 1
+
+
+def test_decision_cache():
+    """ Test that the memoization key only depends on the metadata used during
+        resolution, and that memoized decisions are returned.
+    """
+    package = Package()
+    package.id = 1
+    package.info = {
+        META_SOFT_VER: "v1",
+        META_DEVICE_TYPE: "dummy",
+        "requires:rootfs": "a",
+    }
+    packages = [package]
+    graph = PackageGraph([p.info for p in packages])
+
+    def key(device, target="v1"):
+        return DecisionCache.make_key(1, packages, graph, target, device)
+
+    device = dummy_device("v0") | {"rootfs": "a", "rdfm.hardware.macaddr": "00:00:00:00:00:01"}
+    other = device | {"rdfm.hardware.macaddr": "00:00:00:00:00:02", "unused": "x"}
+    assert key(device) == key(other), "unrelated metadata should not affect the key"
+    assert key(device) != key(device | {"rootfs": "b"}), "metadata used by requirements should affect the key"
+    assert key(device) != key(dummy_device("v1") | {"rootfs": "a"}), "software version should affect the key"
+    assert key(device) != key(device, "v2"), "target version should affect the key"
+    assert DecisionCache.etag(key(device)) == DecisionCache.etag(key(other))
+    assert DecisionCache.etag(key(device)) != DecisionCache.etag(key(device, "v2"))
+
+    cache = DecisionCache(16)
+    assert cache.get(key(device)) == (False, None), "nothing should be memoized yet"
+    cache.put(key(device), None)
+    assert cache.get(key(other)) == (True, None), "memoized 'no update' decision should be returned"
+    cache.put(key(device, "v2"), 0)
+    assert cache.get(key(device, "v2")) == (True, 0), "memoized decision should be returned"
+    cache.invalidate(1)
+    assert cache.get(key(device, "v2")) == (False, None), "decisions should be dropped after invalidation"
+
+
+def test_graph_distances():
+    """ Test the shortest path costs computed by the package graph.
+    """
+    packages = [
+        dummy_device("v0"),
+        dummy_device("v1") | {f"requires:{META_SOFT_VER}": "v0"},
+        dummy_device("v2") | {f"requires:{META_SOFT_VER}": "v1"},
+        dummy_device("v3") | {f"requires:{META_SOFT_VER}": "v2"},
+        dummy_device("v3") | {f"requires:{META_SOFT_VER}": "v0"},
+        dummy_device("v4") | {f"requires:{META_SOFT_VER}": "v9"},
+    ]
+    graph = PackageGraph(packages, cost_hops)
+
+    def cost(source: str, target: str):
+        distances = graph.distances_to(("dummy", target))
+        return distances[graph.node_id(("dummy", source))]
+
+    assert cost("v3", "v3") == 0
+    assert cost("v0", "v3") == 1, "delta package should shorten the path"
+    assert cost("v1", "v3") == 2
+    assert cost("v0", "v2") == 2
+    assert cost("v3", "v0") == 1, "package without requirements can be installed from any version"
+    assert cost("v4", "v1") == 2
+    assert cost("v0", "v4") is None, "unreachable version should have no cost"
+    assert graph.distances_to(("dummy", "v9")) is None, "missing version should have no distances"
+    assert graph.distances_to(("other", "v3")) is None, "versions of other device types should not be found"
+
+
+def test_byte_cost_prefers_deltas():
+    """ Test that the byte cost function prefers a chain of small delta
+        packages over a single large package.
+    """
+    def package(ver: str, base: str, size: int, storage: str = "local"):
+        key = "rdfm.storage.local.length" if storage == "local" else "rdfm.storage.s3.size"
+        return dummy_device(ver) | {
+            f"requires:{META_SOFT_VER}": base,
+            key: size,
+        }
+
+    packages = [
+        package("v3", "v0", 100 * 1024 * 1024),
+        package("v1", "v0", 10 * 1024 * 1024, "s3"),
+        package("v2", "v1", 10 * 1024 * 1024),
+        package("v3", "v2", 10 * 1024 * 1024, "s3"),
+    ]
+    device = dummy_device("v0")
+    policy = ExactMatch("v3")
+
+    graph = PackageGraph(packages, cost_bytes)
+    assert PackageResolver(device, packages, policy, graph).resolve() == 1, "delta chain should be picked when minimizing bytes"
+    assert PackageResolver(device, packages, policy).resolve() == 1, "bytes should be the default cost"
+    graph = PackageGraph(packages, cost_install_time)
+    assert PackageResolver(device, packages, policy, graph).resolve() == 0, "single installation should be faster than three"
+    graph = PackageGraph(packages, cost_hops)
+    assert PackageResolver(device, packages, policy, graph).resolve() == 0, "full image should be picked when minimizing hops"
+
+    packages[0]["rdfm.storage.local.length"] = 20 * 1024 * 1024
+    graph = PackageGraph(packages, cost_bytes)
+    assert PackageResolver(device, packages, policy, graph).resolve() == 0, "smaller full image should be picked"
+
+    assert create_cost("hops") is cost_hops
+    with pytest.raises(RuntimeError):
+        create_cost("invalid")
+
+
+def test_graph_path_from():
+    """ Test planning of the whole upgrade path.
+    """
+    packages = [
+        dummy_device("v1") | {f"requires:{META_SOFT_VER}": "v0"},
+        dummy_device("v2") | {f"requires:{META_SOFT_VER}": "v1"},
+        dummy_device("v3") | {f"requires:{META_SOFT_VER}": "v2"},
+        dummy_device("v3") | {f"requires:{META_SOFT_VER}": "v1"},
+        dummy_device("v4") | {f"requires:{META_SOFT_VER}": "v3"},
+    ]
+    graph = PackageGraph(packages, cost_hops)
+    assert graph.path_from(0, ("dummy", "v4")) == [0, 3, 4], "shortest path should be planned"
+    assert graph.path_from(1, ("dummy", "v4")) == [1, 2, 4]
+    assert graph.path_from(4, ("dummy", "v4")) == [4], "path ending at the target should have a single hop"
+    assert graph.path_from(4, ("dummy", "v1")) == [4], "unreachable target should only return the first package"
+    assert graph.path_from(0, ("dummy", "v9")) == [0], "missing target should only return the first package"
+
+
+def test_graph_zero_cost():
+    """ Test that path planning terminates with cost functions returning 0.
+    """
+    packages = [
+        dummy_device("v1") | {f"requires:{META_SOFT_VER}": "v2"},
+        dummy_device("v2") | {f"requires:{META_SOFT_VER}": "v1"},
+        dummy_device("v3") | {f"requires:{META_SOFT_VER}": "v2"},
+    ]
+    graph = PackageGraph(packages, lambda meta: 0)
+    assert graph.costs == [1, 1, 1], "costs should be raised to 1"
+    assert graph.path_from(0, ("dummy", "v3")) == [0, 1, 2]
+
+
+def test_rollout_simulation():
+    """ Test that the rollout simulation resolves each equivalence class once
+        and reports the same packages as resolving each device separately.
+    """
+    from update.simulation import simulate
+
+    packages = []
+    for identifier, meta in enumerate([
+        dummy_device("v1") | {f"requires:{META_SOFT_VER}": "v0", "rdfm.storage.local.length": 100},
+        dummy_device("v2") | {f"requires:{META_SOFT_VER}": "v1", "rdfm.storage.local.length": 200},
+        dummy_device("v2") | {f"requires:{META_SOFT_VER}": "v0", "requires:board": "b", "rdfm.storage.local.length": 50},
+    ], start=1):
+        package = Package()
+        package.id = identifier
+        package.info = meta
+        packages.append(package)
+
+    graph = PackageGraph([p.info for p in packages])
+    policy = ExactMatch("v2")
+    devices = (
+        [dummy_device("v0") | {"board": "a", "rdfm.hardware.macaddr": f"{i}"} for i in range(50)] +
+        [dummy_device("v0") | {"board": "b", "rdfm.hardware.macaddr": f"{i}"} for i in range(30)] +
+        [dummy_device("v1") | {"board": "a"} for _ in range(15)] +
+        [dummy_device("v2") for _ in range(4)] +
+        [{META_SOFT_VER: "v0"}]
+    )
+    result = simulate(1, devices, packages, policy, graph)
+    assert result.devices == 100
+    assert result.classes == 4, "devices should be grouped by their resolution-relevant metadata"
+    assert result.unknown == 1, "devices without a device type should be reported"
+    assert result.no_update == 4, "up-to-date devices should not receive updates"
+    assert [(e.package.id, e.devices, e.bytes) for e in result.distribution] == [
+        (1, 50, 15000),
+        (2, 15, 3000),
+        (3, 30, 1500),
+    ], "the bytes of every package on the upgrade path should be counted"
+    assert result.bytes == 19500
+
+    for device in devices[:-1]:
+        expected = PackageResolver(device, graph.packages, policy, graph).resolve()
+        assert expected is None or any(
+            e.package is packages[expected] for e in result.distribution
+        ), "simulation should match resolving each device separately"
+
+
+def test_admission_controller():
+    """ Test the download admission controller caps and lease handling
+    """
+    from update.admission import AdmissionController
+
+    disabled = AdmissionController()
+    assert not disabled.enabled
+    assert all(disabled.acquire(f"{i}", 1, "local", now=0) is None for i in range(100))
+
+    admission = AdmissionController(max_per_package=2, max_global=3, lease_time=100)
+    assert admission.acquire("a", 1, "local", now=0) is None
+    assert admission.acquire("b", 1, "local", now=10) is None
+    assert admission.acquire("c", 1, "local", now=20) == 80, "per-package cap should be enforced"
+    assert admission.acquire("a", 1, "local", now=20) is None, "polling again should renew the lease"
+    assert admission.acquire("c", 2, "s3", now=30) is None
+    assert admission.acquire("d", 3, "s3", now=40) == 70, "global cap should be enforced"
+
+    # Lease of "b" expires at 110, the lease of "a" was renewed until 120
+    assert admission.acquire("c", 1, "local", now=110) is None
+    assert admission.acquire("d", 1, "local", now=115) == 5
+
+    per_driver = AdmissionController(max_per_driver=1, lease_time=100)
+    assert per_driver.acquire("a", 1, "s3", now=0) is None
+    assert per_driver.acquire("b", 2, "s3", now=0) == 100, "per-driver cap should be enforced"
+    assert per_driver.acquire("b", 3, "local", now=0) is None
+
+
+def test_admission_retry_after_per_cap():
+    """ Test that the retry time is based on the leases of the exceeded cap
+    """
+    from update.admission import AdmissionController
+
+    admission = AdmissionController(max_per_package=1, lease_time=100)
+    assert admission.acquire("a", 1, "local", now=0) is None
+    assert admission.acquire("b", 2, "local", now=50) is None
+    assert admission.acquire("c", 2, "local", now=60) == 90, "the lease of the requested package should be used"
+    assert admission.acquire("c", 1, "local", now=60) == 40
+    assert admission.acquire("a", 1, "local", now=70) is None, "polling again should renew the lease"
+    assert admission.acquire("c", 1, "local", now=80) == 90, "the renewed lease should be used"
+
+    per_driver = AdmissionController(max_per_driver=1, lease_time=100)
+    assert per_driver.acquire("a", 1, "local", now=0) is None
+    assert per_driver.acquire("b", 2, "s3", now=50) is None
+    assert per_driver.acquire("c", 3, "s3", now=60) == 90, "the lease of the requested driver should be used"
+
+    both = AdmissionController(max_per_package=1, max_global=2, lease_time=100)
+    assert both.acquire("a", 1, "local", now=0) is None
+    assert both.acquire("b", 2, "local", now=50) is None
+    assert both.acquire("c", 2, "local", now=60) == 90, "all exceeded caps should have capacity again"
+    assert both.acquire("c", 3, "local", now=60) == 40
+
+
+def test_latest_compatible_resolve():
+    """ Test resolving with a policy evaluated from the version index of the graph
+    """
+    import update.policy
+
+    packages = [
+        dummy_device("1.0.2") | {f"requires:{META_SOFT_VER}": "1.0.1"},
+        dummy_device("1.0.1") | {f"requires:{META_SOFT_VER}": "1.0.0"},
+        dummy_device("1.0.10") | {f"requires:{META_SOFT_VER}": "1.0.2"},
+        {META_DEVICE_TYPE: "other", META_SOFT_VER: "9.0.0"},
+    ]
+    policy = update.policy.create("latest_compatible,semver")
+    graph = PackageGraph(packages)
+    assert PackageResolver(dummy_device("1.0.0"), packages, policy, graph).resolve() == 1
+    assert PackageResolver(dummy_device("1.0.2"), packages, policy, graph).resolve() == 2
+    assert PackageResolver(dummy_device("1.0.10"), packages, policy, graph).resolve() is None